@@ -0,0 +1,465 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+bench.py - Psalter 性能基准
+以 content/ 语料重复构造大型合成工程，测量核心数据结构与流水线的开销。
+
+用法示例：
+    python bench.py memory --lines 200000
+    python bench.py load --lines 100000
+    python bench.py export --lines 200000
+    python bench.py render --repeat 20
+    python bench.py escape
+    python bench.py search --copies 60
+    python bench.py assemble
+    python bench.py dedup
+    python bench.py images --count 8
+    python bench.py watch --copies 60
+"""
+
+import argparse, os, re, time, tracemalloc, tempfile, shutil, datetime, operator, string
+import sys
+
+from psalter_core import (
+    ContentItem, MultiLineContentItem, FileContentLoader, get_application_path, flatten_items, iter_content_lines,
+    save_project_csv, load_project_csv, get_latex_content, write_latex_content,
+    TEX_MAPPING, RENDER_TABLE, render_unknown, escape_latex, compile_template, build_render_table,
+    BuildStats, BuildError, compile_project, HAS_PILLOW, IMAGE_CACHE_DIR, prepare_images,
+)
+from psalter_project import save_project_bin, load_project_bin, load_project
+from psalter_search import SearchIndex, fold_text
+from psalter_assemble import Assembler, iter_days
+from psalter_watch import ProjectWatcher
+
+def load_corpus(content_dir):
+    """读取 content/ 下全部文件，返回 [(文件名, [行])]，每行为 (type, latin, chinese, arg)"""
+    loader = FileContentLoader(content_dir)
+    corpus = []
+    for cat, fl in loader.get_available_files().items():
+        for _, fn in fl:
+            rows = [tuple(i.to_csv_row()) for i in loader.load_file_content(cat, fn)]
+            if rows: corpus.append((fn, rows))
+    return corpus
+
+def synthetic_rows(corpus, lines):
+    """循环语料直到凑满 lines 行，返回 [(文件名, [行])]"""
+    out, n = [], 0
+    while n < lines:
+        for fn, rows in corpus:
+            rows = rows[:lines - n]
+            out.append((fn, rows)); n += len(rows)
+            if n >= lines: break
+    return out
+
+def timed(fn):
+    """返回 (结果, 耗时秒)"""
+    t = time.perf_counter()
+    res = fn()
+    return res, time.perf_counter() - t
+
+def peak_memory(fn):
+    """返回 fn 执行期间的峰值内存字节 (tracemalloc 会拖慢执行，计时请另用 timed)"""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+# ==========================================
+# memory: ContentItem 内存占用
+# ==========================================
+class _DictContentItem:
+    """旧版 ContentItem 的布局 (每实例 __dict__，7 个属性)，仅作对照"""
+    def __init__(self, t, l="", c="", a="", src="", multi=False, cnt=1):
+        self.item_type, self.latin, self.chinese, self.arg = t, l, c, a
+        self.source_file, self.is_multiline, self.line_count = src, multi, cnt
+
+class _DictMultiLineContentItem(_DictContentItem):
+    def __init__(self, src, items):
+        self.items = items
+        f = items[0]
+        super().__init__(f.item_type, f.latin, f.chinese, f.arg, src, True, len(items))
+
+def bench_memory(args):
+    files = synthetic_rows(load_corpus(args.content_dir), args.lines)
+    # 模拟从文件解析：每行的类型字符串都是新对象，文本字符串两种实现共享，只比较对象本身的开销
+    def build(item_cls, multi_cls):
+        return [multi_cls(fn, [item_cls("".join(r[0]), r[1], r[2], r[3]) for r in rows]) for fn, rows in files]
+
+    old_peak = peak_memory(lambda: build(_DictContentItem, _DictMultiLineContentItem))
+    new_peak = peak_memory(lambda: build(ContentItem, MultiLineContentItem))
+    old_t = timed(lambda: build(_DictContentItem, _DictMultiLineContentItem))[1]
+    new_t = timed(lambda: build(ContentItem, MultiLineContentItem))[1]
+    print(f"{args.lines} 行 / {len(files)} 个文件")
+    print(f"  旧版 (__dict__):  {old_peak / 2**20:8.1f} MiB  构造 {old_t:6.3f}s")
+    print(f"  当前 (__slots__): {new_peak / 2**20:8.1f} MiB  构造 {new_t:6.3f}s")
+    print(f"  内存减少 {100 * (1 - new_peak / old_peak):.0f}%")
+
+# ==========================================
+# load: 打开工程 (CSV 与 .psproj)
+# ==========================================
+def bench_load(args):
+    files = synthetic_rows(load_corpus(args.content_dir), args.lines)
+    items = [MultiLineContentItem(fn, [ContentItem(*r) for r in rows]) for fn, rows in files]
+    d = tempfile.mkdtemp()
+    csv_fp, bin_fp = os.path.join(d, "p.csv"), os.path.join(d, "p.psproj")
+    try:
+        save_project_csv(csv_fp, items); save_project_bin(bin_fp, items)
+        csv_size, bin_size = os.path.getsize(csv_fp), os.path.getsize(bin_fp)
+        csv_t = min(timed(lambda: load_project_csv(csv_fp))[1] for _ in range(args.repeat))
+        # 打开 (只读索引) 并显示首屏 50 项
+        open_t = min(timed(lambda: load_project_bin(bin_fp)[:50])[1] for _ in range(args.repeat))
+        full_t = min(timed(lambda: list(load_project_bin(bin_fp)))[1] for _ in range(args.repeat))
+        loaded = load_project_csv(csv_fp)
+        assert [i.to_csv_row() for i in flatten_items(load_project_bin(bin_fp))] == [i.to_csv_row() for i in flatten_items(loaded)]
+    finally:
+        shutil.rmtree(d)
+    print(f"{args.lines} 行 / {len(loaded)} 个内容项 ({args.repeat} 次取最快)")
+    print(f"  CSV     {csv_size / 2**20:6.1f} MiB  load_project_csv {csv_t:.3f}s  ({args.lines / csv_t:,.0f} 行/秒)")
+    print(f"  .psproj {bin_size / 2**20:6.1f} MiB  打开并取首屏 {open_t * 1000:.1f}ms  全部解码 {full_t:.3f}s")
+
+# ==========================================
+# export: 写出 body.tex 的峰值内存
+# ==========================================
+def bench_export(args):
+    files = synthetic_rows(load_corpus(args.content_dir), args.lines)
+    items = [MultiLineContentItem(fn, [ContentItem(*r) for r in rows]) for fn, rows in files]
+    fd, fp = tempfile.mkstemp(suffix=".tex"); os.close(fd)
+    def joined():
+        with open(fp, 'w', encoding='utf-8') as f: f.write(get_latex_content(items))
+    def streamed():
+        with open(fp, 'w', encoding='utf-8') as f: write_latex_content(f, items)
+    try:
+        res = [(name, peak_memory(fn), min(timed(fn)[1] for _ in range(args.repeat)))
+               for name, fn in (("get_latex_content + write", joined), ("write_latex_content", streamed))]
+        size = os.path.getsize(fp)
+    finally:
+        os.unlink(fp)
+    print(f"{args.lines} 行 / body.tex {size / 2**20:.1f} MiB")
+    for name, peak, t in res:
+        print(f"  {name:26s} 峰值 {peak / 2**20:7.1f} MiB  {t:.3f}s")
+
+# ==========================================
+# render: 逐行渲染吞吐量
+# ==========================================
+def _format_render_item(item, is_single_col):
+    """旧版 render_item (每行查 TEX_MAPPING 并调用 str.format)，仅作对照"""
+    t, l, c, a = item.item_type, item.latin, item.chinese, item.arg
+    if t in TEX_MAPPING:
+        double_cmd, single_cmd = TEX_MAPPING[t]
+        return single_cmd.format(l=l, c=c, a=a) if is_single_col else double_cmd.format(l=l, c=c, a=a)
+    elif t == 'antiphonnum':
+        return rf"\psSingleAntiphonNum{{{a}}}{{{c}}}" if is_single_col else rf"\psAntiphonNum{{{a}}}{{{l}}}{{{c}}}"
+    elif t == 'image':
+        return rf"\psSingleImage{{{l}}}" if is_single_col else rf"\psImageFullWidth{{{l}}}"
+    return f"% 未知类型: {t} | {l} | {c}"
+
+def _table_render_item(item, is_single_col):
+    fn = RENDER_TABLE[is_single_col].get(item.item_type)
+    return fn(item) if fn else render_unknown(item)
+
+def bench_render(args):
+    """整个 content/ 语料 (双栏与单栏各渲染一遍) 重复 --repeat 次"""
+    rows = [r for _, rs in load_corpus(args.content_dir) for r in rs]
+    flat = [ContentItem(*r) for r in rows] * args.repeat
+    n = 2 * len(flat)
+    def run(render):
+        return lambda: [render(item, single) for single in (False, True) for item in flat]
+    # 渲染表会转义特殊字符，旧实现不会：以预先转义的字段对照
+    esc_flat = [ContentItem(i.item_type, escape_latex(i.latin), escape_latex(i.chinese), escape_latex(i.arg)) for i in flat]
+    assert [_format_render_item(i, s) for s in (False, True) for i in esc_flat] == run(_table_render_item)()
+    old_t = min(timed(run(_format_render_item))[1] for _ in range(3))
+    new_t = min(timed(run(_table_render_item))[1] for _ in range(3))
+    items = [MultiLineContentItem("", flat)]
+    full_t = min(timed(lambda: get_latex_content(items))[1] for _ in range(3))
+    print(f"content/ 语料 {len(rows)} 行 × {args.repeat} 次 × 双栏/单栏 = {n} 行 (3 次取最快)")
+    print(f"  str.format 逐行解析: {n / old_t:12,.0f} 行/秒")
+    print(f"  预编译渲染表:        {n / new_t:12,.0f} 行/秒  ({old_t / new_t:.1f}x)")
+    print(f"  get_latex_content:   {len(flat) / full_t:12,.0f} 行/秒 (含分栏状态机与拼接)")
+
+# ==========================================
+# escape: 转义正确性 (content/ 语料) 与渲染开销
+# ==========================================
+_UNESCAPED = re.compile(r"(?<!\\)[%&#_{}$]")
+
+def _plain_template(tpl):
+    """引入转义之前的 compile_template：% 格式串加 attrgetter"""
+    fmt, fields = [], []
+    for lit, name, _, _ in string.Formatter().parse(tpl):
+        fmt.append(lit.replace('%', '%%'))
+        if name is not None: fmt.append('%s'); fields.append({'l': 'latin', 'c': 'chinese', 'a': 'arg'}[name])
+    if not fields:
+        text = tpl.format()
+        return lambda item: text
+    fmt, get = "".join(fmt), operator.attrgetter(*fields)
+    if len(fields) == 1: return lambda item: fmt % (get(item),)
+    return lambda item: fmt % get(item)
+
+def check_escaping(corpus):
+    """逐字段检查 escape_latex：结果不含未转义的特殊字符，且去掉转义后还原为原文。返回问题列表"""
+    problems = []
+    for fn, rows in corpus:
+        for n, row in enumerate(rows, 1):
+            for field in row[1:]:
+                out = escape_latex(field)
+                if _UNESCAPED.search(out) or re.sub(r"\\([%&#_{}$])", r"\1", out) != field:
+                    problems.append(f"{fn}:{n}: {field!r} -> {out!r}")
+    samples = {"50% & #1": r"50\% \& \#1", "a_b {x} $5": r"a\_b \{x\} \$5", r"a\\b~c": r"a\\b~c",
+               r"50\% \& x_1": r"50\% \& x\_1", r"a\\%b": r"a\\\%b"}
+    for text, want in samples.items():
+        if escape_latex(text) != want: problems.append(f"样例: {text!r} -> {escape_latex(text)!r}，应为 {want!r}")
+    return problems
+
+def bench_escape(args):
+    corpus = load_corpus(args.content_dir)
+    problems = check_escaping(corpus)
+    special = sum(1 for _, rows in corpus for r in rows for f in r[1:] if escape_latex(f) != f)
+    print(f"content/ 语料 {sum(len(r) for _, r in corpus)} 行，{special} 个字段含特殊字符，"
+          + ("转义全部正确" if not problems else f"{len(problems)} 处错误:"))
+    for p in problems: print("  " + p)
+
+    flat = [ContentItem(*r) for _, rows in corpus for r in rows]
+    types = {**TEX_MAPPING}
+    def raw_table():
+        # 对照：引入转义之前的渲染表 (不转义、不缓存)
+        return tuple({t: _plain_template(tpl[single]) for t, tpl in types.items()} for single in (0, 1))
+    def run(make_table, items):
+        def f():
+            # 每次重建渲染表并清空转义缓存，测的是冷缓存开销
+            escape_latex.cache_clear(); table = make_table()
+            return [table[single][i.item_type](i) for single in (0, 1) for i in items if i.item_type in types]
+        return f
+    for label, items in (("语料一遍 (冷缓存)", flat), (f"语料 × {args.repeat}", flat * args.repeat)):
+        raw_t = min(timed(run(raw_table, items))[1] for _ in range(5))
+        esc_t = min(timed(run(build_render_table, items))[1] for _ in range(5))
+        print(f"  {label}: 不转义 {raw_t * 1000:.1f}ms  转义 {esc_t * 1000:.1f}ms  开销 {100 * (esc_t / raw_t - 1):+.1f}%")
+    return 1 if problems else 0
+
+# ==========================================
+# search: 全文索引 vs 逐文件扫描
+# ==========================================
+SEARCH_QUERIES = ["Dominum", "Dóminus", "in sæcula", "教令", "主 讚美", "gloria"]
+
+def grep_content(content_dir, query):
+    """不用索引：解析全部内容文件，逐行比较规范化后的拉丁文与中文"""
+    terms = [fold_text(t) for t in query.split()]
+    hits = 0
+    for cat in FileContentLoader.CATEGORIES:
+        d = os.path.join(content_dir, cat)
+        for fn in os.listdir(d):
+            for _, item in iter_content_lines(os.path.join(d, fn)):
+                text = fold_text(item.latin + "\n" + item.chinese)
+                if all(t in text for t in terms): hits += 1
+    return hits
+
+def bench_search(args):
+    d = tempfile.mkdtemp()
+    content_dir = os.path.join(d, "content")
+    try:
+        # 把语料复制 copies 份，模拟全年内容库
+        shutil.copytree(args.content_dir, content_dir)
+        for cat in FileContentLoader.CATEGORIES:
+            src = os.path.join(args.content_dir, cat)
+            for fn in os.listdir(src):
+                for k in range(1, args.copies):
+                    shutil.copyfile(os.path.join(src, fn), os.path.join(content_dir, cat, f"{k}_{fn}"))
+        n_files = sum(len(os.listdir(os.path.join(content_dir, c))) for c in FileContentLoader.CATEGORIES)
+        index = SearchIndex(content_dir, os.path.join(d, "index", "search.db"))
+        _, build_t = timed(index.update)
+        _, noop_t = timed(index.update)
+        fp = os.path.join(content_dir, "psalms", os.listdir(os.path.join(content_dir, "psalms"))[0])
+        with open(fp, 'a', encoding='utf-8') as f: f.write("\nverse|Novum|新|\n")
+        _, touch_t = timed(index.update)
+        print(f"{n_files} 个文件：建立索引 {build_t:.2f}s  无变化时同步 {noop_t * 1000:.1f}ms  改动一个文件后同步 {touch_t * 1000:.1f}ms")
+        for q in SEARCH_QUERIES:
+            hits, t = min((timed(lambda: index.search(q, limit=10**6)) for _ in range(args.repeat)), key=lambda r: r[1])
+            grep_hits, grep_t = timed(lambda: grep_content(content_dir, q))
+            print(f"  {q:12s} 索引 {len(hits):6d} 条 {t * 1000:7.1f}ms   逐文件扫描 {grep_hits:6d} 条 {grep_t * 1000:7.1f}ms")
+        index.close()
+    finally:
+        shutil.rmtree(d)
+
+# ==========================================
+# assemble: 按日历组装全年日课 (缓存 vs 不缓存)
+# ==========================================
+def bench_assemble(args):
+    days = list(iter_days(args.calendar, datetime.date(args.year, 1, 1), datetime.date(args.year, 12, 31)))
+    res = []
+    for memoize in (False, True):
+        def run():
+            a = Assembler(FileContentLoader(args.content_dir), args.templates, memoize=memoize)
+            return a, [a.assemble(v) for _, v in days]
+        (a, offices), t = min((timed(run) for _ in range(args.repeat)), key=lambda r: r[1])
+        n_items = sum(len(o) for o in offices)
+        n_rows = sum(i.line_count for o in offices for i in o)
+        # 内容项对象数：缓存时全年共享同一份
+        n_objects = len({id(i) for o in offices for i in o})
+        res.append(([i.to_csv_row() for o in offices for i in flatten_items(o)], t))
+        print(f"  {'缓存子组装' if memoize else '不缓存':10s} {t * 1000:7.1f}ms  {n_items} 个内容项 / {n_rows} 行，"
+              f"其中不同对象 {n_objects} 个" + (f"，缓存命中 {a.hits} / {a.hits + a.misses}" if memoize else ""))
+    assert res[0][0] == res[1][0]
+    print(f"{len(days)} 天，输出一致，加速 {res[0][1] / res[1][1]:.1f}×")
+
+# ==========================================
+# dedup: 重复内容宏对 body.tex 大小与编译时间的影响
+# ==========================================
+def bench_dedup(args):
+    if args.project:
+        items = list(load_project(args.project))
+    else:
+        # 默认以示例日历组装的全年日课为长篇样本
+        a = Assembler(FileContentLoader(args.content_dir), args.templates)
+        items = [i for _, v in iter_days(args.calendar, datetime.date(args.year, 1, 1), datetime.date(args.year, 12, 31))
+                 for i in a.assemble(v)]
+    fd, fp = tempfile.mkstemp(suffix=".tex"); os.close(fd)
+    res = {}
+    try:
+        for dedup in (False, True):
+            def write():
+                with open(fp, 'w', encoding='utf-8') as f: write_latex_content(f, items, dedup=dedup)
+            t = min(timed(write)[1] for _ in range(args.repeat))
+            res[dedup] = (os.path.getsize(fp), t)
+    finally:
+        os.unlink(fp)
+    print(f"{len(items)} 个内容项 / {sum(i.line_count for i in items)} 行")
+    for dedup, (size, t) in res.items():
+        print(f"  {'宏去重' if dedup else '原样':6s} body.tex {size / 2**20:6.2f} MiB  生成 {t:.3f}s")
+    print(f"  体积 {100 * (res[True][0] / res[False][0] - 1):+.1f}%")
+
+    if not shutil.which("xelatex"):
+        print("未找到 xelatex，跳过编译时间对比"); return
+    base = get_application_path()
+    d = tempfile.mkdtemp()
+    try:
+        for dedup in (False, True):
+            stats = BuildStats()
+            try:
+                compile_project(base, items, build_dir=os.path.join(d, str(dedup)), clean=True, use_format=False,
+                                stats=stats, dedup=dedup)
+            except BuildError as e:
+                print(f"  编译失败: {e}"); return 1
+            passes = " · ".join(f"{stats.stages[k]:.1f}s" for k in stats.stages if k.startswith("pass"))
+            print(f"  {'宏去重' if dedup else '原样':6s} XeLaTeX {stats.passes} 遍 ({passes})，{stats.pages} 页")
+    finally:
+        shutil.rmtree(d)
+
+# ==========================================
+# images: 图片预处理 (串行 vs 并行、冷缓存 vs 热缓存)
+# ==========================================
+def bench_images(args):
+    if not HAS_PILLOW:
+        print("需要 Pillow (pip install pillow)"); return 1
+    from PIL import Image
+    d = tempfile.mkdtemp()
+    try:
+        # 模拟 600 dpi 的 A5 扫描件
+        os.makedirs(os.path.join(d, "images"))
+        items = []
+        for k in range(args.count):
+            fn = f"images/scan_{k}.jpg"
+            im = Image.effect_noise((args.width, args.width * 7 // 5), 40 + k).convert("RGB")
+            im.save(os.path.join(d, fn), quality=92, dpi=(600, 600))
+            items.append(ContentItem("image", fn))
+        src_bytes = sum(os.path.getsize(os.path.join(d, i.latin)) for i in items)
+        cache = os.path.join(d, IMAGE_CACHE_DIR)
+        for jobs in sorted({1, args.jobs}):
+            shutil.rmtree(cache, ignore_errors=True)
+            mapping, t = timed(lambda: prepare_images(d, items, args.dpi, jobs=jobs))
+            print(f"  冷缓存 {jobs} 线程  {t:.2f}s")
+        _, warm = timed(lambda: prepare_images(d, items, args.dpi))
+        out_bytes = sum(os.path.getsize(os.path.join(d, p)) for p in mapping.values())
+    finally:
+        shutil.rmtree(d)
+    print(f"  热缓存        {warm * 1000:.1f}ms")
+    print(f"{args.count} 张 {args.width}×{args.width * 7 // 5} 图片：原图 {src_bytes / 2**20:.1f} MiB -> "
+          f"{args.dpi} dpi 副本 {out_bytes / 2**20:.1f} MiB")
+
+# ==========================================
+# watch: 监视模式的扫描与增量重新读取 (对比整体重新组装)
+# ==========================================
+def bench_watch(args):
+    d = tempfile.mkdtemp()
+    content_dir = os.path.join(d, "content")
+    try:
+        # 把语料复制 copies 份模拟全年内容库，工程为示例日历组装的全年日课
+        shutil.copytree(args.content_dir, content_dir)
+        for cat in FileContentLoader.CATEGORIES:
+            src = os.path.join(args.content_dir, cat)
+            for fn in os.listdir(src):
+                for k in range(1, args.copies):
+                    shutil.copyfile(os.path.join(src, fn), os.path.join(content_dir, cat, f"{k}_{fn}"))
+        days = list(iter_days(args.calendar, datetime.date(args.year, 1, 1), datetime.date(args.year, 12, 31)))
+        def assemble():
+            a = Assembler(FileContentLoader(content_dir), args.templates)
+            return [i for _, v in days for i in a.assemble(v)]
+        items = assemble()
+        watcher = ProjectWatcher(d)
+        _, track_t = timed(lambda: watcher.track(items))
+        scan_t = min(timed(watcher.poll)[1] for _ in range(args.repeat))
+        fp = os.path.join(content_dir, "psalms", "Ps_109.txt")
+        with open(fp, 'a', encoding='utf-8') as f: f.write("\nverse|Novum|新|\n")
+        watcher.poll(now=0)
+        batch = watcher.poll(now=watcher.debounce)
+        (new, _, reloaded), apply_t = timed(lambda: watcher.apply(items, batch))
+        ref, full_t = timed(assemble)
+        assert [r.to_csv_row() for r in flatten_items(new)] == [r.to_csv_row() for r in flatten_items(ref)]
+    finally:
+        shutil.rmtree(d)
+    print(f"{len(watcher.state)} 个文件、{len(items)} 个内容项：记录来源 {track_t * 1000:.1f}ms  每次轮询 {scan_t * 1000:.1f}ms")
+    print(f"  改动一个圣咏文件后增量替换 {reloaded} 项 {apply_t * 1000:.1f}ms   整体重新组装 {full_t * 1000:.1f}ms (结果一致)")
+
+def main(argv=None):
+    p = argparse.ArgumentParser(prog="bench", description="Psalter 性能基准")
+    p.add_argument("--content-dir", default=os.path.join(get_application_path(), "content"))
+    sub = p.add_subparsers(dest="cmd", required=True)
+    m = sub.add_parser("memory", help="ContentItem 内存占用对比")
+    m.add_argument("--lines", type=int, default=200000)
+    m.set_defaults(func=bench_memory)
+    m = sub.add_parser("load", help="打开大型工程的耗时 (CSV 与 .psproj)")
+    m.add_argument("--lines", type=int, default=100000)
+    m.add_argument("--repeat", type=int, default=3)
+    m.set_defaults(func=bench_load)
+    m = sub.add_parser("export", help="写出 body.tex 的峰值内存 (整串 vs 流式)")
+    m.add_argument("--lines", type=int, default=200000)
+    m.add_argument("--repeat", type=int, default=3)
+    m.set_defaults(func=bench_export)
+    m = sub.add_parser("render", help="content/ 语料的逐行渲染吞吐量")
+    m.add_argument("--repeat", type=int, default=20)
+    m.set_defaults(func=bench_render)
+    m = sub.add_parser("escape", help="检查 content/ 语料的 LaTeX 转义并测量渲染开销")
+    m.add_argument("--repeat", type=int, default=20)
+    m.set_defaults(func=bench_escape)
+    m = sub.add_parser("search", help="全文索引的建立、增量同步与检索耗时 (对比逐文件扫描)")
+    m.add_argument("--copies", type=int, default=60, help="语料复制份数")
+    m.add_argument("--repeat", type=int, default=5)
+    m.set_defaults(func=bench_search)
+    m = sub.add_parser("assemble", help="按日历组装全年日课的耗时 (缓存子组装 vs 不缓存)")
+    m.add_argument("--calendar", default=os.path.join(get_application_path(), "examples", "calendar.csv"))
+    m.add_argument("--templates", default=os.path.join(get_application_path(), "examples", "templates"))
+    m.add_argument("--year", type=int, default=2026)
+    m.add_argument("--repeat", type=int, default=3)
+    m.set_defaults(func=bench_assemble)
+    m = sub.add_parser("dedup", help="重复内容宏对 body.tex 大小与编译时间的影响")
+    m.add_argument("--project", help="工程文件；默认以示例日历组装全年日课")
+    m.add_argument("--calendar", default=os.path.join(get_application_path(), "examples", "calendar.csv"))
+    m.add_argument("--templates", default=os.path.join(get_application_path(), "examples", "templates"))
+    m.add_argument("--year", type=int, default=2026)
+    m.add_argument("--repeat", type=int, default=3)
+    m.set_defaults(func=bench_dedup)
+    m = sub.add_parser("images", help="图片预处理耗时 (串行 vs 并行、冷缓存 vs 热缓存) 与体积")
+    m.add_argument("--count", type=int, default=8)
+    m.add_argument("--width", type=int, default=3500, help="合成图片的宽 (像素)")
+    m.add_argument("--dpi", type=int, default=300)
+    m.add_argument("--jobs", type=int, default=os.cpu_count() or 1)
+    m.set_defaults(func=bench_images)
+    m = sub.add_parser("watch", help="监视模式的轮询与增量重新读取耗时 (对比整体重新组装)")
+    m.add_argument("--copies", type=int, default=60, help="语料复制份数")
+    m.add_argument("--calendar", default=os.path.join(get_application_path(), "examples", "calendar.csv"))
+    m.add_argument("--templates", default=os.path.join(get_application_path(), "examples", "templates"))
+    m.add_argument("--year", type=int, default=2026)
+    m.add_argument("--repeat", type=int, default=5)
+    m.set_defaults(func=bench_watch)
+    args = p.parse_args(argv)
+    return args.func(args) or 0
+
+if __name__ == '__main__': sys.exit(main())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_assemble.py - 按模板与日历自动组装日课工程
+1. 模板 (templates/<名称>.txt) 与内容文件格式相同，每行 type|latin|chinese|arg 为一个内容项，
+   字段中的 {变量} 取自日历；以 @ 开头的行为指令：
+       @file|分类|文件名           插入内容文件 (如 @file|hymns|{hymn})
+       @psalms|圣咏列表|对经列表   逐首插入圣咏，前后以对经包围 (编号对经 + 重复对经)
+       @include|模板名             插入另一模板 (如通用文本 commune_martyrum)
+   列表以 ; 分隔；变量为空时对应指令跳过。文件名默认在指令的分类下查找，也可写作 分类/文件名。
+2. 日历 (CSV) 的 date 列为 YYYY-MM-DD、星期 (mon..sun) 或 * (默认值)，其余列为变量，
+   offices 列列出当天要组装的模板。取值优先级：具体日期 > 星期 > 默认值，空单元格不覆盖。
+3. 圣咏 + 对经、插入的文件与模板按参数缓存，全年的日课共享同一份内容项。
+
+用法示例：
+    python -m psalter_assemble calendar.csv -o projects/ --from 2026-01-01 --to 2026-12-31
+    python -m psalter_assemble examples/calendar.csv --templates examples/templates -o office.psproj
+    python -m psalter_build projects/ -j 8 -o Output
+"""
+
+import argparse, os, re, csv, datetime, collections, time
+import sys
+
+from psalter_core import ContentItem, MultiLineContentItem, FileContentLoader, get_application_path
+from psalter_project import PROJECT_EXT, is_project_file, save_project
+
+TEMPLATE_DIR_NAME = "templates"
+LIST_SEP = ";"
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+DEFAULTS_KEY = "*"
+# 指令 -> 最少参数个数
+DIRECTIVES = {"@file": 2, "@psalms": 1, "@include": 1}
+_VAR = re.compile(r"\{(\w+)\}")
+_LOADING = object()
+
+class AssemblyError(Exception):
+    """模板或日历有误"""
+
+Step = collections.namedtuple("Step", "kind args where")
+
+def split_list(value):
+    return [v.strip() for v in value.split(LIST_SEP) if v.strip()]
+
+def split_ref(ref, default_cat):
+    """"分类/文件名" 或 "文件名" -> (分类, 文件名.txt)"""
+    cat, _, fn = ref.rpartition("/")
+    return cat or default_cat, fn if fn.endswith(".txt") else fn + ".txt"
+
+def parse_template(fp):
+    """解析模板文件为 Step 列表，Step.where 为 "文件:行" 以便报错"""
+    steps = []
+    with open(fp, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            parts, where = line.split('|'), f"{fp}:{n}"
+            kind = parts[0]
+            if kind.startswith('@'):
+                if kind not in DIRECTIVES: raise AssemblyError(f"{where}: 未知指令 {kind}")
+                if len(parts) - 1 < DIRECTIVES[kind]: raise AssemblyError(f"{where}: {kind} 至少需要 {DIRECTIVES[kind]} 个参数")
+                steps.append(Step(kind, tuple(parts[1:]), where))
+            elif len(parts) >= 3:
+                steps.append(Step("item", (kind, parts[1], parts[2], parts[3] if len(parts) > 3 else ""), where))
+            else:
+                raise AssemblyError(f"{where}: 只有 {len(parts)} 个字段 (至少需要 type|latin|chinese)")
+    return steps
+
+# ==========================================
+# 组装
+# ==========================================
+class Assembler:
+    """按模板组装内容项。插入的文件、圣咏 + 对经与 @include 的子模板按所用变量的取值缓存，
+    缓存结果在各日课间共享 (与 FileContentLoader 相同，不应原地修改)"""
+    def __init__(self, loader, template_dir, memoize=True):
+        self.loader, self.template_dir, self.memoize = loader, template_dir, memoize
+        self._templates = {}  # 名称 -> (steps, 用到的变量；含动态 @include 时为 None)
+        self._memo = {}
+        self.hits = self.misses = 0
+
+    def template(self, name):
+        t = self._templates.get(name)
+        if t is _LOADING: raise AssemblyError(f"模板循环包含: {name}")
+        if t is not None: return t
+        fp = os.path.join(self.template_dir, name if name.endswith(".txt") else name + ".txt")
+        if not os.path.isfile(fp): raise AssemblyError(f"找不到模板: {fp}")
+        self._templates[name] = _LOADING
+        try:
+            steps = parse_template(fp)
+            used, dynamic = set(), False
+            for s in steps:
+                for a in s.args: used.update(_VAR.findall(a))
+                if s.kind == "@include":
+                    # 包含的模板由变量决定时，只能按全部变量缓存
+                    sub = None if _VAR.search(s.args[0]) else self.template(s.args[0])[1]
+                    if sub is None: dynamic = True
+                    else: used.update(sub)
+            t = self._templates[name] = (steps, None if dynamic else tuple(sorted(used)))
+        except BaseException:
+            del self._templates[name]; raise
+        return t
+
+    def _cached(self, key, build):
+        if not self.memoize: return build()
+        v = self._memo.get(key)
+        if v is None:
+            v = self._memo[key] = build(); self.misses += 1
+        else: self.hits += 1
+        return v
+
+    @staticmethod
+    def _subst(text, variables, where):
+        def var(m):
+            v = variables.get(m.group(1))
+            if v is None: raise AssemblyError(f"{where}: 未定义的变量 {m.group()}")
+            return v
+        return _VAR.sub(var, text)
+
+    def file(self, cat, fn, where=""):
+        """内容文件 -> MultiLineContentItem"""
+        if cat not in FileContentLoader.CATEGORIES: raise AssemblyError(f"{where}: 未知分类 {cat}")
+        def build():
+            mi = self.loader.load_file_as_multiline(cat, fn)
+            if mi is None: raise AssemblyError(f"{where}: 找不到内容文件或文件为空: {cat}/{fn}")
+            return mi
+        return self._cached(("file", cat, fn), build)
+
+    def psalm(self, psalm, antiphon, number, before=True, after=True, where=""):
+        """圣咏及其 Gloria (取自圣咏文件)，前 (编号对经) 后 (重复对经) 以对经包围，合为一个 MultiLineContentItem"""
+        def build():
+            ps = self.file(*split_ref(psalm, "psalms"), where)
+            if not antiphon or not (before or after): return ps
+            a = self.file(*split_ref(antiphon, "antiphons"), where).items[0]
+            rows = ([ContentItem("antiphonnum", a.latin, a.chinese, str(number))] if before else []) + ps.items \
+                 + ([ContentItem("antiphon", a.latin, a.chinese)] if after else [])
+            return MultiLineContentItem(ps.source_file, rows)
+        return self._cached(("psalm", psalm, antiphon, number, before, after), build)
+
+    def include(self, name, variables):
+        """组装模板 name，结果按模板用到的变量取值缓存"""
+        used = self.template(name)[1]
+        values = tuple(variables.get(k) for k in used) if used is not None else tuple(sorted(variables.items()))
+        return self._cached(("include", name, values), lambda: tuple(self.expand(name, variables)))
+
+    def expand(self, name, variables):
+        out = []
+        for s in self.template(name)[0]:
+            args = [self._subst(a, variables, s.where) for a in s.args]
+            if s.kind == "item":
+                out.append(self._cached(("item",) + tuple(args), lambda: ContentItem(*args)))
+            elif s.kind == "@file":
+                if args[1]: out.append(self.file(*split_ref(args[1], args[0]), s.where))
+            elif s.kind == "@psalms":
+                psalms, antiphons = split_list(args[0]), split_list(args[1]) if len(args) > 1 else []
+                if len(antiphons) == 1 and len(psalms) > 1:
+                    # 只有一条对经 (sub unica antiphona)：在第一首之前与最后一首之后各念一次
+                    for k, ps in enumerate(psalms):
+                        out.append(self.psalm(ps, antiphons[0], 1, k == 0, k == len(psalms) - 1, s.where))
+                else:
+                    for k, ps in enumerate(psalms):
+                        out.append(self.psalm(ps, antiphons[k] if k < len(antiphons) else "", k + 1, where=s.where))
+            elif s.kind == "@include":
+                if args[0]: out.extend(self.include(args[0], variables))
+        return out
+
+    def assemble(self, variables):
+        """按 offices 变量列出的模板依次组装一天的日课"""
+        offices = split_list(variables.get("offices", ""))
+        if not offices: raise AssemblyError(f"{variables.get('date', '')}: 未指定 offices")
+        return [item for office in offices for item in self.include(office, variables)]
+
+# ==========================================
+# 日历
+# ==========================================
+def load_calendar(fp):
+    with open(fp, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.DictReader(f)
+        if not reader.fieldnames or "date" not in reader.fieldnames: raise AssemblyError(f"{fp}: 日历缺少 date 列")
+        return reader.fieldnames, [(n, {k: (v or "").strip() for k, v in row.items() if k}) for n, row in enumerate(reader, 2)]
+
+def iter_days(fp, start=None, end=None):
+    """产出 (日期, 变量)。给出 start/end 时逐日展开该区间，否则只列出日历中的具体日期"""
+    columns, rows = load_calendar(fp)
+    defaults, weekly, proper = {}, {}, {}
+    for n, row in rows:
+        d = row["date"].lower()
+        if d == DEFAULTS_KEY: defaults = row
+        elif d in WEEKDAYS: weekly[d] = row
+        else:
+            try: proper[datetime.date.fromisoformat(d)] = row
+            except ValueError: raise AssemblyError(f"{fp}:{n}: 无法识别的日期 '{row['date']}' (应为 YYYY-MM-DD、mon..sun 或 *)") from None
+    if start is None: days = sorted(proper)
+    else: days = (start + datetime.timedelta(k) for k in range((end - start).days + 1))
+    for day in days:
+        variables = dict.fromkeys(columns, "")
+        for layer in (defaults, weekly.get(WEEKDAYS[day.weekday()], {}), proper.get(day, {})):
+            variables.update((k, v) for k, v in layer.items() if v)
+        variables["date"], variables["weekday"] = day.isoformat(), WEEKDAYS[day.weekday()]
+        yield day, variables
+
+# ==========================================
+# 命令行
+# ==========================================
+def parse_args(argv=None):
+    base = get_application_path()
+    p = argparse.ArgumentParser(prog="psalter_assemble", description="按模板与日历组装日课工程")
+    p.add_argument("calendar", help="日历 CSV")
+    p.add_argument("-o", "--output", required=True,
+                   help="输出目录 (每天一个工程，可直接交给 psalter_build 批量构建)，或 .csv / .psproj (全部合为一个工程)")
+    p.add_argument("--templates", default=os.path.join(base, TEMPLATE_DIR_NAME), help="模板目录 (默认为程序目录下的 templates/)")
+    p.add_argument("--content-dir", default=os.path.join(base, "content"), help="内容目录 (默认为程序目录下的 content/)")
+    p.add_argument("--from", dest="start", type=datetime.date.fromisoformat, help="逐日展开的起始日期 (YYYY-MM-DD)")
+    p.add_argument("--to", dest="end", type=datetime.date.fromisoformat, help="逐日展开的结束日期 (含)")
+    p.add_argument("--format", choices=("psproj", "csv"), default="psproj", help="输出目录中工程文件的格式")
+    args = p.parse_args(argv)
+    if (args.start is None) != (args.end is None): p.error("--from 与 --to 需同时给出")
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+    t0 = time.perf_counter()
+    assembler = Assembler(FileContentLoader(args.content_dir), args.templates)
+    single = is_project_file(args.output)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)) if single else args.output, exist_ok=True)
+    ext = PROJECT_EXT if args.format == "psproj" else ".csv"
+    days, total, items = 0, 0, []
+    try:
+        for day, variables in iter_days(args.calendar, args.start, args.end):
+            office = assembler.assemble(variables)
+            if single: items += office
+            else: save_project(os.path.join(args.output, day.isoformat() + ext), office)
+            days += 1; total += len(office)
+        if single: save_project(args.output, items)
+    except (AssemblyError, OSError) as e:
+        print(f"组装失败: {e}", file=sys.stderr); return 1
+    print(f"组装 {days} 天，{total} 个内容项 ({time.perf_counter() - t0:.2f}s，"
+          f"缓存命中 {assembler.hits} / {assembler.hits + assembler.misses})", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__': sys.exit(main())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_build.py - Psalter 命令行批量构建 (无需图形界面)
+读取 tex_generator.py "保存工程" 导出的工程文件 (CSV 或二进制 .psproj)，生成 body.tex 并调用 XeLaTeX 编译。
+若传入目录，则并行构建其中所有 *.csv / *.psproj 工程，每个工程使用独立的编译目录。
+
+用法示例：
+    python -m psalter_build project.csv -o output/office.pdf
+    python psalter_build.py project.csv --tex-only -o body.tex
+    python -m psalter_build projects/ -j 8 -o Output --report report.json
+    python -m psalter_build project.csv --watch -o output/office.pdf
+
+退出码：0 成功，1 构建失败（批量模式下任一工程失败），2 参数错误。
+"""
+
+import argparse, os, shutil, json, time, csv, hashlib, threading
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from psalter_core import (
+    DEFAULT_TITLE_DATA, DEFAULT_IMAGE_DPI, IMAGE_CACHE_DIR, ERROR, BuildError, BuildStats, get_application_path, write_latex_content,
+    compile_project, CancelToken, CompileCancelled,
+)
+from psalter_project import ProjectFormatError, is_project_file, load_project
+from psalter_check import check_items, count_errors, format_issues
+from psalter_watch import POLL_INTERVAL, DEBOUNCE_SECONDS, ProjectWatcher
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog="psalter_build", description="从工程 CSV 构建 Psalter PDF（无图形界面）")
+    p.add_argument("project", help="工程文件 (CSV 或 .psproj)，或包含多个工程文件的目录")
+    p.add_argument("-o", "--output", help="输出文件路径（PDF，或 --tex-only 时的 body.tex）；批量模式下为输出目录")
+    p.add_argument("--base-dir", default=get_application_path(),
+                   help="包含 main.tex、psalter.sty 与 images/ 的目录（默认为程序目录）")
+    p.add_argument("--build-dir", help="编译目录（默认为 <base-dir>/build）；批量模式下每个工程使用其子目录 "
+                   "<build-dir>/<工程名>（默认为 <base-dir>/build_batch）")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="批量模式的并行进程数（默认为 CPU 核数）")
+    p.add_argument("--report", help="批量模式下将构建摘要写入 JSON 文件")
+    p.add_argument("--stats", help="将各阶段耗时、写入字节、xelatex 遍数与页数写入报告（.csv 或 .json），便于跨版本比较")
+    p.add_argument("--tex-only", action="store_true", help="只生成 body.tex，不调用 XeLaTeX")
+    p.add_argument("--clean", action="store_true", help="编译前清空编译目录（默认增量复用上次的文件）")
+    p.add_argument("--no-format", action="store_true", help="不使用预编译的导言区格式文件")
+    p.add_argument("--no-check", action="store_true", help="跳过编译前的内容检查")
+    p.add_argument("--chunked", action="store_true", help="按分页/目录切分正文并以 \\include 编译，未变化的块不重写")
+    p.add_argument("--image-dpi", type=int, metavar="DPI",
+                   help=f"图片先按 A5 版心与此分辨率缩小 (如 {DEFAULT_IMAGE_DPI})，缓存于 <base-dir>/{IMAGE_CACHE_DIR}/，原图不变；需要 Pillow")
+    p.add_argument("--dedup", action="store_true", help="把重复的整段内容 (光荣颂、对经等) 写为宏，缩小 body.tex（与 --chunked 不同时生效）")
+    p.add_argument("--watch", action="store_true", help="监视内容、图片、样式与工程文件，变化后自动重新构建 (Ctrl+C 退出)；只支持单个工程")
+    p.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS, metavar="SEC",
+                   help=f"--watch 时最后一次保存后静默多少秒才开始构建（默认 {DEBOUNCE_SECONDS}）")
+    p.add_argument("--title-zh", default=DEFAULT_TITLE_DATA["title_zh"], help="中文主标题")
+    p.add_argument("--title-lat", default=DEFAULT_TITLE_DATA["title_lat"], help="拉丁文标题")
+    p.add_argument("--edition", default=DEFAULT_TITLE_DATA["edition"], help="版本/编者")
+    p.add_argument("--footer", default=DEFAULT_TITLE_DATA["footer"], help="底部文字")
+    return p.parse_args(argv)
+
+def build(args, stats=None, items=None, cancel=None):
+    """执行一次构建，返回输出文件路径；失败时抛出 BuildError，写出 --tex-only 文件或复制 PDF 失败时抛出 OSError。stats (BuildStats) 记录各阶段耗时。
+    给出 items 时不再读取工程文件 (监视模式)；cancel (CancelToken) 可中断 XeLaTeX"""
+    stats = stats if stats is not None else BuildStats()
+    if items is None:
+        try:
+            with stats.stage("load"):
+                items = load_project(args.project)
+                # .psproj 延迟解码，计时应包含完整读取
+                items = list(items)
+        except (OSError, UnicodeDecodeError, ProjectFormatError) as e:
+            raise BuildError(f"无法读取工程文件: {e}")
+
+    title_data = {"title_zh": args.title_zh, "title_lat": args.title_lat,
+                  "edition": args.edition, "footer": args.footer}
+    if not args.no_check:
+        with stats.stage("check"):
+            issues = check_items(items, args.base_dir, title_data, name=args.project)
+        if count_errors(issues): raise BuildError(f"编译前检查发现 {count_errors(issues)} 个错误", format_issues(issues))
+
+    if args.tex_only:
+        out = args.output or os.path.splitext(args.project)[0] + ".tex"
+        with stats.stage("render"), open(out, 'w', encoding='utf-8') as f:
+            f.write("% Generated by Psalter Editor\n")
+            write_latex_content(f, items, dedup=args.dedup)
+        stats.bytes_written = stats.body_bytes = os.path.getsize(out)
+        return out
+
+    pdf_path = compile_project(args.base_dir, items, title_data, args.build_dir, args.clean, not args.no_format,
+                               chunked=args.chunked, stats=stats, dedup=args.dedup, image_dpi=args.image_dpi,
+                               cancel=cancel)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        shutil.copy2(pdf_path, args.output)
+        return args.output
+    return pdf_path
+
+# ==========================================
+# 构建统计报告
+# ==========================================
+STATS_FIELDS = ["project", "ok", "time", "psalter_sty", "total", "passes", "pages",
+                "bytes_written", "body_bytes", "files_synced", "bytes_copied", "images_converted", "images_failed", "pdf_bytes", "converged"]
+
+def sty_digest(base_dir):
+    """psalter.sty 的摘要，用于区分不同版本样式下的统计"""
+    try:
+        with open(os.path.join(base_dir, "psalter.sty"), 'rb') as f: return hashlib.sha1(f.read()).hexdigest()[:12]
+    except OSError: return ""
+
+def stats_record(project, ok, stats, base_dir, started):
+    return {"project": project, "ok": ok, "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+            "psalter_sty": sty_digest(base_dir), **stats}
+
+def write_stats(fp, records):
+    """写出统计报告：.csv 每次构建一行 (各阶段为 stage_<名称> 列)，其他扩展名写 JSON"""
+    os.makedirs(os.path.dirname(os.path.abspath(fp)), exist_ok=True)
+    if not fp.lower().endswith('.csv'):
+        with open(fp, 'w', encoding='utf-8') as f: json.dump({"builds": records}, f, ensure_ascii=False, indent=2)
+        return
+    stages = list(dict.fromkeys(k for r in records for k in r["stages"]))
+    with open(fp, 'w', encoding='utf-8', newline='') as f:
+        w = csv.writer(f)
+        w.writerow(STATS_FIELDS + [f"stage_{k}" for k in stages])
+        for r in records:
+            w.writerow([r[k] for k in STATS_FIELDS] + [r["stages"].get(k, "") for k in stages])
+
+# ==========================================
+# 批量模式
+# ==========================================
+def make_jobs(args):
+    """为目录中的每个工程文件 (*.csv / *.psproj) 生成独立的构建参数"""
+    # 不与界面共用 build/：build/ 在编译间增量同步并保留 aux 与 PDF (--clean 时才清空)，
+    # 各工程各用一个子目录，互不覆盖对方的文件与辅助文件
+    build_root = args.build_dir or os.path.join(args.base_dir, "build_batch")
+    ext = ".tex" if args.tex_only else ".pdf"
+    jobs = []
+    for fn in sorted(os.listdir(args.project)):
+        if not is_project_file(fn): continue
+        name = os.path.splitext(fn)[0]
+        job = argparse.Namespace(**vars(args))
+        job.project = os.path.join(args.project, fn)
+        job.build_dir = os.path.join(build_root, name)
+        job.output = os.path.join(args.output, name + ext) if args.output else (
+            os.path.join(job.build_dir, name + ext) if args.tex_only else None)
+        jobs.append(job)
+    return jobs
+
+def run_job(job):
+    """在工作进程中构建单个工程，返回结果摘要 (不抛出异常)"""
+    start, stats = time.perf_counter(), BuildStats()
+    res = {"project": job.project, "build_dir": job.build_dir, "ok": False, "output": None, "error": None, "log": None,
+           "issues": []}
+    try:
+        if job.tex_only: os.makedirs(os.path.dirname(os.path.abspath(job.output)), exist_ok=True)
+        res["output"] = build(job, stats)
+        res["ok"] = True
+    except BuildError as e:
+        res["error"] = str(e)
+        res["issues"] = [dict(i._asdict(), text=str(i)) for i in e.issues]
+        if e.log:
+            res["log"] = os.path.join(job.build_dir, "error.log")
+            with open(res["log"], 'w', encoding='utf-8') as f: f.write(e.log)
+    except Exception as e:
+        res["error"] = f"{type(e).__name__}: {e}"
+    res["seconds"] = round(time.perf_counter() - start, 3)
+    res["stats"] = stats.to_dict()
+    return res
+
+def build_batch(args):
+    """并行构建目录中的所有工程，返回按工程名排序的结果列表"""
+    jobs = make_jobs(args)
+    results = []
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(run_job, job) for job in jobs]
+        for fut in as_completed(futures):
+            res = fut.result()
+            status = "OK  " if res["ok"] else "FAIL"
+            warn = "，未收敛" if not res["stats"]["converged"] else ""
+            print(f"[{status}] {os.path.basename(res['project'])} ({res['seconds']:.1f}s{warn})", flush=True)
+            results.append(res)
+    results.sort(key=lambda r: r["project"])
+    return results
+
+# 批量摘要中每个失败工程最多列出的错误数
+SUMMARY_ISSUES = 3
+
+def print_summary(results, wall):
+    failed = [r for r in results if not r["ok"]]
+    print(f"\n共 {len(results)} 个工程：成功 {len(results) - len(failed)}，失败 {len(failed)}，总耗时 {wall:.1f}s")
+    for r in failed:
+        print(f"  {os.path.basename(r['project'])}: {r['error']}" + (f" (日志: {r['log']})" if r["log"] else ""))
+        errors = [i for i in r["issues"] if i["level"] == ERROR]
+        for i in errors[:SUMMARY_ISSUES]: print(f"      {i['text']}")
+        if len(errors) > SUMMARY_ISSUES: print(f"      ……共 {len(errors)} 个错误")
+
+def main_batch(args):
+    started, start = time.time(), time.perf_counter()
+    results = build_batch(args)
+    wall = time.perf_counter() - start
+    print_summary(results, wall)
+    if args.stats:
+        write_stats(args.stats, [stats_record(r["project"], r["ok"], r["stats"], args.base_dir, started) for r in results])
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({"jobs": args.jobs, "seconds": round(wall, 3), "results": results}, f, ensure_ascii=False, indent=2)
+    return 0 if all(r["ok"] for r in results) else 1
+
+# ==========================================
+# 监视模式
+# ==========================================
+def stamp(): return time.strftime("[%H:%M:%S]")
+
+def print_error(e):
+    """输出 BuildError 或写出结果时的 OSError (输出目录不可写等)"""
+    print(f"构建失败: {e}", file=sys.stderr)
+    if not isinstance(e, BuildError): return
+    # 能解析出具体问题时只列出问题，完整日志见编译目录中的 main.log
+    if e.issues:
+        for i in e.issues: print(i, file=sys.stderr)
+    elif e.log: print(e.log, file=sys.stderr)
+
+def watch_build(args, items, cancel):
+    """监视模式下在后台线程中构建一次；被更新的变化取消时不输出"""
+    stats = BuildStats()
+    try:
+        out = build(args, stats, items, cancel)
+        print(f"{stamp()} {out}  耗时 {stats.summary()}", flush=True)
+        for w in stats.warnings: print(f"警告: {w}", file=sys.stderr)
+    except CompileCancelled: pass
+    except (BuildError, OSError) as e:
+        print(stamp(), end=" ", file=sys.stderr); print_error(e)
+
+def start_watch_build(args, items):
+    cancel = CancelToken()
+    t = threading.Thread(target=watch_build, args=(args, items, cancel), daemon=True)
+    t.start()
+    return t, cancel
+
+def watch_project(args):
+    """先构建一次，之后每批变化只重新读取受影响的内容项并重新构建；正在进行的构建被新的变化取消"""
+    try: items = list(load_project(args.project))
+    except (OSError, UnicodeDecodeError, ProjectFormatError) as e:
+        print(f"无法读取工程文件: {e}", file=sys.stderr); return 1
+    watcher = ProjectWatcher(args.base_dir, args.project, debounce=args.debounce)
+    watcher.track(items)
+    job = start_watch_build(args, items)
+    print(f"正在监视 {args.base_dir} 与 {args.project}，Ctrl+C 退出", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(POLL_INTERVAL)
+            batch = watcher.poll()
+            if not batch: continue
+            try: items, rebuild, reloaded = watcher.apply(items, batch)
+            except BuildError as e:
+                print(stamp(), e, file=sys.stderr); continue
+            if not rebuild: continue
+            print(f"{stamp()} {len(batch)} 个文件变化，重新读取 {reloaded} 项，重新构建", file=sys.stderr, flush=True)
+            if job[0].is_alive(): job[1].cancel(); job[0].join()
+            job = start_watch_build(args, items)
+    except KeyboardInterrupt:
+        job[1].cancel(); job[0].join()
+    return 0
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.watch:
+        if os.path.isdir(args.project): print("--watch 只支持单个工程文件", file=sys.stderr); return 2
+        return watch_project(args)
+    if os.path.isdir(args.project): return main_batch(args)
+    started, stats, ok = time.time(), BuildStats(), False
+    try:
+        out = build(args, stats)
+        ok = True
+    except (BuildError, OSError) as e:
+        print_error(e)
+        return 1
+    finally:
+        if args.stats: write_stats(args.stats, [stats_record(args.project, ok, stats.to_dict(), args.base_dir, started)])
+    print(out)
+    print(f"耗时 {stats.summary()}", file=sys.stderr)
+    for w in stats.warnings: print(f"警告: {w}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__': sys.exit(main())
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_check.py - 编译前的静态检查 (不调用 XeLaTeX)
+在编译前找出会导致排版失败或内容丢失的问题，并给出 文件:行 位置：
+1. 未知的格式类型 (会被输出为 "% 未知类型" 注释)。
+2. image 引用的图片不存在、antiphonnum 缺少编号。
+3. 原样插入 LaTeX 的字段 (图片路径、封面标题) 花括号不配对；正文字段中手工转义的 \\% \\& \\_ 等。
+4. singlecol 单栏切换未配对。
+5. 内容文件中不足 3 个 | 字段、会被加载器忽略的行。
+
+用法示例：
+    python -m psalter_check                 # 并行检查程序目录下的整个 content/
+    python -m psalter_check content/psalms project.csv -j 4
+
+退出码：0 无错误 (可能有警告)，1 发现错误。
+"""
+
+import argparse, os, re, time, collections, itertools
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from psalter_core import (
+    TEX_MAPPING, SPECIAL_MAPPING, RAW_FIELDS, ERROR, WARNING, MultiLineContentItem, get_application_path,
+    column_state_at,
+)
+from psalter_project import load_project
+
+CONTROL_TYPES = {'tocstart', 'singlecol', 'pagebreak'}
+KNOWN_TYPES = set(TEX_MAPPING) | set(SPECIAL_MAPPING) | CONTROL_TYPES
+# 正文字段会被转义，其中的 LaTeX 命令参数不再生效 (\\ 换行除外)
+_LATEX_COMMAND = re.compile(r"\\[A-Za-z]+")
+# 按转义前的写法手工转义的特殊字符 (\\ 换行后的字符不算)
+_PRE_ESCAPED = re.compile(r"\\[%&#_{}$]")
+_BACKSLASH_PAIR = re.compile(r"\\.", re.S)
+
+class Issue(collections.namedtuple("Issue", "path line level message")):
+    __slots__ = ()
+    def __str__(self): return f"{self.path}:{self.line}: {self.level}: {self.message}"
+
+def braces_balanced(text):
+    """花括号是否配对 (忽略 \\{ 与 \\})"""
+    depth = 0
+    for m in re.finditer(r"\\.|[{}]", text):
+        s = m.group()
+        if s == "{": depth += 1
+        elif s == "}":
+            depth -= 1
+            if depth < 0: return False
+    return depth == 0
+
+def check_row(t, l, c, a, base_dir=None):
+    """检查单行内容，返回 [(级别, 说明)]"""
+    out = []
+    if t not in KNOWN_TYPES:
+        out.append((ERROR, f"未知类型 '{t}'，将被输出为注释而不排版"))
+        return out
+    if t == 'antiphonnum' and not a.strip():
+        out.append((ERROR, "antiphonnum 缺少编号 (第 4 个字段)"))
+    raw = RAW_FIELDS.get(t, ())
+    for key, value in (('l', l), ('c', c), ('a', a)):
+        if key in raw:
+            if not braces_balanced(value): out.append((ERROR, f"花括号不配对: {value}"))
+        else:
+            m = next((p for p in _BACKSLASH_PAIR.finditer(value) if _PRE_ESCAPED.fullmatch(p.group())), None)
+            if m: out.append((ERROR, f"手工转义的 {m.group()}：正文会自动转义特殊字符，请直接写 {m.group()[1]}"))
+            m = _LATEX_COMMAND.search(value)
+            if m: out.append((WARNING, f"含 LaTeX 命令 {m.group()}：正文会转义其中的 {{}}%&#_$，命令不会按原意生效"))
+    if t == 'image':
+        if not l: out.append((ERROR, "image 缺少图片路径"))
+        elif base_dir and not os.path.isfile(os.path.join(base_dir, l)):
+            out.append((ERROR, f"图片不存在: {l}"))
+    return out
+
+# ==========================================
+# 内容文件 (content/*.txt)
+# ==========================================
+def check_content_file(fp, base_dir=None):
+    """按 FileContentLoader 的规则逐行检查内容文件，行号为文件中的实际行号"""
+    issues = []
+    is_single_col, toggle_line = False, 0
+    try:
+        with open(fp, 'r', encoding='utf-8') as f:
+            lines = list(f)
+    except (OSError, UnicodeDecodeError) as e:
+        return [Issue(fp, 0, ERROR, f"无法读取: {e}")]
+    for n, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'): continue
+        parts = line.split('|')
+        if len(parts) < 3:
+            issues.append(Issue(fp, n, ERROR, f"只有 {len(parts)} 个字段 (至少需要 type|latin|chinese)，该行会被忽略"))
+            continue
+        t = parts[0]
+        if t == 'tocstart': is_single_col = False
+        elif t == 'singlecol': is_single_col, toggle_line = not is_single_col, n
+        for level, msg in check_row(t, parts[1], parts[2], parts[3] if len(parts) > 3 else "", base_dir):
+            issues.append(Issue(fp, n, level, msg))
+    if is_single_col:
+        issues.append(Issue(fp, toggle_line, WARNING, "singlecol 未配对：文件结束时仍处于单栏模式"))
+    issues.sort(key=lambda i: i.line)
+    return issues
+
+def content_files(path):
+    """path 为文件时返回自身，为目录时递归列出其中的 *.txt"""
+    if os.path.isfile(path): return [path]
+    return sorted(os.path.join(root, fn) for root, _, files in os.walk(path) for fn in files if fn.endswith('.txt'))
+
+FILES_PER_JOB = 32
+
+def check_content_tree(path, base_dir=None, jobs=None):
+    """并行检查 path 下的所有内容文件，返回按文件与行号排列的问题列表"""
+    files = content_files(path)
+    # 进程启动有固定开销：每个进程至少分到 FILES_PER_JOB 个文件，小目录直接串行
+    jobs = min(jobs or os.cpu_count() or 1, len(files) // FILES_PER_JOB)
+    if jobs <= 1:
+        results = [check_content_file(fp, base_dir) for fp in files]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(check_content_file, files, itertools.repeat(base_dir),
+                                    chunksize=max(1, len(files) // (jobs * 4))))
+    return [issue for res in results for issue in res]
+
+# ==========================================
+# 工程 (编辑器中的内容列表)
+# ==========================================
+def check_items(content_items, base_dir=None, title_data=None, start=0, end=None, name="工程"):
+    """检查内容列表 content_items[start:end]。位置记为 "工程:项号"，来自内容文件的行附带来源文件名"""
+    issues = []
+    for key, value in (title_data or {}).items():
+        if not braces_balanced(value): issues.append(Issue(name, 0, ERROR, f"封面 {key} 花括号不配对: {value}"))
+    is_single_col = column_state_at(content_items, start) if start else False
+    toggle_at = 0
+    for i, item in enumerate(itertools.islice(content_items, start, end), start + 1):
+        rows = item.items if isinstance(item, MultiLineContentItem) else [item]
+        for n, r in enumerate(rows, 1):
+            src = f" ({item.source_file} 第 {n} 条)" if isinstance(item, MultiLineContentItem) else ""
+            if r.item_type == 'tocstart': is_single_col = False
+            elif r.item_type == 'singlecol': is_single_col, toggle_at = not is_single_col, i
+            for level, msg in check_row(r.item_type, r.latin, r.chinese, r.arg, base_dir):
+                issues.append(Issue(name, i, level, msg + src))
+    if is_single_col and toggle_at:
+        issues.append(Issue(name, toggle_at, WARNING, "singlecol 未配对：正文结束时仍处于单栏模式"))
+    issues.sort(key=lambda i: i.line)
+    return issues
+
+def count_errors(issues):
+    return sum(1 for i in issues if i.level == ERROR)
+
+def format_issues(issues):
+    return "\n".join(str(i) for i in issues)
+
+# ==========================================
+# 命令行
+# ==========================================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog="psalter_check", description="编译前检查内容文件与工程 (不调用 XeLaTeX)")
+    p.add_argument("paths", nargs="*", help="内容文件、内容目录或工程文件 (.csv / .psproj)；默认为 <base-dir>/content")
+    p.add_argument("--base-dir", default=get_application_path(), help="图片路径的基准目录 (包含 images/，默认为程序目录)")
+    p.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数（默认为 CPU 核数）")
+    p.add_argument("-q", "--quiet", action="store_true", help="只输出错误，不输出警告")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    paths = args.paths or [os.path.join(args.base_dir, "content")]
+    start, issues = time.perf_counter(), []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"找不到: {path}", file=sys.stderr); return 2
+        if os.path.isfile(path) and not path.lower().endswith('.txt'):
+            issues += check_items(load_project(path), args.base_dir, name=path)
+        else:
+            issues += check_content_tree(path, args.base_dir, args.jobs)
+    for issue in issues:
+        if not (args.quiet and issue.level == WARNING): print(issue)
+    errors = count_errors(issues)
+    print(f"{errors} 个错误，{len(issues) - errors} 个警告 ({time.perf_counter() - start:.2f}s)", file=sys.stderr)
+    return 1 if errors else 0
+
+if __name__ == '__main__': sys.exit(main())
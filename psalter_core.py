@@ -0,0 +1,1294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_core.py - Psalter 核心逻辑 (不依赖 tkinter)
+包含：
+1. 内容数据模型与文件加载。
+2. LaTeX 正文生成 (Paracol 分栏管理)。
+3. 工程 CSV 读写。
+4. XeLaTeX 编译流水线。
+供 tex_generator.py (图形界面) 与 psalter_build.py (命令行) 共用。
+"""
+
+import os, csv, shutil, re, subprocess, platform, hashlib, threading, itertools, filecmp, string, operator, functools, array, collections, time, contextlib, logging, fractions
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, TiffImagePlugin
+except ImportError:  # 可选依赖：未安装 Pillow 时不能做图片预处理，其余功能不受影响
+    Image = None
+HAS_PILLOW = Image is not None
+
+# 库代码只记录，由调用方决定输出 (命令行与界面另行显示 BuildStats.warnings)
+log = logging.getLogger(__name__)
+log.addHandler(logging.NullHandler())
+
+# ==========================================
+# 1. LaTeX 命令映射配置
+# ==========================================
+TEX_MAPPING = {
+    'h1':           (r'\psHeaderOne{{{l}}}{{{c}}}',      r'\psSingleHeaderOne{{{c}}}'),
+    'h1cap':        (r'\psHeaderOneCap{{{l}}}{{{c}}}',   r'\psSingleHeaderOneCap{{{l}}}{{{c}}}'),
+    'h1lowercase':  (r'\psHeaderOneLowercase{{{l}}}{{{c}}}', r'\psSingleHeaderOneLowercase{{{l}}}{{{c}}}'),
+    'h2':           (r'\psHeaderTwo{{{l}}}{{{c}}}',      r'\psSingleHeaderTwo{{{c}}}'),
+    'h3':           (r'\psHeaderThree{{{l}}}{{{c}}}',    r'\psSingleHeaderThree{{{c}}}'),
+    'psalmtitle':   (r'\psPsalmTitle{{{l}}}{{{c}}}',     r'\psSinglePsalmTitle{{{c}}}'),
+    'canticletitle':(r'\psCanticleTitle{{{l}}}{{{c}}}',  r'\psSingleCanticleTitle{{{c}}}'),
+    'hymntitle':    (r'\psHymnTitle{{{l}}}{{{c}}}',      r'\psSingleHymnTitle{{{c}}}'),
+    'hymnheader':   (r'\psHymnHeader{{{l}}}{{{c}}}',     r'\psSingleHymnHeader{{{c}}}'),
+    'antiphon':     (r'\psAntiphonRepeat{{{l}}}{{{c}}}', r'\psSingleAntiphon{{{c}}}'),
+    'dropcap':      (r'\psVerseDropcap{{{l}}}{{{c}}}',   r'\psSingleVerseDropcap{{{c}}}'),
+    'verse':        (r'\psVerse{{{l}}}{{{c}}}',          r'\psSingleVerse{{{c}}}'),
+    'gloria':       (r'\psGloria{{{l}}}{{{c}}}',         r'\psSingleGloria{{{c}}}'),
+    'rubric':       (r'\psRubric{{{l}}}{{{c}}}',         r'\psSingleRubric{{{c}}}'),
+    'V':            (r'\psVR{{V}}{{{l}}}{{{c}}}',        r'\psSingleVR{{V}}{{{c}}}'),
+    'R':            (r'\psVR{{R}}{{{l}}}{{{c}}}',        r'\psSingleVR{{R}}{{{c}}}'),
+    'hymn':         (r'\psHymnStanza{{{l}}}{{{c}}}',     r'\psSingleHymnStanza{{{c}}}'),
+    'capit':        (r'\psCapit{{{l}}}{{{c}}}',          r'\psSingleCapit{{{c}}}'),
+    'capitheader':  (r'\psCapitHeader{{{l}}}{{{c}}}',    r'\psSingleCapitHeader{{{c}}}'),
+    'scriptureref': (r'\psScriptureRef{{{l}}}{{{c}}}',   r'\psSingleScriptureRef{{{c}}}'),
+    'collect':      (r'\psCollect{{{l}}}{{{c}}}',        r'\psSingleCollect{{{c}}}'),
+    'lesson':       (r'\psLesson{{{l}}}{{{c}}}',         r'\psSingleLesson{{{c}}}'),
+    'text':         (r'\psText{{{l}}}{{{c}}}',           r'\psSingleText{{{c}}}'),
+    'rule':         (r'\psThinRule',                     r'\psSingleThinRule'),
+    'thickrule':    (r'\psThickRule',                    r'\psSingleThickRule'),
+}
+
+# 参数顺序特殊的类型，同样以 (双栏, 单栏) 模板给出
+SPECIAL_MAPPING = {
+    'antiphonnum':  (r'\psAntiphonNum{{{a}}}{{{l}}}{{{c}}}', r'\psSingleAntiphonNum{{{a}}}{{{c}}}'),
+    'image':        (r'\psImageFullWidth{{{l}}}',         r'\psSingleImage{{{l}}}'),
+}
+
+# 不转义的模板字段：图片的 latin 列是 images/ 下的文件名
+RAW_FIELDS = {'image': ('l',)}
+
+# ==========================================
+# 2. 数据模型与内容加载
+# ==========================================
+class ContentItem:
+    # 大型工程有数十万行内容：使用 __slots__ 省去每个实例的 __dict__，并驻留 item_type 字符串
+    __slots__ = ('item_type', 'latin', 'chinese', 'arg', 'source_file')
+    is_multiline = False
+    line_count = 1
+    def __init__(self, t, l="", c="", a="", src="", multi=False, cnt=1):
+        # multi / cnt 仅为兼容旧的调用方式而保留：is_multiline 与 line_count 现由类决定，传入的值被忽略
+        self.item_type, self.latin, self.chinese, self.arg = sys.intern(t), l, c, a
+        self.source_file = src
+    def to_csv_row(self): return [self.item_type, self.latin, self.chinese, self.arg]
+    def get_display_text(self):
+        t = self.item_type
+        if self.is_multiline:
+            return f"[{t}] {self.latin[:20]}... | {self.chinese[:10]}... (+{self.line_count-1}行)"
+        if t == "image": return f"[图片] {os.path.basename(self.latin)}"
+        if t == "rule": return "[分隔线]"
+        if t == "thickrule": return "[粗分隔线]"
+        if t == "pagebreak": return "[分页]"
+        if t == "tocstart": return "[目录起始]"
+        if t == "singlecol": return "[单栏/双栏切换]"
+        pl = self.latin[:20] + "..." if len(self.latin) > 20 else self.latin
+        pc = self.chinese[:10] + "..." if len(self.chinese) > 10 else self.chinese
+        return f"[{t}] {pl} | {pc}"
+
+class MultiLineContentItem(ContentItem):
+    # 不再复制首行字段，item_type / latin / chinese / arg 直接取自首行
+    __slots__ = ('items',)
+    is_multiline = True
+    def __init__(self, src, items):
+        self.items = items
+        self.source_file = src
+    item_type = property(lambda self: self.items[0].item_type if self.items else "")
+    latin = property(lambda self: self.items[0].latin if self.items else "")
+    chinese = property(lambda self: self.items[0].chinese if self.items else "")
+    arg = property(lambda self: self.items[0].arg if self.items else "")
+    line_count = property(lambda self: len(self.items))
+    def to_csv_rows(self): 
+        return [i.to_csv_row() for i in self.items]
+    def get_flat_items(self): 
+        return self.items
+
+def iter_content_lines(fp):
+    """逐行解析内容文件，产出 (行号, ContentItem)；空行、# 注释与不足 3 个字段的行被忽略"""
+    with open(fp, 'r', encoding='utf-8') as f:
+        for n, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'): continue
+            parts = line.split('|')
+            if len(parts) >= 3:
+                yield n, ContentItem(parts[0], parts[1], parts[2], parts[3] if len(parts) > 3 else "")
+
+class FileContentLoader:
+    CATEGORIES = {
+        "psalms": "圣咏 (Psalms)", "canticles": "圣歌 (Canticles)",
+        "hymns": "赞美诗 (Hymns)", "antiphons": "对经 (Antiphons)",
+        "lessons": "读经 (Lessons)", "responsories": "答唱咏 (Responsories)",
+        "collects": "集祷经 (Collects)", "common": "通用文本 (Common)"
+    }
+    def __init__(self, d):
+        self.content_dir = d
+        for c in self.CATEGORIES: os.makedirs(os.path.join(d, c), exist_ok=True)
+        # 缓存：按 (mtime, size) 失效的解析结果，按目录 mtime 失效的文件索引
+        self._file_cache = {}
+        self._dir_cache = {}
+        self._sort_keys = {}
+    @staticmethod
+    def _sort_key(f):
+        nums = re.findall(r'\d+', f)
+        k = int(nums[0]) if nums else 999
+        if len(nums) > 1: k = k * 100 + int(nums[1])
+        return k
+    def get_available_files(self):
+        files = {c: [] for c in self.CATEGORIES}
+        for cat in files:
+            p = os.path.join(self.content_dir, cat)
+            try: mtime = os.stat(p).st_mtime_ns
+            except OSError: continue
+            cached = self._dir_cache.get(cat)
+            if cached and cached[0] == mtime:
+                files[cat] = list(cached[1]); continue
+            fl = []
+            for f in os.listdir(p):
+                if f.endswith('.txt'):
+                    k = self._sort_keys.get(f)
+                    if k is None: k = self._sort_keys[f] = self._sort_key(f)
+                    fl.append((k, f))
+            fl.sort(key=lambda x: x[0])
+            self._dir_cache[cat] = (mtime, fl)
+            files[cat] = list(fl)
+        return files
+    def load_file_content(self, cat, fn):
+        """解析内容文件。结果按文件 mtime/size 缓存，返回的 ContentItem 在多次调用间共享，不应原地修改"""
+        fp = os.path.join(self.content_dir, cat, fn)
+        try: st = os.stat(fp)
+        except OSError:
+            self._file_cache.pop(fp, None)
+            return []
+        sig = (st.st_mtime_ns, st.st_size)
+        cached = self._file_cache.get(fp)
+        if cached and cached[0] == sig: return list(cached[1])
+        items = [item for _, item in iter_content_lines(fp)]
+        self._file_cache[fp] = (sig, items)
+        return list(items)
+    def invalidate(self, cat=None, fn=None):
+        """丢弃缓存：不带参数时全部丢弃，仅给出 cat 时丢弃该分类的目录索引"""
+        if cat is None:
+            self._file_cache.clear(); self._dir_cache.clear(); return
+        self._dir_cache.pop(cat, None)
+        if fn is not None: self._file_cache.pop(os.path.join(self.content_dir, cat, fn), None)
+    def load_file_as_multiline(self, cat, fn):
+        items = self.load_file_content(cat, fn)
+        return MultiLineContentItem(fn, items) if items else None
+
+FORMAT_TYPES = [
+    ("h1", "大标题"), ("h1cap", "目录大标题"), ("h1lowercase", "目录小标题"),
+    ("h2", "副标题"), ("h3", "节次标题"), ("psalmtitle", "圣咏标题"),
+    ("canticletitle", "圣歌标题"), ("hymntitle", "赞美诗标题"), ("hymnheader", "赞美诗加粗标题"),
+    ("antiphon", "对经"), ("antiphonnum", "对经(带编号)"), ("dropcap", "首字下沉文本"),
+    ("verse", "诗节"), ("gloria", "圣三光荣颂"), ("rubric", "礼仪指示"),
+    ("V", "启(V)"), ("R", "应(R)"), ("hymn", "赞美诗节"),
+    ("capit", "短读经"), ("capitheader", "短读经标题"), ("scriptureref", "圣经引用"),
+    ("collect", "集祷经"), ("lesson", "读经标题"), ("text", "普通文本"),
+    ("rule", "分隔线"), ("thickrule", "粗分隔线"), ("pagebreak", "分页"),
+    ("tocstart", "目录起始"), ("singlecol", "单栏/双栏切换"), ("image", "图片"),
+]
+
+# 默认封面标题数据
+DEFAULT_TITLE_DATA = {
+    "title_zh": "羅馬大日課\\\\[0.5em]耶穌聖誕瞻禮",
+    "title_lat": "Breviárium Románum\\\\[0.5em]In Nativitáte Dómini",
+    "edition": "中拉對照\\\\[0.5em]Edítio Sínico-Latína",
+    "footer": "Pro Manuscripto"
+}
+
+# main.tex 中的占位符 -> title_data 键
+TITLE_PLACEHOLDERS = [
+    ("%TITLE_ZH%", "title_zh"), ("%TITLE_LAT%", "title_lat"),
+    ("%EDITION_INFO%", "edition"), ("%FOOTER_TEXT%", "footer"),
+]
+
+REQUIRED_FILES = ["main.tex", "psalter.sty"]
+
+def get_application_path():
+    """获取应用程序运行目录（兼容打包后的 EXE 和源码运行）"""
+    if getattr(sys, 'frozen', False):
+        # 如果是打包后的 EXE，使用 EXE 所在的目录
+        return os.path.dirname(sys.executable)
+    else:
+        # 如果是源码运行，使用脚本所在的目录
+        return os.path.dirname(os.path.abspath(__file__))
+
+# ==========================================
+# 3. 生成 LaTeX 内容 (Paracol管理)
+# ==========================================
+def iter_flat_items(content_items):
+    """逐行产出 ContentItem (MultiLineContentItem 就地展开，不建立中间列表)"""
+    for item in content_items:
+        if isinstance(item, MultiLineContentItem): yield from item.items
+        else: yield item
+
+def flatten_items(content_items):
+    """将 MultiLineContentItem 展开为逐行 ContentItem 列表"""
+    return list(iter_flat_items(content_items))
+
+def column_state_at(content_items, index):
+    """推算渲染到 content_items[index] 之前时是否处于单栏模式"""
+    is_single_col = False
+    for item in iter_flat_items(itertools.islice(content_items, index)):
+        if item.item_type == 'tocstart': is_single_col = False
+        elif item.item_type == 'singlecol': is_single_col = not is_single_col
+    return is_single_col
+
+# tocstart：打印目录并开始正文页码
+TOC_LINES = [r"\psPrintToc", r"\clearpage", r"\pagenumbering{arabic}", r"\pagestyle{fancy}"]
+
+# ==========================================
+# LaTeX 转义
+# ==========================================
+# 内容文本中的这些字符在 LaTeX 中有特殊含义，未转义时整个编译失败。
+# 反斜杠、~、^ 不转义：内容中有意写出的 \\ 换行与 ~ 不断行空格保持原样。
+LATEX_ESCAPES = str.maketrans({ch: "\\" + ch for ch in "%&#_{}$"})
+_LATEX_SPECIAL = re.compile(r"[%&#_{}$]")
+# 反斜杠连同其后一个字符原样保留：旧内容中手工转义的 \% \_ 等不会变成 \\% (换行后接注释符)
+_LATEX_ESCAPED_OR_SPECIAL = re.compile(r"(\\.)|([%&#_{}$])", re.S)
+
+# 光荣颂、对经等文本在工程中大量重复，缓存转义结果 (有界，不随工程无限增长)
+@functools.lru_cache(maxsize=1 << 16)
+def escape_latex(text):
+    """单趟转义 LaTeX 特殊字符；绝大多数行不含特殊字符，先用正则判断以免逐字查表。
+    已转义的字符 (前面有反斜杠) 保持不变，可由 psalter_check 报告"""
+    if not _LATEX_SPECIAL.search(text): return text
+    if "\\" not in text: return text.translate(LATEX_ESCAPES)
+    return _LATEX_ESCAPED_OR_SPECIAL.sub(lambda m: m.group(1) or "\\" + m.group(2), text)
+
+_TEMPLATE_FIELDS = {'l': 'latin', 'c': 'chinese', 'a': 'arg'}
+
+def compile_template(tpl, raw=()):
+    """把 str.format 模板预编译为 item -> str 的函数：一次性解析为 % 格式串与字段读取函数，
+    渲染时不再逐行解析模板。字段默认经 escape_latex 转义，raw 中列出的模板字段 (如图片路径) 原样插入"""
+    fmt, names = [], []
+    for lit, name, _, _ in string.Formatter().parse(tpl):
+        fmt.append(lit.replace('%', '%%'))
+        if name is not None: fmt.append('%s'); names.append(name)
+    if not names:
+        text = tpl.format()
+        return lambda item: text
+    fmt = "".join(fmt)
+    get = operator.attrgetter(*(_TEMPLATE_FIELDS[n] for n in names))
+    if len(names) == 1: get = (lambda g: lambda item: (g(item),))(get)
+    escaped = [n not in raw for n in names]
+
+    # 重复的行 (光荣颂、对经) 直接命中缓存，省去转义与格式化
+    if all(escaped):
+        # 常见情形：各字段都转义且都不含特殊字符，合起来查一次即可
+        search = _LATEX_SPECIAL.search
+        @functools.lru_cache(maxsize=1 << 10)
+        def render(values):
+            return fmt % (tuple(map(escape_latex, values)) if search("".join(values)) else values)
+    else:
+        @functools.lru_cache(maxsize=1 << 10)
+        def render(values):
+            return fmt % tuple(escape_latex(v) if e else v for v, e in zip(values, escaped))
+    return lambda item: render(get(item))
+
+def build_render_table():
+    """RENDER_TABLE[is_single_col][item_type] -> 渲染函数"""
+    table = ({}, {})
+    for mapping in (TEX_MAPPING, SPECIAL_MAPPING):
+        for t, (double_cmd, single_cmd) in mapping.items():
+            raw = RAW_FIELDS.get(t, ())
+            table[False][t], table[True][t] = compile_template(double_cmd, raw), compile_template(single_cmd, raw)
+    return table
+
+RENDER_TABLE = build_render_table()
+
+def render_unknown(item):
+    return f"% 未知类型: {item.item_type} | {item.latin} | {item.chinese}"
+
+def render_item(item, is_single_col):
+    """渲染单个内容项 (分栏控制项 tocstart / singlecol / pagebreak 由调用方处理)"""
+    fn = RENDER_TABLE[is_single_col].get(item.item_type)
+    return fn(item) if fn else render_unknown(item)
+
+class LineMap:
+    """记录生成的 .tex 中每一行来自哪个内容项：第 n 行 (从 1 开始) -> (content_items 下标, 项内行号)。
+    paracol 开闭等结构行记为 -1。用于把 XeLaTeX 报错的行号还原到内容项与来源文件。"""
+    __slots__ = ('items', 'rows')
+    def __init__(self):
+        self.items, self.rows = array.array('i'), array.array('i')
+    def append(self, item, row=0):
+        self.items.append(item); self.rows.append(row)
+    def __len__(self): return len(self.items)
+    def lookup(self, line):
+        """返回 (下标, 项内行号)，结构行或越界时返回 None"""
+        if 1 <= line <= len(self.items) and self.items[line - 1] >= 0:
+            return self.items[line - 1], self.rows[line - 1]
+        return None
+
+def iter_indexed_rows(content_items, start=0, end=None):
+    """逐行产出 (content_items 下标, 项内行号, ContentItem)"""
+    for i, item in enumerate(itertools.islice(content_items, start, end), start):
+        if isinstance(item, MultiLineContentItem):
+            for r, row in enumerate(item.items): yield i, r, row
+        else:
+            yield i, 0, item
+
+def iter_latex_content(content_items, start=0, end=None, line_map=None):
+    """逐行产出 body.tex (不含换行符)。start/end 限定 content_items 的下标范围 (局部预览)，
+    范围起点的分栏状态按其前面的内容推算，与完整文档中一致。给出 line_map (LineMap) 时同时记录行号映射。"""
+    mark = line_map.append if line_map is not None else None
+    if mark: mark(-1)
+    yield r"\begin{paracol}{2}"
+    is_single_col = column_state_at(content_items, start) if start else False
+    if is_single_col:
+        if mark: mark(-1)
+        yield r"\psEnterSingleCol"
+
+    table = RENDER_TABLE[is_single_col]
+    for i, r, item in iter_indexed_rows(content_items, start, end):
+        t = item.item_type
+        fn = table.get(t)
+        if fn:
+            if mark: mark(i, r)
+            yield fn(item)
+            continue
+
+        if t == 'tocstart':
+            lines = ([] if is_single_col else [r"\end{paracol}"]) + TOC_LINES + [r"\begin{paracol}{2}"]
+            is_single_col = False
+
+        elif t == 'singlecol':
+            if is_single_col:
+                lines = [r"\psExitSingleCol"]
+                is_single_col = False
+            else:
+                lines = [r"\psEnterSingleCol"]
+                is_single_col = True
+
+        elif t == 'pagebreak':
+            lines = [r"\psSinglePageBreak" if is_single_col else r"\psPageBreak"]
+
+        else:
+            lines = [render_unknown(item)]
+        for line in lines:
+            if mark: mark(i, r)
+            yield line
+        table = RENDER_TABLE[is_single_col]
+
+    if not is_single_col:
+        if mark: mark(-1)
+        yield r"\end{paracol}"
+
+# ==========================================
+# 重复内容宏
+# ==========================================
+# 光荣颂、圣咏前后的对经等整段重复的内容行，在 body.tex 开头定义为宏 \psRep{n}，正文中只写引用。
+# 宏体与原文逐行相同 (行尾同样读作空格)，排版结果不变。分栏控制行不放入宏；
+# 含未转义 % 或 # 的行 (未知类型的注释、原样插入的字段) 放进宏定义会出错，也不处理。
+DEDUP_MIN_CHARS = 40
+_DEDUP_STRUCTURAL = frozenset([r"\begin{paracol}{2}", r"\end{paracol}", r"\psEnterSingleCol", r"\psExitSingleCol",
+                               r"\psPageBreak", r"\psSinglePageBreak"] + TOC_LINES)
+_DEDUP_UNSAFE = re.compile(r'(?<!\\)[%#]')
+
+def find_repeated_runs(lines, min_chars=DEDUP_MIN_CHARS):
+    """找出重复出现的整段行。返回 (各行哈希, {起始行: 段长})，只含出现两次以上、总长不少于 min_chars 的段。
+    相邻两行总是一起出现 (a 之后必为 b、b 之前必为 a) 时归入同一段，因此同一段的各次出现逐行相同 (哈希意义上)。"""
+    hashes, lengths = array.array('q'), array.array('I')
+    for line in lines:
+        ok = line not in _DEDUP_STRUCTURAL and not _DEDUP_UNSAFE.search(line)
+        hashes.append((hash(line) or 1) if ok else 0); lengths.append(len(line))
+    counts = collections.Counter(hashes)
+    counts.pop(0, None)
+    rep = lambda h: counts.get(h, 0) > 1
+    pairs = collections.Counter((a, b) for a, b in zip(hashes, itertools.islice(hashes, 1, None)) if rep(a) and rep(b))
+    runs, k, n = {}, 0, len(hashes)
+    while k < n:
+        if not rep(hashes[k]): k += 1; continue
+        j = k + 1
+        while j < n and rep(hashes[j]) and counts[hashes[j - 1]] == counts[hashes[j]] == pairs[hashes[j - 1], hashes[j]]:
+            j += 1
+        if sum(lengths[k:j]) + j - k - 1 >= min_chars: runs[k] = j - k
+        k = j
+    return hashes, runs
+
+def iter_dedup_latex(content_items, start=0, end=None, line_map=None, min_chars=DEDUP_MIN_CHARS):
+    """与 iter_latex_content 相同，但重复的整段内容改为 \\psRep{n} 引用，宏定义集中在开头。
+    正文渲染三遍 (统计、取宏体、输出)，只保存各行的哈希，不在内存中保留整个文档；
+    哈希相同而文本不同的段照原样输出。引用行在 line_map 中记为该段的第一行。"""
+    render = lambda m=None: iter_latex_content(content_items, start, end, m)
+    hashes, runs = find_repeated_runs(render(), min_chars)
+    macros, first = {}, {}  # 段的哈希序列 -> 宏编号；首次出现的起始行 -> 宏编号
+    for k, length in runs.items():
+        key = tuple(hashes[k:k + length])
+        if key not in macros: macros[key] = first[k] = len(macros) + 1
+    runs = {k: (macros[tuple(hashes[k:k + length])], length) for k, length in runs.items()}
+    del hashes
+
+    texts, it = {}, enumerate(render())
+    for k, line in it:
+        if k in first:
+            texts[first[k]] = [line] + [next(it)[1] for _ in range(runs[k][1] - 1)]
+
+    mark = line_map.append if line_map is not None else None
+    if texts:
+        if mark: mark(-1)
+        yield r"\providecommand\psRep[1]{\csname psRep@#1\endcsname}"
+    for number, block in texts.items():
+        block = list(block)
+        block[0] = r"\expandafter\def\csname psRep@%d\endcsname{" % number + block[0]
+        block[-1] += "}"
+        for line in block:
+            if mark: mark(-1)
+            yield line
+    texts = {number: "\n".join(block) for number, block in texts.items()}
+
+    full = LineMap() if line_map is not None else None
+    it = enumerate(render(full))
+    for k, line in it:
+        run = runs.get(k)
+        if run is None:
+            if mark: mark(full.items[k], full.rows[k])
+            yield line
+            continue
+        number, length = run
+        block = [line] + [next(it)[1] for _ in range(length - 1)]
+        if "\n".join(block) == texts[number]: block = [r"\psRep{%d}" % number]
+        for r, line in enumerate(block, k):
+            if mark: mark(full.items[r], full.rows[r])
+            yield line
+
+def get_latex_content(content_items, start=0, end=None, dedup=False):
+    """生成完整的 body.tex 字符串 (参数见 iter_latex_content；dedup 见 iter_dedup_latex)"""
+    return "\n".join((iter_dedup_latex if dedup else iter_latex_content)(content_items, start, end))
+
+# 流式写出时每攒够这么多字符写一次文件
+WRITE_BUFFER = 1 << 16
+
+def write_latex_content(f, content_items, start=0, end=None, line_map=None, dedup=False):
+    """把 body.tex 流式写入已打开的文本文件 f，内容与 get_latex_content 相同，
+    但不在内存中拼出整个文档。dedup=True 时把重复的整段内容写为宏 (见 iter_dedup_latex)"""
+    buf, size, sep = [], 0, ""
+    for line in (iter_dedup_latex if dedup else iter_latex_content)(content_items, start, end, line_map):
+        buf.append(line); size += len(line)
+        if size >= WRITE_BUFFER:
+            f.write(sep + "\n".join(buf)); sep = "\n"
+            buf.clear(); size = 0
+    if buf: f.write(sep + "\n".join(buf))
+
+def get_latex_chunks(content_items, start=0, end=None, line_maps=None):
+    """在 pagebreak / tocstart 处把正文切分为可 \\include 的块。
+    返回 [(kind, text)]：kind 为 "chunk" 时 text 自行开闭 paracol，可单独成文件；
+    为 "toc" 时是目录命令，直接写在 body.tex 中。\\include 自带的 \\clearpage 取代分页命令。
+    分页命令前后的块即使为空也保留 (连续两个 pagebreak 之间的空白页)，与不分块时的输出一致。
+    给出 line_maps (列表) 时为每个 "chunk" 依次追加其 LineMap。"""
+    is_single_col = column_state_at(content_items, start) if start else False
+    parts = []
+    def new_chunk():
+        m = LineMap() if line_maps is not None else None
+        if is_single_col: return [], m
+        if m is not None: m.append(-1)
+        return [r"\begin{paracol}{2}"], m
+    def close_chunk():
+        if not is_single_col:
+            lines.append(r"\end{paracol}")
+            if lmap is not None: lmap.append(-1)
+        parts.append(("chunk", "\n".join(lines)))
+        if lmap is not None: line_maps.append(lmap)
+    lines, lmap = new_chunk()
+    # n: 当前块的内容行数；after_break: 当前块由分页命令开始
+    n, after_break = 0, False
+
+    for i, r, item in iter_indexed_rows(content_items, start, end):
+        t = item.item_type
+
+        if t in ('pagebreak', 'tocstart'):
+            if n or after_break or t == 'pagebreak': close_chunk()
+            if t == 'tocstart':
+                parts.append(("toc", "\n".join(TOC_LINES)))
+                is_single_col = False
+            lines, lmap = new_chunk()
+            n, after_break = 0, t == 'pagebreak'
+            continue
+
+        if t == 'singlecol':
+            lines.append(r"\psExitSingleCol" if is_single_col else r"\psEnterSingleCol")
+            is_single_col = not is_single_col
+        else:
+            lines.append(render_item(item, is_single_col))
+        if lmap is not None: lmap.append(i, r)
+        n += 1
+
+    if n or after_break: close_chunk()
+    return parts
+
+def render_main_tex(main_content, title_data, escape=False):
+    """替换 main.tex 中的封面标题占位符。封面字段有意写有 \\\\[0.5em] 等 LaTeX，默认原样插入；
+    escape=True 时与正文一样经 escape_latex 转义"""
+    for ph, key in TITLE_PLACEHOLDERS:
+        value = title_data.get(key, "")
+        main_content = main_content.replace(ph, escape_latex(value) if escape else value)
+    return main_content
+
+# ==========================================
+# 4. 工程文件 (CSV) 读写
+# ==========================================
+# 每行：type, latin, chinese, arg[, source, row]
+# 来自内容文件的多行项额外写出来源文件名与行号 (从 1 开始)，读取时据此还原为 MultiLineContentItem；
+# 只有前四列的旧工程文件照常读取。
+def iter_csv_rows(content_items):
+    for item in content_items:
+        if isinstance(item, MultiLineContentItem):
+            for n, r in enumerate(item.to_csv_rows(), 1): yield r + [item.source_file, n]
+        else:
+            yield item.to_csv_row()
+
+@contextlib.contextmanager
+def open_atomic(fp, mode='w', **kw):
+    """写入 fp.tmp，完成后替换 fp；中途出错时原文件保持不变，临时文件被删除"""
+    tmp = fp + ".tmp"
+    try:
+        with open(tmp, mode, **kw) as f: yield f
+        os.replace(tmp, fp)
+    finally:
+        if os.path.exists(tmp): os.unlink(tmp)
+
+def save_project_csv(fp, content_items):
+    with open_atomic(fp, 'w', encoding='utf-8', newline='') as f:
+        csv.writer(f).writerows(iter_csv_rows(content_items))
+
+def load_project_csv(fp):
+    """流式读取 save_project_csv 保存的工程文件，连续的同源行重新组合为 MultiLineContentItem"""
+    items, group, group_src = [], None, None
+    with open(fp, 'r', encoding='utf-8', newline='') as f:
+        for row in csv.reader(f):
+            if not row or not row[0]: continue
+            n = len(row)
+            item = ContentItem(row[0], row[1] if n > 1 else "", row[2] if n > 2 else "", row[3] if n > 3 else "")
+            src = row[4] if n > 4 else ""
+            if not src:
+                group = None
+                items.append(item)
+            elif group is not None and src == group_src and (row[5] if n > 5 else "") != "1":
+                group.append(item)
+            else:
+                group, group_src = [item], src
+                items.append(MultiLineContentItem(src, group))
+    return items
+
+# ==========================================
+# 5. 编译流水线 (XeLaTeX)
+# ==========================================
+class BuildError(Exception):
+    """编译失败。log 为 xelatex 输出（若有），issues 为从 .log 中解析出的 LogIssue 列表，供界面或命令行展示。"""
+    def __init__(self, msg, log="", issues=()):
+        super().__init__(msg)
+        self.log = log
+        self.issues = list(issues)
+
+class CompileCancelled(BuildError):
+    """编译被用户取消"""
+
+class CancelToken:
+    """跨线程取消编译：cancel() 会终止正在运行的 xelatex 进程"""
+    def __init__(self):
+        self.cancelled = False
+        self._proc = None
+        self._lock = threading.Lock()
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            if self._proc and self._proc.poll() is None: self._proc.kill()
+    def attach(self, proc):
+        with self._lock:
+            self._proc = proc
+            if self.cancelled: proc.kill()
+    def check(self):
+        if self.cancelled: raise CompileCancelled("编译已取消")
+
+class BuildStats:
+    """一次构建的计时与统计：各阶段耗时 (秒)、写入与复制的字节数、xelatex 遍数与页数。
+    阶段名：load / check / sync / images / render / format / pass1, pass2 ...，同名阶段的耗时累加。"""
+    STAGE_LABELS = {"load": "读取", "check": "检查", "sync": "同步", "images": "图片", "render": "生成", "format": "格式"}
+    def __init__(self):
+        self.stages = {}
+        self.bytes_written = 0    # 本次实际重写的 .tex 字节数
+        self.body_bytes = 0       # 正文 (body.tex 及各块) 总字节数
+        self.files_synced = 0     # 更新的 psalter.sty / 图片文件数
+        self.bytes_copied = 0     # 其中无法硬链接、实际复制的字节数
+        self.images_converted = 0 # 本次新生成的图片缓存数
+        self.images_failed = 0    # 无法预处理、改用原图的图片数
+        self.passes = 0
+        self.pages = 0
+        self.pdf_bytes = 0
+        self.converged = True     # 辅助文件在遍数上限内收敛；否则页码引用或目录可能是旧的
+        self.warnings = []
+    @contextlib.contextmanager
+    def stage(self, name):
+        t = time.perf_counter()
+        try: yield
+        finally: self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - t
+    def wrote(self, fp, written):
+        if written: self.bytes_written += os.path.getsize(fp)
+    @property
+    def total(self): return sum(self.stages.values())
+    def to_dict(self):
+        d = {"total": round(self.total, 4), "stages": {k: round(v, 4) for k, v in self.stages.items()}}
+        for k in ("passes", "pages", "bytes_written", "body_bytes", "files_synced", "bytes_copied", "images_converted", "images_failed",
+                  "pdf_bytes", "converged", "warnings"):
+            d[k] = getattr(self, k)
+        return d
+    def summary(self):
+        """一行中文摘要，供界面状态栏显示"""
+        parts = []
+        for k, v in self.stages.items():
+            label = self.STAGE_LABELS.get(k) or (f"第{k[4:]}遍" if k.startswith("pass") else k)
+            parts.append(f"{label} {v:.2f}s")
+        text = f"{self.total:.2f}s (" + " · ".join(parts) + ")"
+        if self.passes: text += f" · xelatex {self.passes} 遍"
+        if self.pages: text += f" · {self.pages} 页"
+        if not self.converged: text += " · 未收敛"
+        return text + f" · 写入 {self.bytes_written / 1024:.0f} KiB"
+
+def check_required_files(base_dir):
+    missing = [f for f in REQUIRED_FILES if not os.path.exists(os.path.join(base_dir, f))]
+    if missing: raise BuildError(f"缺失核心文件:\n{', '.join(missing)}")
+
+def clean_build_dir(build_dir):
+    if os.path.exists(build_dir):
+        for filename in os.listdir(build_dir):
+            file_path = os.path.join(build_dir, filename)
+            try:
+                if os.path.isfile(file_path) or os.path.islink(file_path): os.unlink(file_path)
+                elif os.path.isdir(file_path): shutil.rmtree(file_path)
+            except Exception: pass
+    else:
+        os.makedirs(build_dir)
+
+def sync_file(src, dst, stats=None):
+    """仅当 dst 与 src 的大小或修改时间不同时才更新；优先使用硬链接避免复制。返回是否更新"""
+    st = os.stat(src)
+    if os.path.exists(dst):
+        dt = os.stat(dst)
+        if dt.st_size == st.st_size and dt.st_mtime_ns == st.st_mtime_ns: return False
+        os.unlink(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # 跨磁盘或文件系统不支持时退回复制 (copy2 保留修改时间，下次可直接比较)
+        shutil.copy2(src, dst)
+        if stats: stats.bytes_copied += st.st_size
+    if stats: stats.files_synced += 1
+    return True
+
+def sync_tree(src_dir, dst_dir, stats=None):
+    """增量同步目录：只更新有变化的文件，并删除源目录中已不存在的文件"""
+    os.makedirs(dst_dir, exist_ok=True)
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir)
+        droot = os.path.normpath(os.path.join(dst_dir, rel))
+        for d in dirs: os.makedirs(os.path.join(droot, d), exist_ok=True)
+        for fn in files: sync_file(os.path.join(root, fn), os.path.join(droot, fn), stats)
+    for root, dirs, files in os.walk(dst_dir, topdown=False):
+        rel = os.path.relpath(root, dst_dir)
+        sroot = os.path.normpath(os.path.join(src_dir, rel))
+        for fn in files:
+            if not os.path.exists(os.path.join(sroot, fn)): os.unlink(os.path.join(root, fn))
+        for d in dirs:
+            if not os.path.exists(os.path.join(sroot, d)): shutil.rmtree(os.path.join(root, d), ignore_errors=True)
+
+# ==========================================
+# 图片预处理 (需要 Pillow)
+# ==========================================
+# 扫描件动辄数千万像素，\includegraphics 每次都要解码原图 (不指定高度时 \settowidth 还要先量一次)，
+# PDF 也随之膨胀。按 A5 版心与目标 DPI 生成缩小的副本缓存于 build_images/，正文引用副本，原图不动。
+IMAGE_CACHE_DIR = "build_images"
+# 转换方式改变时递增，旧版本的缓存副本不再被引用
+IMAGE_CACHE_VERSION = 2
+DEFAULT_IMAGE_DPI = 300
+# A5 (14.8 × 21.0 cm) 减去 psalter.sty 页边距后的版心
+TEXT_WIDTH_CM, TEXT_HEIGHT_CM = 14.8 - 2 * 1.2, 21.0 - 2.0 - 1.8
+# 缩放比例高于此值时收益不大，保留原图以免重新压缩
+DOWNSCALE_THRESHOLD = 0.9
+# xdvipdfmx 可直接嵌入的格式，其他格式 (GIF 等) 一律转为 PNG
+_EMBEDDABLE_FORMATS = {"JPEG", "PNG"}
+
+def image_box(dpi):
+    r"""图片在版面上的最大像素尺寸：\psImageFullWidth / \psSingleImage 排出的图片不超过版心"""
+    return round(TEXT_WIDTH_CM / 2.54 * dpi), round(TEXT_HEIGHT_CM / 2.54 * dpi)
+
+# 有界缓存：界面与监视模式长时间运行，改过的图片不应一直占着旧条目
+@functools.lru_cache(maxsize=1 << 10)
+def _digest(fp, mtime, size):
+    h = hashlib.sha1()
+    with open(fp, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""): h.update(block)
+    return h.hexdigest()
+
+def file_digest(fp):
+    """文件内容的 SHA-1，按 (路径, mtime, 大小) 缓存"""
+    st = os.stat(fp)
+    return _digest(fp, st.st_mtime_ns, st.st_size)
+
+def plan_image(src, box):
+    """只读图片头部，返回 (缩放比例, 输出格式)；无需处理时返回 None"""
+    with Image.open(src) as im:
+        w, h, fmt = im.width, im.height, im.format
+    scale = min(1.0, box[0] / w, box[1] / h)
+    if scale > DOWNSCALE_THRESHOLD and fmt in _EMBEDDABLE_FORMATS: return None
+    return scale, "JPEG" if fmt == "JPEG" else "PNG"
+
+def convert_image(src, dst, scale, fmt):
+    r"""按 scale 缩小 src 并写入 dst。分辨率标记同比提高，\includegraphics 量到的自然尺寸与原图相同，版面不变"""
+    with Image.open(src) as im:
+        # xdvipdfmx 对未标分辨率的图片按 72 dpi 计
+        dpi = im.info.get("dpi") or (72, 72)
+        if not all(d > 0 for d in dpi): dpi = (72, 72)
+        icc = im.info.get("icc_profile")
+        # 调色板图片 (GIF 等) 不能平滑缩放，先转为真彩色
+        if im.mode in ("P", "PA", "1"):
+            im = im.convert("RGBA" if im.mode == "PA" or "transparency" in im.info else "RGB")
+        if fmt == "JPEG" and im.mode not in ("RGB", "L", "CMYK"): im = im.convert("RGB")
+        if fmt == "JPEG":
+            # JFIF 只能记录整数分辨率：先把缩小后的分辨率取整，再由它确定像素尺寸，
+            # 自然尺寸与原图相差不到半个像素 (直接取整分辨率在低分辨率时会差出几个百分点)
+            out_dpi = tuple(max(1, round(d * scale)) for d in dpi)
+            size = (max(1, round(im.width * out_dpi[0] / dpi[0])), max(1, round(im.height * out_dpi[1] / dpi[1])))
+        else:
+            size = (max(1, round(im.width * scale)), max(1, round(im.height * scale)))
+        out_dpi = (dpi[0] * size[0] / im.width, dpi[1] * size[1] / im.height)
+        out = im.resize(size, Image.LANCZOS) if size != im.size else im
+        opts = {"quality": 90, "optimize": True} if fmt == "JPEG" else {"optimize": True}
+        if icc: opts["icc_profile"] = icc
+        if fmt == "JPEG":
+            # EXIF 以有理数记录确切分辨率，读取 EXIF 的程序得到与原图完全相同的自然尺寸
+            exif = Image.Exif()
+            exif[0x0128] = 2  # ResolutionUnit: 英寸
+            for tag, d in ((0x011A, out_dpi[0]), (0x011B, out_dpi[1])):
+                r = fractions.Fraction(d).limit_denominator(1 << 16)
+                exif[tag] = TiffImagePlugin.IFDRational(r.numerator, r.denominator)
+            opts["exif"] = exif.tobytes()
+        # 批量模式的各进程共用缓存目录：临时文件带上进程号，写完整后才原子替换为 dst
+        tmp = f"{dst}.{os.getpid()}.tmp"
+        try:
+            out.save(tmp, fmt, dpi=tuple(round(d) for d in out_dpi) if fmt == "JPEG" else out_dpi, **opts)
+            os.replace(tmp, dst)
+        finally:
+            if os.path.exists(tmp): os.unlink(tmp)
+
+def prepare_images(base_dir, content_items, dpi=DEFAULT_IMAGE_DPI, jobs=None, stats=None):
+    """为 content_items 中需要缩小或转换格式的图片生成缓存副本 (并行)，
+    返回 {图片路径: 副本相对 base_dir 的路径}。副本以原图内容哈希与目标像素尺寸命名，
+    原图或尺寸不变时直接复用。找不到、无法识别或处理失败的图片不在返回值中，照常引用原图；
+    后两者记入 stats.images_failed 与 stats.warnings (找不到的图片由编译前检查报告)。"""
+    stats = stats if stats is not None else BuildStats()
+    def failed(path, e):
+        stats.images_failed += 1
+        stats.warnings.append(f"图片预处理失败，使用原图: {path}: {e}")
+        log.warning("图片预处理失败: %s: %s", path, e)
+    if Image is None: raise BuildError("图片预处理需要 Pillow (pip install pillow)")
+    cache_dir = os.path.join(base_dir, IMAGE_CACHE_DIR)
+    mapping, todo, box = {}, {}, image_box(dpi)
+    for row in iter_flat_items(content_items):
+        if row.item_type != 'image' or not row.latin or row.latin in mapping: continue
+        mapping[row.latin] = None
+        src = os.path.join(base_dir, row.latin)
+        if not os.path.isfile(src): continue
+        try:
+            plan = plan_image(src, box)
+            if plan is None: continue
+            digest = file_digest(src)
+        except (OSError, Image.DecompressionBombError) as e:
+            failed(row.latin, e); continue
+        stem = re.sub(r'[^\w.-]', '_', os.path.splitext(os.path.basename(row.latin))[0])
+        name = f"{stem}-{digest[:12]}-{box[0]}x{box[1]}-v{IMAGE_CACHE_VERSION}" + (".jpg" if plan[1] == "JPEG" else ".png")
+        dst = os.path.join(cache_dir, name)
+        mapping[row.latin] = IMAGE_CACHE_DIR + "/" + name
+        if not os.path.exists(dst): todo[dst] = (src,) + plan
+    if todo:
+        os.makedirs(cache_dir, exist_ok=True)
+        # Pillow 解码、缩放与编码时释放 GIL，线程池即可并行，打包后的程序也不必启动子进程
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count() or 1) as pool:
+            futures = {pool.submit(convert_image, src, dst, scale, fmt): src for dst, (src, scale, fmt) in todo.items()}
+        for f, src in futures.items():
+            if f.exception() is None: stats.images_converted += 1
+            else: failed(os.path.relpath(src, base_dir), f.exception())
+    return {k: v for k, v in mapping.items() if v and os.path.exists(os.path.join(base_dir, v))}
+
+def apply_image_map(content_items, mapping):
+    """返回把图片改为引用缓存副本的内容列表。下标与原列表一一对应，未涉及图片的内容项原样共享"""
+    if not mapping: return content_items
+    def swap(row):
+        new = mapping.get(row.latin) if row.item_type == 'image' else None
+        return ContentItem('image', new, row.chinese, row.arg, row.source_file) if new else row
+    out = []
+    for item in content_items:
+        if isinstance(item, MultiLineContentItem):
+            rows = [swap(r) for r in item.items]
+            out.append(item if all(a is b for a, b in zip(rows, item.items)) else MultiLineContentItem(item.source_file, rows))
+        else:
+            out.append(swap(item))
+    return out
+
+def sync_cached_images(base_dir, build_dir, paths, stats=None):
+    """只把本次引用的缓存副本同步进 build 目录 (缓存目录为各工程共用)，删除不再引用的副本"""
+    dst_dir = os.path.join(build_dir, IMAGE_CACHE_DIR)
+    keep = {os.path.basename(p) for p in paths}
+    if keep: os.makedirs(dst_dir, exist_ok=True)
+    for fn in keep: sync_file(os.path.join(base_dir, IMAGE_CACHE_DIR, fn), os.path.join(dst_dir, fn), stats)
+    if os.path.isdir(dst_dir):
+        for fn in os.listdir(dst_dir):
+            if fn not in keep: os.unlink(os.path.join(dst_dir, fn))
+
+def write_if_changed(fp, text):
+    """内容不变时不重写文件，返回是否写入"""
+    if os.path.exists(fp):
+        with open(fp, 'r', encoding='utf-8', newline='') as f:
+            if f.read() == text: return False
+    with open(fp, 'w', encoding='utf-8', newline='') as f:
+        f.write(text)
+    return True
+
+def write_stream_if_changed(fp, write):
+    """write(f) 流式写出内容；先写入临时文件，与现有文件相同时丢弃，返回是否写入"""
+    tmp = fp + ".tmp"
+    try:
+        with open(tmp, 'w', encoding='utf-8', newline='') as f:
+            write(f)
+    except BaseException:
+        # 生成中途出错或被取消：不在 build 目录留下写了一半的临时文件
+        if os.path.exists(tmp): os.unlink(tmp)
+        raise
+    if os.path.exists(fp) and filecmp.cmp(tmp, fp, shallow=False):
+        os.unlink(tmp); return False
+    os.replace(tmp, fp)
+    return True
+
+def prepare_build_dir(base_dir, build_dir, content_items, title_data, clean=False, start=0, end=None,
+                      chunked=False, changed_only=False, stats=None, dedup=False, image_dpi=None):
+    """准备 build 目录：增量同步 psalter.sty 与 images/，仅在内容变化时重写 main.tex 与 body.tex。
+    保留上次编译的 .aux 与目录临时文件，clean=True 时先清空目录。start/end 见 get_latex_content，
+    chunked / changed_only 见 write_chunked_body，dedup 见 iter_dedup_latex (分块时不适用：
+    宏编号随全文变化，会使未变化的块也被重写)。给出 image_dpi 时图片改为引用按该分辨率缩小的缓存副本
+    (见 prepare_images)。返回正文各文件的行号映射 {文件名: LineMap}。
+    stats (BuildStats) 记录 sync / render 两个阶段。"""
+    stats = stats if stats is not None else BuildStats()
+    try:
+        if clean: clean_build_dir(build_dir)
+        else: os.makedirs(build_dir, exist_ok=True)
+    except Exception as e:
+        raise BuildError(f"无法创建目录: {e}")
+
+    try:
+        with stats.stage("sync"):
+            sync_file(os.path.join(base_dir, "psalter.sty"), os.path.join(build_dir, "psalter.sty"), stats)
+
+            src_img = os.path.join(base_dir, "images")
+            dst_img = os.path.join(build_dir, "images")
+            if os.path.exists(src_img): sync_tree(src_img, dst_img, stats)
+            else: os.makedirs(dst_img, exist_ok=True)
+
+        if image_dpi:
+            with stats.stage("images"):
+                mapping = prepare_images(base_dir, itertools.islice(content_items, start, end), image_dpi, stats=stats)
+                content_items = apply_image_map(content_items, mapping)
+                sync_cached_images(base_dir, build_dir, mapping.values(), stats)
+
+        with stats.stage("render"):
+            # 读取 main.tex 并注入标题
+            with open(os.path.join(base_dir, "main.tex"), 'r', encoding='utf-8') as f:
+                main_content = render_main_tex(f.read(), title_data)
+            main_content = add_includeonly_hook(main_content)
+
+            fp = os.path.join(build_dir, "main.tex")
+            stats.wrote(fp, write_if_changed(fp, main_content))
+            line_maps = {}
+            if chunked:
+                write_chunked_body(build_dir, content_items, start, end, changed_only, line_maps, stats)
+            else:
+                line_maps["body.tex"] = LineMap()
+                fp = os.path.join(build_dir, "body.tex")
+                stats.wrote(fp, write_stream_if_changed(
+                    fp, lambda f: write_latex_content(f, content_items, start, end, line_maps["body.tex"], dedup)))
+                stats.body_bytes += os.path.getsize(fp)
+                write_if_changed(os.path.join(build_dir, INCLUDEONLY_FILE), "")
+    except Exception as e:
+        raise BuildError(f"准备文件失败: {e}")
+    return line_maps
+
+# ==========================================
+# 分块编译 (\include + \includeonly)
+# ==========================================
+CHUNK_PREFIX = "body-"
+INCLUDEONLY_FILE = "includeonly.tex"
+
+def add_includeonly_hook(main_content):
+    """在 \\begin{document} 前读取 includeonly.tex；该行固定不变，不影响预编译格式的缓存键"""
+    hook = "\\InputIfFileExists{%s}{}{}\n" % INCLUDEONLY_FILE
+    i = main_content.find("\\begin{document}")
+    return main_content if i < 0 else main_content[:i] + hook + main_content[i:]
+
+def write_chunked_body(build_dir, content_items, start=0, end=None, changed_only=False, line_maps=None, stats=None):
+    """把正文各块写入 body-<内容哈希>.tex，body.tex 只负责逐个 \\include。
+    内容不变的块文件名不变、不重写，其 .aux 也得以保留；changed_only=True 时用 \\includeonly
+    只重新排版新增或变化的块 (预览用)。给出 line_maps (dict) 时填入各块文件的 LineMap。返回变化的块名列表。"""
+    body, names, changed, seen = [], [], [], {}
+    chunk_maps = []
+    for kind, text in get_latex_chunks(content_items, start, end, chunk_maps):
+        if kind == "toc": body.append(text); continue
+        h = hashlib.sha1(text.encode('utf-8')).hexdigest()[:12]
+        # 内容相同的块各自使用独立的文件与 aux
+        seen[h] = seen.get(h, 0) + 1
+        name = CHUNK_PREFIX + h + (f"-{seen[h]}" if seen[h] > 1 else "")
+        fp = os.path.join(build_dir, name + ".tex")
+        written = write_if_changed(fp, text)
+        if stats: stats.wrote(fp, written); stats.body_bytes += os.path.getsize(fp)
+        if written or not os.path.exists(os.path.join(build_dir, name + ".aux")): changed.append(name)
+        names.append(name)
+        body.append(rf"\include{{{name}}}")
+        if line_maps is not None: line_maps[name + ".tex"] = chunk_maps[len(names) - 1]
+
+    keep = set(names)
+    for fn in os.listdir(build_dir):
+        stem, ext = os.path.splitext(fn)
+        if stem.startswith(CHUNK_PREFIX) and ext in (".tex", ".aux") and stem not in keep:
+            os.unlink(os.path.join(build_dir, fn))
+
+    write_if_changed(os.path.join(build_dir, "body.tex"), "\n".join(body))
+    # 没有变化时排版全部块，保证预览完整
+    only = changed if changed_only and changed else []
+    write_if_changed(os.path.join(build_dir, INCLUDEONLY_FILE), rf"\includeonly{{{','.join(only)}}}" if only else "")
+    return changed
+
+# ==========================================
+# XeLaTeX 日志解析
+# ==========================================
+ERROR, WARNING = "错误", "警告"
+
+class LogIssue(collections.namedtuple("LogIssue", "level file line message item row source")):
+    """日志中的一条错误或警告。file/line 为 TeX 报告的位置；item/row 为对应的 content_items 下标与项内行号，
+    source 为来源内容文件名 (无法对应时均为 None)"""
+    __slots__ = ()
+    def __str__(self):
+        where = f"{self.file}:{self.line}" if self.line else (self.file or "?")
+        if self.item is not None:
+            where += f" -> 第 {self.item + 1} 项" + (f" ({self.source} 第 {self.row + 1} 条)" if self.source else "")
+        return f"{where}: {self.level}: {self.message}"
+
+# TeX 日志默认在 79 个字符处折行
+MAX_PRINT_LINE = 79
+_FILE_LINE_ERROR = re.compile(r'^(.*?\.(?:tex|sty|cls|ltx)):(\d+): (.*)')
+_CONTEXT_LINE = re.compile(r'^l\.(\d+)')
+_BOX_WARNING = re.compile(r'^(Overfull \\[hv]box .*?) (?:in paragraph at lines|in alignment at lines|detected at line) (\d+)')
+_INPUT_LINE = re.compile(r'on input line (\d+)\.')
+# "(文件名" 入栈、")" 出栈；其他括号也入栈 (记为 None) 以保持配对
+_LOG_FILE_TOKEN = re.compile(r'\((?:"([^"]+)"|([^\s()"]+\.[A-Za-z]+)(?=[\s)]|$))?|\)')
+
+def iter_log_lines(fp):
+    """逐行读取 .log 并拼接被折行的行"""
+    buf = ""
+    with open(fp, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if len(line) == MAX_PRINT_LINE: buf += line; continue
+            yield buf + line; buf = ""
+    if buf: yield buf
+
+def parse_log(fp):
+    """流式解析 XeLaTeX 的 .log，逐条产出 (级别, 文件, 行号, 说明)。
+    错误取自 -file-line-error 格式或 "! " 加随后的 "l.行号"；警告为 Overfull 盒子与带 "on input line" 的警告。
+    文件名按日志中的括号嵌套推算。"""
+    stack, pending = [], None
+    current = lambda: next((f for f in reversed(stack) if f), None)
+    for line in iter_log_lines(fp):
+        m = _CONTEXT_LINE.match(line)
+        if m:
+            # 出错上下文中是用户文本，其中的括号不计入文件栈
+            if pending: yield (ERROR, pending[0], int(m.group(1)), pending[1]); pending = None
+            continue
+        m = _FILE_LINE_ERROR.match(line)
+        if m:
+            if pending: yield (ERROR, pending[0], 0, pending[1])
+            pending = None
+            yield (ERROR, m.group(1), int(m.group(2)), m.group(3))
+            continue
+        if line.startswith("! "):
+            if pending: yield (ERROR, pending[0], 0, pending[1])
+            pending = (current(), line[2:])
+            continue
+        m = _BOX_WARNING.match(line)
+        if m:
+            yield (WARNING, current(), int(m.group(2)), m.group(1))
+            continue
+        if "Warning:" in line:
+            m = _INPUT_LINE.search(line)
+            if m: yield (WARNING, current(), int(m.group(1)), line.strip())
+        for m in _LOG_FILE_TOKEN.finditer(line):
+            if m.group(0) == ")":
+                if stack: stack.pop()
+            else:
+                stack.append(m.group(1) or m.group(2))
+    if pending: yield (ERROR, pending[0], 0, pending[1])
+
+def map_log_issues(entries, line_maps, content_items):
+    """把 parse_log 的条目按 line_maps ({文件名: LineMap}) 对应回内容项，返回 LogIssue 列表"""
+    issues = []
+    for level, fn, line, msg in entries:
+        lmap = line_maps.get(os.path.basename(fn)) if fn else None
+        hit = lmap.lookup(line) if lmap and line else None
+        item = row = source = None
+        if hit:
+            item, row = hit
+            it = content_items[item]
+            if isinstance(it, MultiLineContentItem): source = it.source_file
+        issues.append(LogIssue(level, fn, line, msg, item, row, source))
+    return issues
+
+# 影响下一遍排版结果的辅助文件 (交叉引用与 psalter.sty 的目录临时文件)
+CONVERGENCE_FILES = ["main.aux", "main-toc-latin.tmp", "main-toc-chinese.tmp"]
+MAX_XELATEX_PASSES = 4
+
+# 与排版结果无关的 aux 行：\relax 与内核写入的总页数 (psalter.sty 不引用总页数)
+_AUX_IGNORED = (b"\\relax", b"\\gdef \\@abspage@last")
+
+def convergence_files(build_dir):
+    """CONVERGENCE_FILES 加上分块编译时各块的 aux"""
+    chunk_aux = sorted(fn for fn in os.listdir(build_dir) if fn.startswith(CHUNK_PREFIX) and fn.endswith(".aux"))
+    return CONVERGENCE_FILES + chunk_aux
+
+def aux_state(build_dir):
+    """计算辅助文件的摘要；文件缺失视为空文件"""
+    h = hashlib.sha1()
+    for fn in convergence_files(build_dir):
+        h.update(fn.encode() + b"\0")
+        fp = os.path.join(build_dir, fn)
+        if not os.path.exists(fp): continue
+        with open(fp, 'rb') as f:
+            for line in f:
+                if not line.strip() or line.startswith(_AUX_IGNORED): continue
+                h.update(line)
+    return h.hexdigest()
+
+def discard_aux_files(build_dir):
+    for fn in convergence_files(build_dir):
+        try: os.unlink(os.path.join(build_dir, fn))
+        except OSError: pass
+
+# xelatex 每输出一页会打印 [页码]
+_PAGE_RE = re.compile(r'\[(\d+)(?=[\]\s{<])')
+
+def run_pass(cmd, build_dir, progress=None, cancel=None, pass_no=1):
+    """运行一遍 xelatex 并逐行读取输出，通过 progress(pass_no, page) 报告已输出的页数。返回 (returncode, stdout)"""
+    proc = subprocess.Popen(cmd, cwd=build_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            stdin=subprocess.DEVNULL, text=True, encoding='utf-8', errors='replace')
+    if cancel: cancel.attach(proc)
+    out = []
+    try:
+        for line in proc.stdout:
+            out.append(line)
+            if progress:
+                pages = _PAGE_RE.findall(line)
+                if pages: progress(pass_no, int(pages[-1]))
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if cancel: cancel.check()
+    return proc.returncode, "".join(out)
+
+# xelatex 结束时报告 "Output written on main.pdf (12 pages, ...)"
+_OUTPUT_PAGES_RE = re.compile(r'Output written on .*?\((\d+) pages?')
+
+# 引擎载入格式文件失败时在读入主文件之前输出的行 (版本不符、文件损坏等)
+_FORMAT_ERROR_RE = re.compile(r'^(?:---! .*\.fmt\b|Fatal format file error|I can\'t find the format file)', re.M)
+
+def format_load_failed(stdout):
+    """xelatex 是否在载入格式文件时就已失败 (只看读入 main.tex / main-fmt.tex 之前的输出)"""
+    return bool(_FORMAT_ERROR_RE.search(stdout.split("(./main", 1)[0]))
+
+def run_xelatex(build_dir, max_passes=MAX_XELATEX_PASSES, format_dir=None, progress=None, cancel=None, stats=None,
+                use_format=True):
+    """在 build_dir 中运行 xelatex 直到辅助文件收敛 (最多 max_passes 遍)，返回生成的 PDF 路径。
+    给出 format_dir 且 use_format 时使用 (并按需生成) 缓存在其中的预编译导言区格式；
+    格式载入失败时标记失效，并以 use_format=False 重新编译一次。
+    progress(pass_no, page, warning=None) 报告进度，达到遍数上限仍未收敛时以 warning 给出提示；
+    cancel 为 CancelToken，取消时抛出 CompileCancelled。
+    stats (BuildStats) 记录 format 与每一遍 (pass1, pass2 ...) 的耗时、遍数与页数。"""
+    stats = stats if stats is not None else BuildStats()
+    if shutil.which("xelatex") is None:
+        raise BuildError("未找到 xelatex 命令。")
+
+    with stats.stage("format"):
+        fmt = ensure_format(build_dir, format_dir) if format_dir and use_format else None
+    # -file-line-error：错误以 "文件:行号:" 开头，便于 parse_log 定位
+    # 使用格式时编译带 \endofdump 标记的 main-fmt.tex，jobname 仍为 main，辅助文件与 PDF 不变
+    cmd = ['xelatex', '-interaction=nonstopmode', '-file-line-error'] + \
+        ([f'-fmt={fmt}', '-jobname=main', FORMAT_MAIN] if fmt else ['main.tex'])
+
+    pdf_path = os.path.join(build_dir, "main.pdf")
+    pdf_mtime = os.path.getmtime(pdf_path) if os.path.exists(pdf_path) else None
+
+    state = aux_state(build_dir)
+    for pass_no in range(1, max_passes + 1):
+        if cancel: cancel.check()
+        try:
+            with stats.stage(f"pass{pass_no}"):
+                returncode, stdout = run_pass(cmd, build_dir, progress, cancel, pass_no)
+            stats.passes = pass_no
+        except CompileCancelled:
+            # 被中断的一遍只写了一半 aux
+            discard_aux_files(build_dir)
+            raise
+        if returncode != 0:
+            # 出错时写了一半的 aux 会污染下一次增量编译
+            discard_aux_files(build_dir)
+            if fmt and pass_no == 1 and format_load_failed(stdout):
+                # 格式文件与当前引擎不兼容：标记失效后不用格式重新编译，且只重试这一次
+                mark_format_failed(format_dir, fmt, stdout)
+                return run_xelatex(build_dir, max_passes, format_dir, progress, cancel, stats, use_format=False)
+            raise BuildError("LaTeX 编译出错", stdout)
+        m = _OUTPUT_PAGES_RE.search(stdout)
+        if m: stats.pages = int(m.group(1))
+        # 本遍读到的辅助文件与写出的一致，再跑一遍结果也不会变化
+        new_state = aux_state(build_dir)
+        if new_state == state: break
+        state = new_state
+    else:
+        # 最后一遍仍改写了辅助文件：页码引用或目录可能停留在上一遍
+        msg = f"xelatex 运行 {max_passes} 遍后辅助文件仍未收敛，页码引用或目录可能未更新"
+        stats.converged = False
+        stats.warnings.append(msg)
+        log.warning("%s: %s", build_dir, msg)
+        if progress: progress(max_passes, stats.pages, msg)
+
+    # build 目录会保留上次的 PDF，需确认本次确实重新生成
+    if not os.path.exists(pdf_path) or os.path.getmtime(pdf_path) == pdf_mtime:
+        raise BuildError("编译似乎成功但没生成 PDF")
+    stats.pdf_bytes = os.path.getsize(pdf_path)
+    return pdf_path
+
+def compile_project(base_dir, content_items, title_data=None, build_dir=None, clean=False, use_format=True,
+                    progress=None, cancel=None, start=0, end=None, chunked=False, changed_only=False, stats=None,
+                    dedup=False, image_dpi=None):
+    """完整编译流程，返回 PDF 路径；失败时抛出 BuildError。
+    start/end 只编译 content_items 的一段，默认使用独立的 build_preview/ 以免覆盖完整文档的 aux。
+    给出 stats (BuildStats) 时记录各阶段耗时与统计，失败时保留已完成阶段的数据。"""
+    if not content_items[start:end]: raise BuildError("内容为空，无法编译")
+    check_required_files(base_dir)
+    partial = start != 0 or end is not None
+    build_dir = build_dir or os.path.join(base_dir, "build_preview" if partial else "build")
+    line_maps = prepare_build_dir(base_dir, build_dir, content_items, title_data or DEFAULT_TITLE_DATA, clean,
+                                  start, end, chunked, changed_only, stats, dedup, image_dpi)
+    started = time.time()
+    try:
+        return run_xelatex(build_dir, format_dir=get_format_dir(base_dir) if use_format else None,
+                           progress=progress, cancel=cancel, stats=stats)
+    except CompileCancelled:
+        raise
+    except BuildError as e:
+        # 把日志中的错误与警告对应回内容项 (只读本次生成的日志)
+        log = os.path.join(build_dir, "main.log")
+        if os.path.exists(log) and os.path.getmtime(log) >= started - 1:
+            e.issues = map_log_issues(parse_log(log), line_maps, content_items)
+        raise
+
+def open_file(path):
+    """用系统默认程序打开文件"""
+    if platform.system() == 'Windows': os.startfile(path)
+    elif platform.system() == 'Darwin': subprocess.call(('open', path))
+    else: subprocess.call(('xdg-open', path))
+
+# ==========================================
+# 6. 预编译导言区格式 (mylatexformat)
+# ==========================================
+# 将 ctexart 与 psalter.sty 依赖的宏包预先存入 XeTeX 格式文件，省去每次编译的解析时间。
+# XeTeX 无法把已载入 OpenType 字体的状态存入格式：ctex 文档类以 fontset=none 载入，不设置字体，
+# 中西文字体全部由 \endofdump 之后的 psalter.sty 设置 (其中已指定正文与 \songti 所用字体)。
+# 格式只用于 build 目录中另行生成的 main-fmt.tex；不用格式时 main.tex 不含任何额外内容。
+FORMAT_DIR_NAME = "build_fmt"
+FORMAT_MAIN = "main-fmt.tex"
+_FORMAT_CLASS_OPTIONS = {"ctexart": "fontset=none", "ctexbook": "fontset=none", "ctexrep": "fontset=none"}
+_FORMAT_SKIP_PACKAGES = {"fontspec", "psalter"}
+# 只收录不带选项的宏包，避免与 psalter.sty 中的加载产生选项冲突
+_PKG_RE = re.compile(r'^\s*\\(?:RequirePackage|usepackage)\{([^}]*)\}', re.M)
+
+def get_format_dir(base_dir):
+    return os.path.join(base_dir, FORMAT_DIR_NAME)
+
+def format_packages(sty_text):
+    pkgs = []
+    for m in _PKG_RE.finditer(sty_text):
+        for p in m.group(1).split(','):
+            p = p.strip()
+            if p and p not in _FORMAT_SKIP_PACKAGES and p not in pkgs: pkgs.append(p)
+    return pkgs
+
+def add_format_preamble(main_content, sty_text):
+    """生成 main-fmt.tex 的内容：在 \\documentclass 之后预先加载宏包并插入 mylatexformat 的 \\endofdump 标记；
+    ctex 文档类加上 fontset=none，以免在存入格式的部分载入字体。没有 \\documentclass 时返回 None"""
+    m = re.search(r'^\\documentclass(?:\[([^]]*)\])?\{([^}]*)\}.*$', main_content, re.M)
+    if not m: return None
+    cls, opts = m.group(2).strip(), m.group(1) or ""
+    extra = _FORMAT_CLASS_OPTIONS.get(cls)
+    pre = f"\\PassOptionsToClass{{{extra}}}{{{cls}}}\n" if extra and extra.split("=")[0] not in opts else ""
+    pkgs = format_packages(sty_text)
+    block = (f"\n\\RequirePackage{{{','.join(pkgs)}}}" if pkgs else "") + "\n\\csname endofdump\\endcsname"
+    return main_content[:m.start()] + pre + main_content[m.start():m.end()] + block + main_content[m.end():]
+
+def write_format_main(build_dir):
+    """由 build 目录中的 main.tex 与 psalter.sty 生成 main-fmt.tex，返回是否可以使用格式"""
+    with open(os.path.join(build_dir, "main.tex"), 'r', encoding='utf-8') as f: main_content = f.read()
+    with open(os.path.join(build_dir, "psalter.sty"), 'r', encoding='utf-8') as f: sty_text = f.read()
+    content = add_format_preamble(main_content, sty_text)
+    if content is None: return False
+    write_if_changed(os.path.join(build_dir, FORMAT_MAIN), content)
+    return True
+
+def format_key(build_dir):
+    """格式文件的缓存键：psalter.sty、main-fmt.tex 导言区与 xelatex 可执行文件"""
+    h = hashlib.sha1()
+    with open(os.path.join(build_dir, "psalter.sty"), 'rb') as f: h.update(f.read())
+    with open(os.path.join(build_dir, FORMAT_MAIN), 'rb') as f: h.update(f.read().split(b"\\begin{document}")[0])
+    exe = shutil.which("xelatex")
+    st = os.stat(exe)
+    h.update(f"{exe}|{st.st_size}|{st.st_mtime_ns}".encode())
+    return h.hexdigest()[:16]
+
+def mark_format_failed(format_dir, name, log):
+    """记录无法使用的格式，之后的编译不再尝试"""
+    os.makedirs(format_dir, exist_ok=True)
+    with open(os.path.join(format_dir, name + ".failed"), 'w', encoding='utf-8') as f: f.write(log)
+    try: os.unlink(os.path.join(format_dir, name + ".fmt"))
+    except OSError: pass
+
+def ensure_format(build_dir, format_dir):
+    """返回可用于 xelatex -fmt 的格式名 (格式文件与 main-fmt.tex 已放入 build_dir)；无法生成时返回 None"""
+    if not write_format_main(build_dir): return None
+    name = "psalter-" + format_key(build_dir)
+    fmt_path = os.path.join(format_dir, name + ".fmt")
+    if os.path.exists(os.path.join(format_dir, name + ".failed")): return None
+
+    if not os.path.exists(fmt_path):
+        if not shutil.which("kpsewhich") or subprocess.run(
+                ['kpsewhich', 'mylatexformat.ltx'], capture_output=True).returncode != 0:
+            return None
+        os.makedirs(format_dir, exist_ok=True)
+        # 并行构建时各进程使用不同的临时名，生成后原子替换
+        tmp = f"{name}-{os.getpid()}"
+        cmd = ['xelatex', '-ini', '-interaction=nonstopmode', f'-jobname={tmp}', '&xelatex', 'mylatexformat.ltx', FORMAT_MAIN]
+        result = subprocess.run(cmd, cwd=build_dir, capture_output=True, text=True, encoding='utf-8', errors='replace')
+        built = os.path.join(build_dir, tmp + ".fmt")
+        if result.returncode != 0 or not os.path.exists(built):
+            mark_format_failed(format_dir, name, result.stdout)
+            return None
+        shutil.move(built, fmt_path + f".{os.getpid()}")
+        os.replace(fmt_path + f".{os.getpid()}", fmt_path)
+        for fn in os.listdir(format_dir):
+            if fn.startswith("psalter-") and fn.endswith(".fmt") and fn != name + ".fmt":
+                try: os.unlink(os.path.join(format_dir, fn))
+                except OSError: pass
+
+    for fn in os.listdir(build_dir):
+        if fn.startswith("psalter-") and fn.endswith(".fmt") and fn != name + ".fmt":
+            try: os.unlink(os.path.join(build_dir, fn))
+            except OSError: pass
+    sync_file(fmt_path, os.path.join(build_dir, name + ".fmt"))
+    return name
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_project.py - 紧凑的二进制工程格式 (.psproj)
+相对 CSV 工程文件：
+1. 字符串表去重 (光荣颂、对经等重复文本只存一次)。
+2. 内容按段存放，并带有段索引；打开时只读取索引，段内容在访问时才解码 (mmap)。
+
+文件布局 (小端)：
+    头部      magic "PSPJ", u16 版本, u16 保留, u32 字符串数, u32 段数, u32 内容项数,
+              u64 字符串表偏移, u64 段索引偏移, u64 行数数组偏移
+    段数据    每个内容项：u8 种类 (0 单行 / 1 多行)，多行时 u32 来源文件名，u32 行数，
+              随后每行 4 个 u32 字符串编号 (type, latin, chinese, arg)
+    字符串表  u32 偏移 × (字符串数 + 1)，随后为 UTF-8 文本
+    段索引    每段 u64 偏移, u32 长度, u32 首项下标, u32 项数
+    行数数组  每个内容项占预览的行数 (u32)，供视图在不解码内容的情况下计算行号
+"""
+
+import os, mmap, struct, bisect
+from collections.abc import MutableSequence
+
+from psalter_core import ContentItem, MultiLineContentItem, save_project_csv, load_project_csv, open_atomic
+
+MAGIC = b"PSPJ"
+VERSION = 1
+PROJECT_EXT = ".psproj"
+_HEADER = struct.Struct("<4sHHIIIQQQ")
+_INDEX = struct.Struct("<QIII")
+# 每段最多的内容项数；分页与目录起始处也会另起一段
+SECTION_ITEMS = 256
+
+class ProjectFormatError(Exception):
+    """不是有效的 .psproj 文件"""
+
+# ==========================================
+# 写入
+# ==========================================
+def split_sections(content_items):
+    """在 pagebreak / tocstart 之后或满 SECTION_ITEMS 项时分段，返回各段的 (首项下标, 项数)"""
+    sections, start = [], 0
+    for i, item in enumerate(content_items):
+        if item.item_type in ('pagebreak', 'tocstart') or i + 1 - start >= SECTION_ITEMS:
+            sections.append((start, i + 1 - start)); start = i + 1
+    if start < len(content_items): sections.append((start, len(content_items) - start))
+    return sections
+
+def save_project_bin(fp, content_items):
+    # 延迟加载的列表仍映射着源文件：先整体解码并释放映射，才能覆盖保存到同一路径
+    if isinstance(content_items, LazyContentList): content_items.release()
+    content_items = list(content_items)
+    strings, ids = [], {}
+    def sid(s):
+        i = ids.get(s)
+        if i is None: i = ids[s] = len(strings); strings.append(s)
+        return i
+
+    data, index = bytearray(), []
+    for start, count in split_sections(content_items):
+        offset = _HEADER.size + len(data)
+        for item in content_items[start:start + count]:
+            if isinstance(item, MultiLineContentItem):
+                data += struct.pack("<BII", 1, sid(item.source_file), len(item.items))
+                rows = item.items
+            else:
+                data += struct.pack("<BI", 0, 1)
+                rows = [item]
+            for r in rows:
+                data += struct.pack("<4I", sid(r.item_type), sid(r.latin), sid(r.chinese), sid(r.arg))
+        index.append((offset, _HEADER.size + len(data) - offset, start, count))
+
+    blobs = [s.encode('utf-8') for s in strings]
+    offsets, pos = [], 0
+    for b in blobs: offsets.append(pos); pos += len(b)
+    offsets.append(pos)
+    strtab = struct.pack(f"<{len(offsets)}I", *offsets)
+    strtab_offset = _HEADER.size + len(data)
+    index_offset = strtab_offset + len(strtab) + pos
+    counts = struct.pack(f"<{len(content_items)}I", *(item.line_count for item in content_items))
+    counts_offset = index_offset + _INDEX.size * len(index)
+
+    with open_atomic(fp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(strings), len(index), len(content_items),
+                             strtab_offset, index_offset, counts_offset))
+        f.write(data)
+        f.write(strtab)
+        for b in blobs: f.write(b)
+        for entry in index: f.write(_INDEX.pack(*entry))
+        f.write(counts)
+
+# ==========================================
+# 读取 (按段延迟解码)
+# ==========================================
+class ProjectReader:
+    """以 mmap 打开 .psproj，只解析头部与索引；段与字符串在首次访问时解码并缓存"""
+    def __init__(self, fp):
+        with open(fp, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(fp) else b""
+        if len(self._mm) < _HEADER.size:
+            raise ProjectFormatError("文件过短")
+        (magic, version, _, self.n_strings, self.n_sections, self.n_items,
+         self._strtab, index_offset, counts_offset) = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC: raise ProjectFormatError("不是 .psproj 工程文件")
+        if version > VERSION: raise ProjectFormatError(f"不支持的工程文件版本: {version}")
+        self._str_base = self._strtab + 4 * (self.n_strings + 1)
+        self._strings = {}
+        self.index = [_INDEX.unpack_from(self._mm, index_offset + k * _INDEX.size) for k in range(self.n_sections)]
+        self._starts = [e[2] for e in self.index]
+        self._sections = {}
+        self.line_counts = struct.unpack_from(f"<{self.n_items}I", self._mm, counts_offset)
+
+    def string(self, i):
+        s = self._strings.get(i)
+        if s is None:
+            a, b = struct.unpack_from("<II", self._mm, self._strtab + 4 * i)
+            s = self._strings[i] = self._mm[self._str_base + a:self._str_base + b].decode('utf-8')
+        return s
+
+    def section_of(self, i):
+        """第 i 个内容项所在的段号"""
+        return bisect.bisect_right(self._starts, i) - 1
+
+    def section_items(self, k):
+        items = self._sections.get(k)
+        if items is not None: return items
+        offset, length, _, count = self.index[k]
+        mm, s, pos, items = self._mm, self.string, offset, []
+        for _ in range(count):
+            kind = mm[pos]
+            if kind == 1:
+                src, n = struct.unpack_from("<II", mm, pos + 1); pos += 9
+            else:
+                (n,) = struct.unpack_from("<I", mm, pos + 1); pos += 5
+            rows = []
+            for _ in range(n):
+                t, l, c, a = struct.unpack_from("<4I", mm, pos); pos += 16
+                rows.append(ContentItem(s(t), s(l), s(c), s(a)))
+            items.append(MultiLineContentItem(s(src), rows) if kind == 1 else rows[0])
+        self._sections[k] = items
+        return items
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap): self._mm.close()
+
+class LazyContentList(MutableSequence):
+    """按段延迟解码的内容列表。只读访问 (len、下标、切片、遍历) 只解码涉及的段；
+    第一次修改时整体解码为普通列表。"""
+    def __init__(self, reader):
+        self._reader = reader
+        self._list = None
+
+    def _materialize(self):
+        if self._list is None:
+            self._list = [item for k in range(self._reader.n_sections) for item in self._reader.section_items(k)]
+            self._reader.close()
+        return self._list
+
+    def __len__(self):
+        return len(self._list) if self._list is not None else self._reader.n_items
+
+    def __getitem__(self, i):
+        if self._list is not None: return self._list[i]
+        if isinstance(i, slice):
+            return [self[k] for k in range(*i.indices(len(self)))]
+        if i < 0: i += len(self)
+        if not 0 <= i < len(self): raise IndexError(i)
+        k = self._reader.section_of(i)
+        return self._reader.section_items(k)[i - self._reader.index[k][2]]
+
+    def __iter__(self):
+        if self._list is not None: return iter(self._list)
+        return (item for k in range(self._reader.n_sections) for item in self._reader.section_items(k))
+
+    def release(self):
+        """整体解码并关闭文件映射，之后与普通列表相同"""
+        self._materialize()
+
+    def __setitem__(self, i, v): self._materialize()[i] = v
+    def __delitem__(self, i): del self._materialize()[i]
+    def insert(self, i, v): self._materialize().insert(i, v)
+    def clear(self): self._materialize().clear()
+
+    def line_counts(self):
+        """各内容项占预览的行数，未解码时直接取自文件"""
+        if self._list is not None: return [item.line_count for item in self._list]
+        return self._reader.line_counts
+
+def load_project_bin(fp):
+    return LazyContentList(ProjectReader(fp))
+
+# ==========================================
+# 按扩展名选择格式
+# ==========================================
+def is_project_file(fn):
+    return fn.lower().endswith(('.csv', PROJECT_EXT))
+
+def load_project(fp):
+    return load_project_bin(fp) if fp.lower().endswith(PROJECT_EXT) else load_project_csv(fp)
+
+def save_project(fp, content_items):
+    if fp.lower().endswith(PROJECT_EXT): save_project_bin(fp, content_items)
+    else: save_project_csv(fp, content_items)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_search.py - 内容库全文检索 (SQLite FTS5)
+1. 索引 content/ 下各分类中每一行内容 (分类、文件、行号、类型、拉丁文、中文)。
+2. 按文件 mtime/size 增量更新，只重新索引变化的文件。
+3. 拉丁文忽略重音与连字 (Dóminum = Dominum，cæli = caeli)，不区分大小写；
+   中文逐字切分，连续的汉字按短语匹配。
+
+用法示例：
+    python -m psalter_search Dominum
+    python -m psalter_search "in lege Domini" 教令 --category psalms
+"""
+
+import argparse, os, re, sqlite3, unicodedata, collections, time
+import sys
+
+from psalter_core import FileContentLoader, get_application_path, iter_content_lines
+
+INDEX_DIR_NAME = "build_index"
+INDEX_FILE = "search.db"
+# 表结构或切分规则变化时递增，旧索引会被丢弃重建
+SCHEMA_VERSION = 1
+DEFAULT_LIMIT = 200
+
+SearchHit = collections.namedtuple("SearchHit", "category file line item_type latin chinese")
+
+# ==========================================
+# 文本规范化
+# ==========================================
+_LIGATURES = str.maketrans({'æ': 'ae', 'œ': 'oe', 'Æ': 'ae', 'Œ': 'oe'})
+# 中日韩文字：部首、假名、统一汉字及其扩展区、兼容汉字
+_CJK = re.compile(r'([⺀-鿿豈-﫿\U00020000-\U0003ffff])')
+_TOKEN = re.compile(r'[^\W_]+')
+
+def fold_text(text):
+    """去掉重音并展开连字，转为小写"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).translate(_LIGATURES)
+
+def index_text(text):
+    """写入索引的形式：规范化后，每个汉字单独成词"""
+    return _CJK.sub(r' \1 ', fold_text(text))
+
+def build_query(text):
+    """把用户输入转为 FTS5 查询：以空白分隔的各词须同时出现 (引号内为一个词)；
+    词内的多个字或单词按短语匹配，末尾的拉丁单词按前缀匹配 (Domin 可匹配 Dominus)"""
+    terms = []
+    for quoted, word in re.findall(r'"([^"]*)"|(\S+)', text):
+        tokens = _TOKEN.findall(index_text(quoted or word))
+        if not tokens: continue
+        phrase = '"' + " ".join(tokens) + '"'
+        terms.append(phrase if _CJK.match(tokens[-1]) else phrase + "*")
+    return " AND ".join(terms)
+
+# ==========================================
+# 索引
+# ==========================================
+def get_index_path(base_dir):
+    return os.path.join(base_dir, INDEX_DIR_NAME, INDEX_FILE)
+
+_SCHEMA = """
+CREATE TABLE files (id INTEGER PRIMARY KEY, category TEXT NOT NULL, name TEXT NOT NULL,
+                    mtime INTEGER NOT NULL, size INTEGER NOT NULL, UNIQUE (category, name));
+CREATE TABLE lines (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, line INTEGER NOT NULL,
+                    item_type TEXT NOT NULL, latin TEXT NOT NULL, chinese TEXT NOT NULL);
+CREATE INDEX lines_file ON lines (file_id);
+CREATE VIRTUAL TABLE lines_fts USING fts5 (latin, chinese, tokenize = 'unicode61 remove_diacritics 2');
+"""
+
+class SearchIndex:
+    """content/ 的全文索引。update() 增量同步文件，search() 查询；连接只能在创建它的线程中使用"""
+    def __init__(self, content_dir, db_path):
+        self.content_dir = content_dir
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.db = sqlite3.connect(db_path)
+        self.db.create_function("index_text", 1, index_text, deterministic=True)
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION: self._create()
+
+    def _create(self):
+        with self.db:
+            for (name,) in self.db.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('files', 'lines', 'lines_fts')").fetchall():
+                self.db.execute(f"DROP TABLE {name}")
+            self.db.executescript(_SCHEMA)
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _drop_file(self, file_id):
+        self.db.execute("DELETE FROM lines_fts WHERE rowid IN (SELECT id FROM lines WHERE file_id = ?)", (file_id,))
+        self.db.execute("DELETE FROM lines WHERE file_id = ?", (file_id,))
+        self.db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def _add_file(self, cat, entry):
+        st = entry.stat()
+        try: rows = [(n, item.item_type, item.latin, item.chinese) for n, item in iter_content_lines(entry.path)]
+        except (OSError, UnicodeDecodeError): rows = []
+        file_id = self.db.execute("INSERT INTO files (category, name, mtime, size) VALUES (?, ?, ?, ?)",
+                                  (cat, entry.name, st.st_mtime_ns, st.st_size)).lastrowid
+        self.db.executemany("INSERT INTO lines (file_id, line, item_type, latin, chinese) VALUES (?, ?, ?, ?, ?)",
+                            ((file_id,) + r for r in rows))
+        self.db.execute("INSERT INTO lines_fts (rowid, latin, chinese) "
+                        "SELECT id, index_text(latin), index_text(chinese) FROM lines WHERE file_id = ?", (file_id,))
+
+    def update(self):
+        """按文件 mtime/size 同步索引，返回 (重新索引的文件数, 移除的文件数)"""
+        known = {(cat, name): (fid, sig) for fid, cat, name, *sig in
+                 self.db.execute("SELECT id, category, name, mtime, size FROM files")}
+        seen, changed = set(), 0
+        with self.db:
+            for cat in FileContentLoader.CATEGORIES:
+                try: entries = list(os.scandir(os.path.join(self.content_dir, cat)))
+                except OSError: continue
+                for entry in entries:
+                    if not entry.name.endswith('.txt') or not entry.is_file(): continue
+                    key = (cat, entry.name); seen.add(key)
+                    st, old = entry.stat(), known.get(key)
+                    if old and old[1] == [st.st_mtime_ns, st.st_size]: continue
+                    if old: self._drop_file(old[0])
+                    self._add_file(cat, entry); changed += 1
+            removed = known.keys() - seen
+            for key in removed: self._drop_file(known[key][0])
+        return changed, len(removed)
+
+    def rebuild(self):
+        self._create()
+        return self.update()
+
+    def search(self, text, category=None, limit=DEFAULT_LIMIT):
+        """按相关度返回 SearchHit 列表；查询为空时返回 []"""
+        query = build_query(text)
+        if not query: return []
+        sql = ("SELECT f.category, f.name, l.line, l.item_type, l.latin, l.chinese FROM lines_fts "
+               "JOIN lines l ON l.id = lines_fts.rowid JOIN files f ON f.id = l.file_id WHERE lines_fts MATCH ?")
+        args = [query]
+        if category: sql += " AND f.category = ?"; args.append(category)
+        sql += " ORDER BY rank, f.category, f.name, l.line LIMIT ?"; args.append(limit)
+        return [SearchHit(*row) for row in self.db.execute(sql, args)]
+
+    def close(self):
+        self.db.close()
+
+def open_index(base_dir):
+    """打开 base_dir 下 content/ 的索引并同步到最新"""
+    index = SearchIndex(os.path.join(base_dir, "content"), get_index_path(base_dir))
+    index.update()
+    return index
+
+# ==========================================
+# 命令行
+# ==========================================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(prog="psalter_search", description="在内容库中检索拉丁文或中文 (忽略重音)")
+    p.add_argument("query", nargs="+", help="检索词；多个词须同时出现，引号内按短语匹配")
+    p.add_argument("--category", choices=list(FileContentLoader.CATEGORIES), help="只检索某一分类")
+    p.add_argument("--base-dir", default=get_application_path(), help="包含 content/ 的目录 (默认为程序目录)")
+    p.add_argument("-n", "--limit", type=int, default=DEFAULT_LIMIT, help=f"最多输出的结果数 (默认 {DEFAULT_LIMIT})")
+    p.add_argument("--rebuild", action="store_true", help="丢弃现有索引并重建")
+    return p.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = time.perf_counter()
+    index = SearchIndex(os.path.join(args.base_dir, "content"), get_index_path(args.base_dir))
+    changed, removed = index.rebuild() if args.rebuild else index.update()
+    indexed = time.perf_counter()
+    hits = index.search(" ".join(args.query), args.category, args.limit)
+    index.close()
+    for h in hits:
+        print(f"{h.category}/{h.file}:{h.line}: {h.item_type}: {h.latin} | {h.chinese}")
+    print(f"{len(hits)} 条结果 (更新索引 {changed} 个文件，移除 {removed} 个，{indexed - start:.3f}s；"
+          f"检索 {(time.perf_counter() - indexed) * 1000:.1f}ms)", file=sys.stderr)
+    return 0 if hits else 1
+
+if __name__ == '__main__': sys.exit(main())
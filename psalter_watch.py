@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+psalter_watch.py - 监视模式：内容、样式或工程文件变化后自动重新编译
+1. 轮询 content/、images/、psalter.sty、main.tex 与工程文件的 (mtime, size)，不依赖第三方库。
+2. 连续保存在静默 DEBOUNCE_SECONDS 秒后合并为一批，只触发一次编译。
+3. 内容文件变化时只通过 FileContentLoader 重新读取这些文件，替换内容项中来自它们的行，其余项原样保留；
+   组装生成的圣咏项 (前后带对经) 只替换其中的圣咏部分；复制进圣咏项的对经文字不跟踪，改动对经文件后需重新组装。
+   未被工程引用的内容文件与图片变化不触发编译。
+
+命令行入口见 psalter_build.py --watch，界面中勾选"监视并自动编译"。
+"""
+
+import os, time
+
+from psalter_core import FileContentLoader, MultiLineContentItem, BuildError, iter_flat_items
+from psalter_project import ProjectFormatError, load_project
+
+WATCH_DIRS = ["content", "images"]
+WATCH_FILES = ["psalter.sty", "main.tex"]
+# 轮询间隔与防抖时间 (秒)：最后一次变化后静默这么久才交出整批变化
+POLL_INTERVAL = 0.3
+DEBOUNCE_SECONDS = 0.5
+
+def scan_tree(path, state):
+    """递归记录目录下各文件的 (mtime, size)。Windows 上 scandir 的 stat 不需要额外的系统调用"""
+    try: entries = list(os.scandir(path))
+    except OSError: return
+    for entry in entries:
+        try:
+            if entry.is_dir(): scan_tree(entry.path, state)
+            else:
+                st = entry.stat()
+                state[entry.path] = (st.st_mtime_ns, st.st_size)
+        except OSError: continue
+
+def find_rows(rows, part):
+    """part 在 rows 中连续出现的位置，没有时返回 None"""
+    n = len(part)
+    if not n: return None
+    for i in range(len(rows) - n + 1):
+        if rows[i] == part[0] and rows[i:i + n] == part: return i
+    return None
+
+def item_rows(item): return [tuple(r) for r in item.to_csv_rows()]
+
+class ProjectWatcher:
+    """监视一个工程用到的文件。poll() 返回防抖后的一批变化路径，apply() 把变化应用到内容项"""
+    def __init__(self, base_dir, project=None, loader=None, debounce=DEBOUNCE_SECONDS):
+        self.base_dir, self.debounce = base_dir, debounce
+        self.content_dir = os.path.join(base_dir, "content")
+        self.loader = loader or FileContentLoader(self.content_dir)
+        self.project = os.path.abspath(project) if project else None
+        # 来源文件名 -> 分类 (无法对应到文件时为 None)；(分类, 文件名) -> 上次读到的各行
+        self.sources, self.snapshots = {}, {}
+        self.pending, self.last_change = set(), 0.0
+        self.state = self.scan()
+
+    def scan(self):
+        state = {}
+        for d in WATCH_DIRS: scan_tree(os.path.join(self.base_dir, d), state)
+        for fp in WATCH_FILES + ([self.project] if self.project else []):
+            fp = os.path.join(self.base_dir, fp)
+            try:
+                st = os.stat(fp)
+                state[fp] = (st.st_mtime_ns, st.st_size)
+            except OSError: continue
+        return state
+
+    def track(self, content_items):
+        """记录内容项引用的内容文件及其当前内容，文件变化时据此找出要替换的行。
+        多行项只记录文件名：取内容与之吻合的分类；工程中保存的是旧版本时，以该项本身为旧内容，下次文件变化时整体替换"""
+        for item in content_items:
+            if not isinstance(item, MultiLineContentItem) or item.source_file in self.sources: continue
+            fn, rows, cat = item.source_file, item_rows(item), None
+            cats = [c for c in FileContentLoader.CATEGORIES if os.path.isfile(os.path.join(self.content_dir, c, fn))]
+            for c in cats:
+                old = [tuple(i.to_csv_row()) for i in self.loader.load_file_content(c, fn)]
+                if find_rows(rows, old) is not None:
+                    cat = c; self.snapshots[(c, fn)] = old; break
+            else:
+                if cats: cat = cats[0]; self.snapshots[(cat, fn)] = rows
+            self.sources[fn] = cat
+
+    def set_project(self, project, content_items=()):
+        """打开、切换或重新保存工程文件后调用：自己写出的工程文件不视为变化"""
+        self.project = os.path.abspath(project) if project else None
+        self.state = self.scan()
+        self.pending.discard(self.project)
+        self.track(content_items)
+
+    def poll(self, now=None):
+        """扫描一次，返回自上次交出以来的全部变化路径；仍有新变化或未静默够 debounce 秒时返回空集合"""
+        now = time.monotonic() if now is None else now
+        state = self.scan()
+        changed = {p for p in state.keys() | self.state.keys() if state.get(p) != self.state.get(p)}
+        self.state = state
+        if changed:
+            self.pending |= changed; self.last_change = now
+            return set()
+        if not self.pending or now - self.last_change < self.debounce: return set()
+        batch, self.pending = self.pending, set()
+        return batch
+
+    def apply(self, content_items, paths):
+        """把一批变化应用到 content_items，返回 (内容项列表, 是否需要重新编译, 替换的内容项数)。
+        工程文件变化时整体重新读取；否则只替换来自内容确有变化的文件的行，没有替换时原样返回 content_items"""
+        files, rebuild = set(), False
+        content_prefix, images_prefix = self.content_dir + os.sep, os.path.join(self.base_dir, "images") + os.sep
+        for p in paths:
+            if p.startswith(content_prefix):
+                cat, _, fn = os.path.relpath(p, self.content_dir).partition(os.sep)
+                self.loader.invalidate(cat, fn)
+                files.add((cat, fn))
+            elif p.startswith(images_prefix):
+                rel = os.path.relpath(p, self.base_dir).replace(os.sep, '/')
+                rebuild = rebuild or any(i.item_type == "image" and i.latin == rel for i in iter_flat_items(content_items))
+            elif p != self.project: rebuild = True
+
+        if self.project in paths:
+            try: items = list(load_project(self.project))
+            except (OSError, UnicodeDecodeError, ProjectFormatError) as e:
+                raise BuildError(f"无法读取工程文件: {e}")
+            self.sources.clear(); self.snapshots.clear()
+            self.track(items)
+            return items, True, len(items)
+
+        # 来源文件名 -> (旧行, 新的 MultiLineContentItem)；文件被删除或清空时保留原内容
+        changes = {}
+        for cat, fn in files:
+            if self.sources.get(fn) != cat: continue
+            new = self.loader.load_file_as_multiline(cat, fn)
+            if new is None: continue
+            old, rows = self.snapshots[(cat, fn)], item_rows(new)
+            if rows == old: continue
+            changes[fn] = (old, new)
+            self.snapshots[(cat, fn)] = rows
+        if not changes: return content_items, rebuild, 0
+
+        # 组装的工程中同一对象会出现多次，按对象只替换一次，保持共享
+        items, replaced, n = list(content_items), {}, 0
+        for k, item in enumerate(items):
+            change = changes.get(item.source_file) if isinstance(item, MultiLineContentItem) else None
+            if change is None: continue
+            new = replaced.get(id(item))
+            if new is None:
+                old, mi = change
+                i = find_rows(item_rows(item), old)
+                if i is None: continue
+                new = mi if len(old) == item.line_count else \
+                    MultiLineContentItem(item.source_file, item.items[:i] + mi.items + item.items[i + len(old):])
+                replaced[id(item)] = new
+            items[k] = new; n += 1
+        return (items if n else content_items), rebuild or n > 0, n
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+test_chunks.py - 分块正文与整篇正文等价 (python -m pytest)
+把各块按 \\include 的效果 (前后各一个 \\clearpage) 拼接，与 get_latex_content 中展开后的分页命令逐行比较；
+连续的 \\clearpage 只算一次，两次分页之间的空 paracol 环境 (空白页) 必须保留。
+"""
+
+import pytest
+
+from psalter_core import ContentItem, get_latex_chunks, get_latex_content
+
+PAGE_BREAKS = {r"\psPageBreak": [r"\end{paracol}", r"\clearpage", r"\begin{paracol}{2}"],
+               r"\psSinglePageBreak": [r"\clearpage"]}
+
+def normalize(lines):
+    out = []
+    for line in lines:
+        if line == r"\clearpage" and out and out[-1] == line: continue
+        out.append(line)
+    while out and out[0] == r"\clearpage": out.pop(0)
+    while out and out[-1] == r"\clearpage": out.pop()
+    return out
+
+def unchunked(items):
+    return normalize(l for line in get_latex_content(items).split("\n") for l in PAGE_BREAKS.get(line, [line]))
+
+def chunked(items):
+    lines = []
+    for kind, text in get_latex_chunks(items):
+        assert kind == "chunk"
+        lines += [r"\clearpage"] + (text.split("\n") if text else []) + [r"\clearpage"]
+    return normalize(lines)
+
+def row(n): return ContentItem("h1cap", f"Titulus {n}", f"標題 {n}")
+def br(): return ContentItem("pagebreak")
+def sc(): return ContentItem("singlecol")
+
+@pytest.mark.parametrize("items", [
+    [row(1), br(), br(), row(2)],
+    [row(1), br(), br(), br(), row(2), br()],
+    [br(), br(), row(1)],
+    [row(1), br(), br()],
+    [sc(), row(1), br(), br(), row(2), sc(), br(), br(), row(3)],
+], ids=["double", "triple-trailing", "leading", "trailing", "singlecol"])
+def test_chunks_match_content(items):
+    assert chunked(items) == unchunked(items)
+
+def test_blank_page_kept():
+    texts = [text for _, text in get_latex_chunks([row(1), br(), br(), row(2)])]
+    assert len(texts) == 3 and texts[1] == "\\begin{paracol}{2}\n\\end{paracol}"
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+test_escaping.py - 内容转义的回归测试 (python -m pytest)
+1. content/ 语料逐项渲染：每个参数都不含未转义的特殊字符，去掉转义后还原为原文。
+2. 写入目录、页眉与 xstring 的标题与集祷经：psalter.sty 按原样传递转义后的文本。
+3. 按旧写法手工转义的内容渲染结果不变，并由 psalter_check 报告。
+4. 装有 xelatex 时实际编译含特殊字符的标题，检查目录文件与 PDF。
+"""
+
+import os, re, shutil, string
+
+import pytest
+
+from psalter_core import (
+    ContentItem, FileContentLoader, RAW_FIELDS, TEX_MAPPING, BuildError, compile_project, escape_latex,
+    get_application_path, get_latex_content, render_item,
+)
+from psalter_check import ERROR, check_row
+
+BASE_DIR = get_application_path()
+SPECIALS = "Ps_118 {A} 50% & #1 $2"
+_UNESCAPED = re.compile(r"(?<!\\)[%&#_$]")
+# 写入目录并设置页眉的标题类型
+TOC_TYPES = ("h1cap", "h1lowercase")
+
+def command_args(line):
+    """\\cmd{a}{b}... 顶层花括号中的各个参数；\\{ \\} 等转义字符不参与配对"""
+    args, depth, cur, i = [], 0, [], 0
+    while i < len(line):
+        ch = line[i]
+        if ch == "\\" and i + 1 < len(line):
+            if depth: cur.append(line[i:i + 2])
+            i += 2; continue
+        if ch == "{":
+            if depth: cur.append(ch)
+            depth += 1
+        elif ch == "}":
+            depth -= 1
+            assert depth >= 0, f"花括号不配对: {line}"
+            if depth: cur.append(ch)
+            else: args.append("".join(cur)); cur = []
+        elif depth: cur.append(ch)
+        i += 1
+    assert depth == 0, f"花括号不配对: {line}"
+    return args
+
+def unescape(text): return re.sub(r"\\([%&#_{}$])", r"\1", text)
+
+def corpus_items():
+    loader = FileContentLoader(os.path.join(BASE_DIR, "content"))
+    items = []
+    for cat, files in loader.get_available_files().items():
+        for _, fn in files: items += loader.load_file_content(cat, fn)
+    return items
+
+def check_rendered(item, single):
+    line = render_item(item, single)
+    # 单栏模板只用到部分字段
+    used = {name for _, name, _, _ in string.Formatter().parse(TEX_MAPPING[item.item_type][single]) if name}
+    used -= set(RAW_FIELDS.get(item.item_type, ()))
+    fields = [f for k, f in (('l', item.latin), ('c', item.chinese), ('a', item.arg)) if f and k in used]
+    args = command_args(line)
+    for arg in args: assert not _UNESCAPED.search(arg), f"{item.item_type}: 未转义 {arg!r}"
+    for f in fields:
+        assert escape_latex(f) in line, f"{item.item_type}: {f!r} 未按转义写出: {line}"
+        assert any(f in unescape(a) for a in args), f"{item.item_type}: {f!r} 还原不出原文: {line}"
+
+def test_corpus_renders_escaped():
+    items = corpus_items()
+    assert items
+    for item in items:
+        if item.item_type not in TEX_MAPPING: continue
+        for single in (False, True): check_rendered(item, single)
+    # 整篇生成 (含分栏控制) 不出错
+    assert get_latex_content(items)
+
+def test_corpus_has_special_characters():
+    # 语料中的 Ps 118 标题含下划线，是转义的实际用例
+    assert any(escape_latex(f) != f for i in corpus_items() for f in (i.latin, i.chinese, i.arg))
+
+@pytest.mark.parametrize("item_type", TOC_TYPES)
+@pytest.mark.parametrize("single", (False, True))
+def test_toc_headers_escaped(item_type, single):
+    line = render_item(ContentItem(item_type, SPECIALS, "聖詠_百十八 {甲} 50%"), single)
+    assert [unescape(a) for a in command_args(line)] == [SPECIALS, "聖詠_百十八 {甲} 50%"]
+    assert r"Ps\_118 \{A\} 50\% \& \#1 \$2" in line
+
+def test_collect_escaped():
+    line = render_item(ContentItem("collect", "Deus_meus, qui 100% {omnia}", "天主"), False)
+    assert command_args(line)[0] == r"Deus\_meus, qui 100\% \{omnia\}"
+
+def sty_command(name):
+    """psalter.sty 中 \\newcommand{name} 的定义文本"""
+    with open(os.path.join(BASE_DIR, "psalter.sty"), encoding='utf-8') as f: sty = f.read()
+    m = re.search(r"\\newcommand\{\\" + name + r"\}(?:\[\d\])?\{%\n(.*?)\n\}", sty, re.S)
+    assert m, name
+    return m.group(1)
+
+def test_sty_writes_toc_titles_unexpanded():
+    # 转义后的 \_ \{ \} 是 robust 命令，在 \immediate\write 中展开会出错
+    body = sty_command("psWriteTocEntry")
+    writes = re.findall(r"\\immediate\\write\\\w+\{(.*)\}%", body)
+    assert len(writes) == 4
+    for w in writes:
+        assert re.search(r"\{\\unexpanded\{#[23]\}\}\{#4\}$", w), w
+
+def test_sty_splits_collect_without_expansion():
+    body = sty_command("psCollectFirstWord")
+    assert body.index(r"\noexpandarg") < body.index(r"\StrBefore") < body.index(r"\restoreexpandmode")
+
+def test_sty_header_marks_not_written():
+    # 页眉经 \markboth (受保护展开) 与 \gdef 保存，不经过 \write 或 \edef
+    body = sty_command("psSetHeaderTitle")
+    assert r"\write" not in body and r"\edef" not in body and r"\xdef" not in body
+
+@pytest.mark.skipif(shutil.which("xelatex") is None, reason="需要 xelatex")
+def test_compile_special_headers(tmp_path):
+    for fn in ("main.tex", "psalter.sty"): shutil.copy(os.path.join(BASE_DIR, fn), tmp_path)
+    items = [ContentItem("tocstart"), ContentItem("h1cap", SPECIALS, "聖詠_百十八 50%"),
+             ContentItem("h1lowercase", "Sub_titulus & #2", "副_題"),
+             ContentItem("collect", "Deus_meus, qui 100% {omnia}", "天主")]
+    try: pdf = compile_project(str(tmp_path), items, use_format=False)
+    except BuildError as e: pytest.fail(f"{e}\n{e.log[-3000:]}")
+    assert os.path.getsize(pdf) > 0
+    with open(os.path.join(tmp_path, "build", "main-toc-latin.tmp"), encoding='utf-8') as f: toc = f.read()
+    assert r"Ps\_118 \{A\} 50\% \& \#1 \$2" in toc and r"Sub\_titulus \& \#2" in toc
+
+def pre_escape(item):
+    """按引入自动转义之前的写法手工转义各字段"""
+    return ContentItem(item.item_type, escape_latex(item.latin), escape_latex(item.chinese), escape_latex(item.arg))
+
+def test_corpus_pre_escaped_unchanged():
+    # 旧内容中手工写出的 \% \_ 等不再被转义一次 (\\% 会在换行后接注释符，吞掉本行其余内容)
+    items = [i for i in corpus_items() if i.item_type in TEX_MAPPING and i.item_type not in RAW_FIELDS]
+    items += [ContentItem("h1cap", SPECIALS, "聖詠_百十八 {甲} 50%"), ContentItem("collect", "Deus_meus, qui 100% {omnia}", "天主")]
+    for item in items:
+        for single in (False, True): assert render_item(pre_escape(item), single) == render_item(item, single)
+
+def test_backslash_pairs_kept():
+    assert escape_latex(r"a\\%b") == r"a\\\%b"
+    assert escape_latex(r"50\% & x_1") == r"50\% \& x\_1"
+
+def test_check_reports_pre_escaped():
+    assert [lvl for lvl, _ in check_row("h1cap", r"50\% \& x\_1", "", "")] == [ERROR]
+    assert check_row("h1cap", r"a\\%b", "", "") == []
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+test_format.py - 预编译导言区格式的回归测试 (python -m pytest)
+1. 不用格式时 build 目录中的 main.tex 不含预加载与 \\endofdump，与原 main.tex 只差标题与 includeonly 钩子。
+2. 使用格式时另行生成 main-fmt.tex：ctex 文档类不载入字体，宏包在 \\documentclass 之后预加载。
+3. format_key 只随导言区、psalter.sty 与 xelatex 变化，正文变化不使格式失效。
+"""
+
+import os, shutil, sys
+
+import pytest
+
+import psalter_core
+from psalter_core import (
+    DEFAULT_TITLE_DATA, FORMAT_MAIN, ContentItem, add_format_preamble, add_includeonly_hook, format_key,
+    format_packages, get_application_path, prepare_build_dir, render_main_tex, write_format_main,
+)
+
+BASE_DIR = get_application_path()
+
+def read(fp):
+    with open(fp, encoding='utf-8') as f: return f.read()
+
+@pytest.fixture
+def build_dir(tmp_path, monkeypatch):
+    # format_key 记录 xelatex 可执行文件；测试环境不一定装有 xelatex
+    monkeypatch.setattr(psalter_core.shutil, "which", lambda cmd: sys.executable)
+    d = str(tmp_path / "build")
+    prepare_build_dir(BASE_DIR, d, [ContentItem("h1cap", "Psalmus 1", "聖詠 一")], DEFAULT_TITLE_DATA)
+    return d
+
+def test_plain_main_unchanged(build_dir):
+    main = read(os.path.join(build_dir, "main.tex"))
+    assert main == add_includeonly_hook(render_main_tex(read(os.path.join(BASE_DIR, "main.tex")), DEFAULT_TITLE_DATA))
+    assert "endofdump" not in main and "PassOptionsToClass" not in main
+    assert not os.path.exists(os.path.join(build_dir, FORMAT_MAIN))
+
+def test_format_main(build_dir):
+    assert write_format_main(build_dir)
+    main, fmt = read(os.path.join(build_dir, "main.tex")), read(os.path.join(build_dir, FORMAT_MAIN))
+    head, _, rest = fmt.partition("\\csname endofdump\\endcsname\n")
+    assert rest and "\\documentclass" not in rest and "\\begin{document}" not in head
+    lines = head.splitlines()
+    assert lines[0] == "\\PassOptionsToClass{fontset=none}{ctexart}"
+    assert lines[1].startswith("\\documentclass")
+    # 字体在 \endofdump 之后由 psalter.sty 设置
+    assert lines[2] == "\\RequirePackage{%s}" % ",".join(format_packages(read(os.path.join(build_dir, "psalter.sty"))))
+    assert "fontspec" not in lines[2] and "psalter" not in lines[2]
+    # 去掉插入的三行后与 main.tex 相同
+    assert lines[1] + "\n" + rest == main
+
+def test_add_format_preamble_keeps_explicit_fontset():
+    out = add_format_preamble("\\documentclass[fontset=windows]{ctexart}\n\\begin{document}\n", "")
+    assert out == "\\documentclass[fontset=windows]{ctexart}\n\\csname endofdump\\endcsname\n\\begin{document}\n"
+    assert add_format_preamble("\\begin{document}\n", "") is None
+
+def test_format_key(build_dir):
+    write_format_main(build_dir)
+    key = format_key(build_dir)
+    assert key == format_key(build_dir)
+    # 正文变化不影响格式
+    with open(os.path.join(build_dir, "body.tex"), "a", encoding='utf-8') as f: f.write("% changed\n")
+    assert format_key(build_dir) == key
+    # 导言区变化使格式失效
+    fp = os.path.join(build_dir, "main.tex")
+    main = read(fp).replace("\\begin{document}", "\\usepackage{url}\n\\begin{document}")
+    with open(fp, "w", encoding='utf-8') as f: f.write(main)
+    assert write_format_main(build_dir)
+    assert format_key(build_dir) != key
+
+@pytest.mark.skipif(shutil.which("xelatex") is None or shutil.which("kpsewhich") is None, reason="需要 xelatex 与 mylatexformat")
+def test_dump_format(tmp_path):
+    # ctex 文档类载入字体时 XeTeX 拒绝 \dump：检查格式确实能生成并用于编译
+    from psalter_core import compile_project, ensure_format, get_format_dir
+    for fn in ("main.tex", "psalter.sty"): shutil.copy(os.path.join(BASE_DIR, fn), tmp_path)
+    items = [ContentItem("tocstart"), ContentItem("h1cap", "Psalmus 1", "聖詠 一")]
+    compile_project(str(tmp_path), items, use_format=False)
+    build = os.path.join(tmp_path, "build")
+    fmt = ensure_format(build, get_format_dir(str(tmp_path)))
+    failed = [fn for fn in os.listdir(get_format_dir(str(tmp_path))) if fn.endswith(".failed")]
+    assert fmt, read(os.path.join(get_format_dir(str(tmp_path)), failed[0])) if failed else "mylatexformat 不可用"
+    assert os.path.getsize(compile_project(str(tmp_path), items)) > 0
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+"""
+test_images.py - 图片预处理的回归测试 (python -m pytest，需要 Pillow)
+缩小后的副本自然尺寸 (像素 / 分辨率) 与原图相同：JFIF 整数分辨率相差不到半个像素，EXIF 中的分辨率完全一致。
+"""
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from psalter_core import ContentItem, prepare_images
+
+@pytest.mark.parametrize("size, dpi", [((7000, 9800), (72, 72)), ((5123, 4077), (300, 300)), ((4000, 3000), None)])
+def test_jpeg_natural_size_kept(tmp_path, size, dpi):
+    (tmp_path / "images").mkdir()
+    Image.new("RGB", size, "red").save(tmp_path / "images" / "a.jpg", **({"dpi": dpi} if dpi else {}))
+    mapping = prepare_images(str(tmp_path), [ContentItem("image", "images/a.jpg")])
+    dpi = dpi or (72, 72)
+    with Image.open(tmp_path / mapping["images/a.jpg"]) as im:
+        exif = im.getexif()
+        for n, (orig, new, d) in enumerate(zip(size, im.size, im.info["dpi"])):
+            assert new < orig
+            assert abs(new / d - orig / dpi[n]) <= 0.5 / d
+            assert new / float(exif[0x011A + n]) == pytest.approx(orig / dpi[n], rel=1e-6)
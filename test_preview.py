@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""
+test_preview.py - 编辑器预览行号的局部修补 (python -m pytest)
+插入、删除、替换与交换后，修补得到的起始行与按全部内容项重新累加的结果一致。
+"""
+
+import itertools, random
+
+from tex_generator import starts_insert, starts_remove, starts_replace, starts_swap
+
+def full(counts): return [0] + list(itertools.accumulate(counts))
+
+def test_each_edit_matches_full_recompute():
+    rnd = random.Random(0)
+    counts = [rnd.randint(1, 40) for _ in range(50)]
+    starts = full(counts)
+    for step in range(2000):
+        op = rnd.choice(("insert", "remove", "replace", "swap"))
+        if op == "insert" or len(counts) < 2:
+            i, new = rnd.randint(0, len(counts)), [rnd.randint(1, 40) for _ in range(rnd.randint(1, 3))]
+            counts[i:i] = new; starts_insert(starts, i, new)
+        elif op == "remove":
+            i = rnd.randrange(len(counts)); j = min(len(counts), i + rnd.randint(1, 3))
+            del counts[i:j]; starts_remove(starts, i, j)
+        elif op == "replace":
+            i, c = rnd.randrange(len(counts)), rnd.randint(1, 40)
+            counts[i] = c; starts_replace(starts, i, c)
+        else:
+            i = rnd.randrange(len(counts) - 1); j = rnd.randint(i + 1, min(len(counts) - 1, i + 5))
+            counts[i], counts[j] = counts[j], counts[i]; starts_swap(starts, i, j)
+        assert starts == full(counts), (step, op)
+
+def test_edges():
+    starts = [0]
+    starts_insert(starts, 0, [3, 2]); assert starts == [0, 3, 5]
+    starts_insert(starts, 2, [4]); assert starts == [0, 3, 5, 9]
+    starts_swap(starts, 0, 2); assert starts == [0, 4, 6, 9]
+    starts_remove(starts, 0, 3); assert starts == [0]
@@ -11,42 +11,21 @@ tex_generator.py - Psalter LaTeX 生成器 (完整全功能版 v6)
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, simpledialog, scrolledtext
-import os, csv, shutil, re, subprocess, platform
-import sys
+import tkinter.font as tkfont
+import os, shutil, threading, queue, bisect, itertools, sqlite3
+
+from psalter_core import (
+    ContentItem, MultiLineContentItem, FileContentLoader, FORMAT_TYPES, DEFAULT_TITLE_DATA,
+    BuildError, BuildStats, CompileCancelled, CancelToken, get_application_path, get_latex_content, write_latex_content,
+    compile_project, open_file, HAS_PILLOW, DEFAULT_IMAGE_DPI,
+)
+from psalter_project import PROJECT_EXT, load_project, save_project
+from psalter_check import ERROR, check_items, check_content_tree, count_errors, format_issues
+from psalter_search import open_index
+from psalter_watch import POLL_INTERVAL, ProjectWatcher
 
 # ==========================================
-# 1. LaTeX 命令映射配置
-# ==========================================
-TEX_MAPPING = {
-    'h1':           (r'\psHeaderOne{{{l}}}{{{c}}}',      r'\psSingleHeaderOne{{{c}}}'),
-    'h1cap':        (r'\psHeaderOneCap{{{l}}}{{{c}}}',   r'\psSingleHeaderOneCap{{{l}}}{{{c}}}'),
-    'h1lowercase':  (r'\psHeaderOneLowercase{{{l}}}{{{c}}}', r'\psSingleHeaderOneLowercase{{{l}}}{{{c}}}'),
-    'h2':           (r'\psHeaderTwo{{{l}}}{{{c}}}',      r'\psSingleHeaderTwo{{{c}}}'),
-    'h3':           (r'\psHeaderThree{{{l}}}{{{c}}}',    r'\psSingleHeaderThree{{{c}}}'),
-    'psalmtitle':   (r'\psPsalmTitle{{{l}}}{{{c}}}',     r'\psSinglePsalmTitle{{{c}}}'),
-    'canticletitle':(r'\psCanticleTitle{{{l}}}{{{c}}}',  r'\psSingleCanticleTitle{{{c}}}'),
-    'hymntitle':    (r'\psHymnTitle{{{l}}}{{{c}}}',      r'\psSingleHymnTitle{{{c}}}'),
-    'hymnheader':   (r'\psHymnHeader{{{l}}}{{{c}}}',     r'\psSingleHymnHeader{{{c}}}'),
-    'antiphon':     (r'\psAntiphonRepeat{{{l}}}{{{c}}}', r'\psSingleAntiphon{{{c}}}'),
-    'dropcap':      (r'\psVerseDropcap{{{l}}}{{{c}}}',   r'\psSingleVerseDropcap{{{c}}}'),
-    'verse':        (r'\psVerse{{{l}}}{{{c}}}',          r'\psSingleVerse{{{c}}}'),
-    'gloria':       (r'\psGloria{{{l}}}{{{c}}}',         r'\psSingleGloria{{{c}}}'),
-    'rubric':       (r'\psRubric{{{l}}}{{{c}}}',         r'\psSingleRubric{{{c}}}'),
-    'V':            (r'\psVR{{V}}{{{l}}}{{{c}}}',        r'\psSingleVR{{V}}{{{c}}}'),
-    'R':            (r'\psVR{{R}}{{{l}}}{{{c}}}',        r'\psSingleVR{{R}}{{{c}}}'),
-    'hymn':         (r'\psHymnStanza{{{l}}}{{{c}}}',     r'\psSingleHymnStanza{{{c}}}'),
-    'capit':        (r'\psCapit{{{l}}}{{{c}}}',          r'\psSingleCapit{{{c}}}'),
-    'capitheader':  (r'\psCapitHeader{{{l}}}{{{c}}}',    r'\psSingleCapitHeader{{{c}}}'),
-    'scriptureref': (r'\psScriptureRef{{{l}}}{{{c}}}',   r'\psSingleScriptureRef{{{c}}}'),
-    'collect':      (r'\psCollect{{{l}}}{{{c}}}',        r'\psSingleCollect{{{c}}}'),
-    'lesson':       (r'\psLesson{{{l}}}{{{c}}}',         r'\psSingleLesson{{{c}}}'),
-    'text':         (r'\psText{{{l}}}{{{c}}}',           r'\psSingleText{{{c}}}'),
-    'rule':         (r'\psThinRule',                     r'\psSingleThinRule'),
-    'thickrule':    (r'\psThickRule',                    r'\psSingleThickRule'),
-}
-
-# ==========================================
-# 2. 核心样式与类定义
+# 1. 核心样式
 # ==========================================
 class S:
     BG_DARK = "#17212b"
@@ -63,94 +42,8 @@ class S:
     SCROLL_FG = "#4a5d6e"
     PURPLE = "#8e44ad"  # 封面设置按钮颜色
 
-class ContentItem:
-    def __init__(self, t, l="", c="", a="", src="", multi=False, cnt=1):
-        self.item_type, self.latin, self.chinese, self.arg = t, l, c, a
-        self.source_file, self.is_multiline, self.line_count = src, multi, cnt
-    def to_csv_row(self): return [self.item_type, self.latin, self.chinese, self.arg]
-    def get_display_text(self):
-        t = self.item_type
-        if self.is_multiline:
-            return f"[{t}] {self.latin[:20]}... | {self.chinese[:10]}... (+{self.line_count-1}行)"
-        if t == "image": return f"[图片] {os.path.basename(self.latin)}"
-        if t == "rule": return "[分隔线]"
-        if t == "thickrule": return "[粗分隔线]"
-        if t == "pagebreak": return "[分页]"
-        if t == "tocstart": return "[目录起始]"
-        if t == "singlecol": return "[单栏/双栏切换]"
-        pl = self.latin[:20] + "..." if len(self.latin) > 20 else self.latin
-        pc = self.chinese[:10] + "..." if len(self.chinese) > 10 else self.chinese
-        return f"[{t}] {pl} | {pc}"
-
-class MultiLineContentItem(ContentItem):
-    def __init__(self, src, items):
-        self.items = items
-        if items:
-            f = items[0]
-            super().__init__(f.item_type, f.latin, f.chinese, f.arg, src, True, len(items))
-        else:
-            super().__init__("", "", "", "", src, True, 0)
-    def to_csv_rows(self): 
-        return [i.to_csv_row() for i in self.items]
-    def get_flat_items(self): 
-        return self.items
-
-class FileContentLoader:
-    CATEGORIES = {
-        "psalms": "圣咏 (Psalms)", "canticles": "圣歌 (Canticles)",
-        "hymns": "赞美诗 (Hymns)", "antiphons": "对经 (Antiphons)",
-        "lessons": "读经 (Lessons)", "responsories": "答唱咏 (Responsories)",
-        "collects": "集祷经 (Collects)", "common": "通用文本 (Common)"
-    }
-    def __init__(self, d):
-        self.content_dir = d
-        for c in self.CATEGORIES: os.makedirs(os.path.join(d, c), exist_ok=True)
-    def get_available_files(self):
-        files = {c: [] for c in self.CATEGORIES}
-        for cat in files:
-            p = os.path.join(self.content_dir, cat)
-            if os.path.exists(p):
-                fl = []
-                for f in os.listdir(p):
-                    if f.endswith('.txt'):
-                        nums = re.findall(r'\d+', f)
-                        k = int(nums[0]) if nums else 999
-                        if len(nums) > 1: k = k * 100 + int(nums[1])
-                        fl.append((k, f))
-                fl.sort(key=lambda x: x[0])
-                files[cat] = fl
-        return files
-    def load_file_content(self, cat, fn):
-        fp = os.path.join(self.content_dir, cat, fn)
-        items = []
-        if not os.path.exists(fp): return items
-        with open(fp, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if not line or line.startswith('#'): continue
-                parts = line.split('|')
-                if len(parts) >= 3:
-                    items.append(ContentItem(parts[0], parts[1], parts[2], parts[3] if len(parts) > 3 else ""))
-        return items
-    def load_file_as_multiline(self, cat, fn):
-        items = self.load_file_content(cat, fn)
-        return MultiLineContentItem(fn, items) if items else None
-
-FORMAT_TYPES = [
-    ("h1", "大标题"), ("h1cap", "目录大标题"), ("h1lowercase", "目录小标题"),
-    ("h2", "副标题"), ("h3", "节次标题"), ("psalmtitle", "圣咏标题"),
-    ("canticletitle", "圣歌标题"), ("hymntitle", "赞美诗标题"), ("hymnheader", "赞美诗加粗标题"),
-    ("antiphon", "对经"), ("antiphonnum", "对经(带编号)"), ("dropcap", "首字下沉文本"),
-    ("verse", "诗节"), ("gloria", "圣三光荣颂"), ("rubric", "礼仪指示"),
-    ("V", "启(V)"), ("R", "应(R)"), ("hymn", "赞美诗节"),
-    ("capit", "短读经"), ("capitheader", "短读经标题"), ("scriptureref", "圣经引用"),
-    ("collect", "集祷经"), ("lesson", "读经标题"), ("text", "普通文本"),
-    ("rule", "分隔线"), ("thickrule", "粗分隔线"), ("pagebreak", "分页"),
-    ("tocstart", "目录起始"), ("singlecol", "单栏/双栏切换"), ("image", "图片"),
-]
-
 # ==========================================
-# 3. 自定义控件类
+# 2. 自定义控件类
 # ==========================================
 class TelegramScrollbar(tk.Canvas):
     def __init__(self, parent, command=None, **kw):
@@ -182,6 +75,97 @@ class TelegramScrollbar(tk.Canvas):
             nt = e.y - self.drag_start; np = nt / (h - th) * (1 - self.thumb_size)
             np = max(0, min(1 - self.thumb_size, np)); self.command('moveto', str(np))
 
+class VirtualRowsMixin:
+    """虚拟化滚动：控件中只保留可见窗口内的行，滚动时再按需格式化。
+    row_count() 返回总行数，format_row(i) 返回第 i 行文本；
+    滚动条沿用 TelegramScrollbar 的 set / moveto 协议 (command=self.yview，scrollbar_set=滚动条.set)。"""
+    def init_virtual(self, row_count, format_row):
+        self.row_count, self.format_row = row_count, format_row
+        self.top = 0; self.scrollbar_set = None
+        self.line_height = max(1, tkfont.Font(font=self.cget('font')).metrics('linespace') + self.row_extra())
+        self.bind('<Configure>', lambda e: self.render(), add='+')
+        for seq in ('<MouseWheel>', '<Button-4>', '<Button-5>'): self.bind(seq, self.on_wheel)
+    def row_extra(self): return 0
+    def visible_rows(self): return max(1, self.winfo_height() // self.line_height)
+    def yview(self, *args):
+        n, vis = self.row_count(), self.visible_rows()
+        if not args: return (self.top / n, min(1.0, (self.top + vis) / n)) if n else (0.0, 1.0)
+        if args[0] == 'moveto': self.top = int(float(args[1]) * n)
+        elif args[0] == 'scroll': self.top += int(args[1]) * (max(1, vis - 1) if args[2] == 'pages' else 1)
+        self.render()
+    def on_wheel(self, e):
+        self.yview('scroll', -3 if (e.num == 4 or e.delta > 0) else 3, 'units')
+        return "break"
+    def see_row(self, i):
+        vis = self.visible_rows()
+        if i < self.top: self.top = i
+        elif i >= self.top + vis: self.top = i - vis + 1
+        else: return
+        self.render()
+    def render(self):
+        n, vis = self.row_count(), self.visible_rows()
+        self.top = max(0, min(self.top, n - vis))
+        self.fill([self.format_row(i) for i in range(self.top, min(n, self.top + vis + 1))])
+        if self.scrollbar_set: self.scrollbar_set(*self.yview())
+
+class VirtualListbox(VirtualRowsMixin, tk.Listbox):
+    """虚拟化列表框。选择状态按全局下标保存，curselection / selection_set 均使用全局下标"""
+    def __init__(self, parent, **kw):
+        super().__init__(parent, **kw)
+        self.selected = set(); self.anchor = None
+        self.bind('<Button-1>', self.on_click)
+        self.bind('<Shift-Button-1>', self.on_shift_click)
+        self.bind('<Control-Button-1>', self.on_ctrl_click)
+        self.bind('<B1-Motion>', self.on_shift_click)
+        self.bind('<Up>', lambda e: self.on_key(-1))
+        self.bind('<Down>', lambda e: self.on_key(1))
+    def row_extra(self): return 2 * int(self.cget('selectborderwidth'))
+    def fill(self, rows):
+        tk.Listbox.delete(self, 0, tk.END)
+        if rows: tk.Listbox.insert(self, tk.END, *rows)
+        for k in range(len(rows)):
+            if self.top + k in self.selected: tk.Listbox.selection_set(self, k)
+    def row_at(self, y):
+        n = self.row_count()
+        return min(self.top + self.nearest(y), n - 1) if n else None
+    def on_click(self, e):
+        self.focus_set()
+        i = self.row_at(e.y)
+        if i is not None: self.selected = {i}; self.anchor = i; self.render()
+        return "break"
+    def on_shift_click(self, e):
+        i = self.row_at(e.y)
+        if i is None: return "break"
+        if self.anchor is None: self.anchor = i
+        a, b = sorted((self.anchor, i))
+        self.selected = set(range(a, b + 1))
+        self.see_row(i); self.render()
+        return "break"
+    def on_ctrl_click(self, e):
+        i = self.row_at(e.y)
+        if i is not None: self.selected ^= {i}; self.anchor = i; self.render()
+        return "break"
+    def on_key(self, d):
+        n = self.row_count()
+        if not n: return "break"
+        i = max(0, min(n - 1, (self.anchor if self.anchor is not None else -d) + d))
+        self.selected = {i}; self.anchor = i
+        self.see_row(i); self.render()
+        return "break"
+    def curselection(self): return tuple(sorted(self.selected))
+    def selection_set(self, first, last=None):
+        self.selected.update(range(first, (first if last is None else last) + 1))
+        self.anchor = first
+        self.see_row(first); self.render()
+    def selection_clear(self, first=0, last=None):
+        self.selected.clear(); self.anchor = None; self.render()
+
+class VirtualText(VirtualRowsMixin, tk.Text):
+    """虚拟化文本框 (只读展示用)"""
+    def fill(self, rows):
+        self.delete(1.0, tk.END)
+        self.insert(tk.END, "\n".join(rows))
+
 class PanedWindow(tk.Frame):
     def __init__(self, parent, **kw):
         super().__init__(parent, bg=S.BG_DARK, **kw)
@@ -201,7 +185,7 @@ class PanedWindow(tk.Frame):
         self.left_frame.config(width=nw)
 
 # ==========================================
-# 4. 标题页编辑对话框
+# 3. 标题页编辑对话框
 # ==========================================
 class TitlePageDialog:
     def __init__(self, parent, initial_data):
@@ -259,18 +243,62 @@ class TitlePageDialog:
         self.result = data
         self.top.destroy()
 
+class CompileProgressDialog:
+    """非模态的编译进度窗口，编译期间仍可编辑内容列表"""
+    def __init__(self, parent, on_cancel):
+        self.top = tk.Toplevel(parent)
+        self.top.title("编译中")
+        self.top.geometry("340x150")
+        self.top.configure(bg=S.BG_DARK)
+        self.top.transient(parent)
+        self.top.protocol("WM_DELETE_WINDOW", on_cancel)
+
+        self.label = tk.Label(self.top, text="正在调用 XeLaTeX 编译...", bg=S.BG_DARK, fg=S.TEXT,
+                              font=('Segoe UI', 10))
+        self.label.pack(pady=(18, 8))
+        self.bar = ttk.Progressbar(self.top, mode='indeterminate', length=280)
+        self.bar.pack()
+        self.bar.start(15)
+
+        cancel_btn = tk.Label(self.top, text="取消编译", bg=S.DANGER, fg="white", padx=15, pady=6, cursor='hand2')
+        cancel_btn.pack(pady=12)
+        cancel_btn.bind('<Button-1>', lambda e: (on_cancel(), self.label.config(text="正在取消...")))
+
+    def set_progress(self, pass_no, page, warning=None):
+        self.label.config(text=warning or f"正在调用 XeLaTeX 编译... 第 {pass_no} 遍，已排 {page} 页")
+
+    def close(self):
+        self.bar.stop()
+        self.top.destroy()
+
 # ==========================================
-# 5. 主程序类 CSVEditorApp
+# 4. 主程序类 CSVEditorApp
 # ==========================================
 
-def get_application_path():
-    """获取应用程序运行目录（兼容打包后的 EXE 和源码运行）"""
-    if getattr(sys, 'frozen', False):
-        # 如果是打包后的 EXE，使用 EXE 所在的目录
-        return os.path.dirname(sys.executable)
-    else:
-        # 如果是源码运行，使用脚本所在的目录
-        return os.path.dirname(os.path.abspath(__file__))
+# ==========================================================
+# 预览行号：starts[i] 为第 i 项在预览中的起始行，starts[-1] 为总行数。
+# 编辑时只平移受影响的部分，不重新累加所有项的行数
+# ==========================================================
+def starts_insert(starts, i, counts):
+    """在第 i 项之前插入行数为 counts 的若干项"""
+    new = list(itertools.accumulate(counts, initial=starts[i]))
+    d = new.pop() - starts[i]
+    starts[i:] = new + [s + d for s in starts[i:]]
+
+def starts_remove(starts, i, j):
+    """删除第 i..j-1 项"""
+    d = starts[j] - starts[i]
+    starts[i:] = [s - d for s in starts[j:]]
+
+def starts_replace(starts, i, count):
+    """第 i 项的行数变为 count"""
+    d = count - (starts[i + 1] - starts[i])
+    if d: starts[i + 1:] = [s + d for s in starts[i + 1:]]
+
+def starts_swap(starts, i, j):
+    """交换 i < j 两项：只有两者之间的起始行改变"""
+    d = (starts[j + 1] - starts[j]) - (starts[i + 1] - starts[i])
+    if d: starts[i + 1:j + 1] = [s + d for s in starts[i + 1:j + 1]]
 
 class CSVEditorApp:
     def __init__(self, root):
@@ -282,17 +310,20 @@ class CSVEditorApp:
         self.content_items = []
         
         # 默认封面标题数据
-        self.title_data = {
-            "title_zh": "羅馬大日課\\\\[0.5em]耶穌聖誕瞻禮",
-            "title_lat": "Breviárium Románum\\\\[0.5em]In Nativitáte Dómini",
-            "edition": "中拉對照\\\\[0.5em]Edítio Sínico-Latína",
-            "footer": "Pro Manuscripto"
-        }
+        self.title_data = dict(DEFAULT_TITLE_DATA)
+        self.compile_cancel = None
+        self.compile_auto = False  # 当前编译由监视模式触发
+        self.project_path = None  # 最近打开或保存的工程文件，监视模式一并监视
+        self.watcher = None
+        self.watch_pending = False
+        self.watch_opened = False
+        self.preview_starts = [0]  # 每个内容项在预览中的起始行 (前缀和)，编辑时局部修补，None 表示需重算
 
         self.base_dir = get_application_path()
         self.content_dir = os.path.join(self.base_dir, "content")
         self.images_dir = os.path.join(self.base_dir, "images")
         self.loader = FileContentLoader(self.content_dir)
+        self.search_index = None  # 首次检索时打开
         
         os.makedirs(self.images_dir, exist_ok=True)
         self.setup_ui()
@@ -312,6 +343,14 @@ class CSVEditorApp:
         tk.Label(left, text="内容来源", bg=S.BG_DARK, fg=S.ACCENT_LIGHT,
                 font=('Segoe UI', 11, 'bold')).pack(anchor='w', pady=(0, 8))
         
+        # 全文检索：回车检索拉丁文/中文 (忽略重音)，Esc 或清空后恢复文件树
+        self.search_var = tk.StringVar()
+        search_entry = tk.Entry(left, textvariable=self.search_var, bg=S.BG_LIGHT, fg=S.TEXT,
+            insertbackground=S.TEXT, font=('Segoe UI', 10), relief='flat')
+        search_entry.pack(fill=tk.X, pady=(0, 8), ipady=4)
+        search_entry.bind('<Return>', lambda e: self.search_content())
+        search_entry.bind('<Escape>', lambda e: (self.search_var.set(""), self.load_file_tree()))
+        
         tree_f = tk.Frame(left, bg=S.BG_LIGHT)
         tree_f.pack(fill=tk.BOTH, expand=True, pady=(0, 8))
         
@@ -362,14 +401,17 @@ class CSVEditorApp:
         list_f = tk.Frame(center, bg=S.BG_LIGHT)
         list_f.pack(fill=tk.BOTH, expand=True, pady=(0, 8))
         
-        self.content_listbox = tk.Listbox(list_f, bg=S.BG_LIGHT, fg=S.TEXT,
+        self.content_listbox = VirtualListbox(list_f, bg=S.BG_LIGHT, fg=S.TEXT, selectmode=tk.EXTENDED,
             selectbackground=S.BG_HOVER, selectforeground=S.TEXT,
             font=('Segoe UI', 10), borderwidth=0, highlightthickness=0, activestyle='none')
         self.content_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        self.content_listbox.init_virtual(lambda: len(self.content_items),
+                                          lambda i: self.content_items[i].get_display_text())
+        
         ls = TelegramScrollbar(list_f, command=self.content_listbox.yview)
         ls.pack(side=tk.RIGHT, fill=tk.Y)
-        self.content_listbox.config(yscrollcommand=ls.set)
+        self.content_listbox.scrollbar_set = ls.set
         
         ops = tk.Frame(center, bg=S.BG_DARK)
         ops.pack(fill=tk.X)
@@ -392,20 +434,24 @@ class CSVEditorApp:
         pf = tk.Frame(right, bg=S.BG_LIGHT)
         pf.pack(fill=tk.BOTH, expand=True, pady=(0, 8), padx=(8, 0))
         
-        self.preview_text = tk.Text(pf, bg=S.BG_LIGHT, fg=S.TEXT, insertbackground=S.TEXT,
+        self.preview_text = VirtualText(pf, bg=S.BG_LIGHT, fg=S.TEXT, insertbackground=S.TEXT,
             font=('Consolas', 10), borderwidth=0, highlightthickness=0, wrap=tk.NONE, padx=8, pady=8)
         self.preview_text.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         
+        self.preview_text.init_virtual(self.preview_row_count, self.preview_row)
+        
         ps = TelegramScrollbar(pf, command=self.preview_text.yview)
         ps.pack(side=tk.RIGHT, fill=tk.Y)
-        self.preview_text.config(yscrollcommand=ps.set)
+        self.preview_text.scrollbar_set = ps.set
         
         exp = tk.Frame(right, bg=S.BG_DARK)
         exp.pack(fill=tk.X, pady=(8, 0), padx=(8, 0))
         
         self.make_btn(exp, "刷新预览", self.refresh_preview, S.BG_HOVER, 8).pack(side=tk.LEFT, padx=2)
-        self.make_btn(exp, "保存CSV", self.export_csv, S.ACCENT, 8).pack(side=tk.LEFT, padx=2)
+        self.make_btn(exp, "打开工程", self.open_project, S.ACCENT, 8).pack(side=tk.LEFT, padx=2)
+        self.make_btn(exp, "保存工程", self.export_csv, S.ACCENT, 8).pack(side=tk.LEFT, padx=2)
         self.make_btn(exp, "导出 Body.tex", self.export_tex, S.SUCCESS, 12).pack(side=tk.LEFT, padx=2)
+        self.make_btn(exp, "检查内容", self.check_content, S.BG_HOVER, 8).pack(side=tk.LEFT, padx=2)
         
         # 编译按钮
         compile_btn = tk.Label(exp, text="编译并预览 PDF", bg="#c62828", fg="white", 
@@ -414,6 +460,28 @@ class CSVEditorApp:
         compile_btn.bind('<Enter>', lambda e: compile_btn.config(bg="#d32f2f"))
         compile_btn.bind('<Leave>', lambda e: compile_btn.config(bg="#c62828"))
         compile_btn.bind('<Button-1>', lambda e: self.compile_preview())
+        self.make_btn(exp, "编译选中部分", self.compile_selection, S.BG_HOVER, 10).pack(side=tk.LEFT, padx=2)
+        # 分块编译：未变化的分页块不重写，预览时只重新排版变化的块
+        self.chunked_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(exp, text="分块增量预览", variable=self.chunked_var, bg=S.BG_DARK, fg=S.TEXT,
+                       selectcolor=S.BG_LIGHT, activebackground=S.BG_DARK, activeforeground=S.TEXT,
+                       font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=5)
+        # 与命令行 --image-dpi 一样需手动开启：插图先缩小到印刷分辨率再编译，原图不变 (需要 Pillow)
+        self.image_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(exp, text=f"缩小插图 ({DEFAULT_IMAGE_DPI} dpi)", variable=self.image_var, bg=S.BG_DARK, fg=S.TEXT,
+                       selectcolor=S.BG_LIGHT, activebackground=S.BG_DARK, activeforeground=S.TEXT,
+                       state=tk.NORMAL if HAS_PILLOW else tk.DISABLED,
+                       font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=5)
+        # 监视模式：内容、图片、样式或工程文件保存后自动重新编译
+        self.watch_var = tk.BooleanVar(value=False)
+        tk.Checkbutton(exp, text="监视并自动编译", variable=self.watch_var, command=self.toggle_watch, bg=S.BG_DARK,
+                       fg=S.TEXT, selectcolor=S.BG_LIGHT, activebackground=S.BG_DARK, activeforeground=S.TEXT,
+                       font=('Segoe UI', 10)).pack(side=tk.LEFT, padx=5)
+
+        # 状态栏：上次编译各阶段耗时、遍数与页数
+        self.status_var = tk.StringVar(value="")
+        tk.Label(right, textvariable=self.status_var, bg=S.BG_DARK, fg=S.TEXT_SEC, font=('Segoe UI', 9),
+                 anchor='w').pack(fill=tk.X, padx=(10, 0), pady=(4, 0))
         
         self.content_listbox.bind('<Double-1>', lambda e: self.edit_item())
     
@@ -441,22 +509,38 @@ class CSVEditorApp:
             for _, fn in files.get(k, []):
                 self.file_tree.insert(cid, tk.END, text=fn, values=(k, fn))
     
+    def search_content(self):
+        """在文件树中列出检索结果 (文件:行 与首段文字)；选中后"添加选中文件"添加所在文件"""
+        q = self.search_var.get().strip()
+        if not q: self.load_file_tree(); return
+        try:
+            if self.search_index is None: self.search_index = open_index(self.base_dir)
+            else: self.search_index.update()
+            hits = self.search_index.search(q)
+        except sqlite3.Error as e:
+            messagebox.showerror("检索失败", str(e)); return
+        for i in self.file_tree.get_children(): self.file_tree.delete(i)
+        if not hits: self.file_tree.insert("", tk.END, text="(无结果)"); return
+        for h in hits:
+            self.file_tree.insert("", tk.END, text=f"{h.file}:{h.line}  {h.latin or h.chinese}",
+                                  values=(h.category, h.file, h.line))
+    
     def add_selected_file(self):
         sel = self.file_tree.selection()
         if not sel: messagebox.showwarning("提示", "请先选择要添加的文件"); return
+        new_items = []
         for sid in sel:
             item = self.file_tree.item(sid)
             vals = item.get('values', [])
             if len(vals) >= 2:
                 mi = self.loader.load_file_as_multiline(vals[0], vals[1])
-                if mi: self.content_items.append(mi)
-        self.refresh_listbox()
-        self.refresh_preview()
+                if mi: new_items.append(mi)
+        self.insert_items(len(self.content_items), new_items)
     
     def add_custom_content(self):
         d = CustomContentDialog(self.root)
         self.root.wait_window(d.top)
-        if d.result: self.content_items.append(d.result); self.refresh_listbox(); self.refresh_preview()
+        if d.result: self.append_item(d.result)
     
     def add_image(self):
         fp = filedialog.askopenfilename(title="选择图片", filetypes=[("图片文件", "*.png *.jpg *.jpeg *.gif *.bmp")])
@@ -465,40 +549,33 @@ class CSVEditorApp:
             dp = os.path.join(self.images_dir, fn)
             if not os.path.exists(dp): shutil.copy2(fp, dp)
             h = simpledialog.askstring("图片高度", "请输入图片高度（留空使用默认值3.2cm）:", initialvalue="")
-            self.content_items.append(ContentItem("image", f"images/{fn}", "", h or ""))
-            self.refresh_listbox(); self.refresh_preview()
+            self.append_item(ContentItem("image", f"images/{fn}", "", h or ""))
     
     def add_rule(self):
         c = messagebox.askyesnocancel("分隔线类型", "是 = 普通分隔线\n否 = 粗分隔线\n取消 = 不添加")
-        if c is True: self.content_items.append(ContentItem("rule", "", "", ""))
-        elif c is False: self.content_items.append(ContentItem("thickrule", "", "", ""))
-        self.refresh_listbox(); self.refresh_preview()
+        if c is True: self.append_item(ContentItem("rule", "", "", ""))
+        elif c is False: self.append_item(ContentItem("thickrule", "", "", ""))
     
     def add_pagebreak(self):
-        self.content_items.append(ContentItem("pagebreak", "", "", ""))
-        self.refresh_listbox(); self.refresh_preview()
+        self.append_item(ContentItem("pagebreak", "", "", ""))
     
     def add_tocstart(self):
-        self.content_items.append(ContentItem("tocstart", "", "", ""))
-        self.refresh_listbox(); self.refresh_preview()
+        self.append_item(ContentItem("tocstart", "", "", ""))
     
     def add_singlecol(self):
-        self.content_items.append(ContentItem("singlecol", "", "", ""))
-        self.refresh_listbox(); self.refresh_preview()
+        self.append_item(ContentItem("singlecol", "", "", ""))
     
     def move_up(self):
         sel = self.content_listbox.curselection()
         if not sel or sel[0] == 0: return
         i = sel[0]
-        self.content_items[i], self.content_items[i-1] = self.content_items[i-1], self.content_items[i]
-        self.refresh_listbox(); self.content_listbox.selection_set(i-1); self.refresh_preview()
+        self.swap_items(i - 1, i); self.content_listbox.selection_set(i-1)
     
     def move_down(self):
         sel = self.content_listbox.curselection()
         if not sel or sel[0] >= len(self.content_items) - 1: return
         i = sel[0]
-        self.content_items[i], self.content_items[i+1] = self.content_items[i+1], self.content_items[i]
-        self.refresh_listbox(); self.content_listbox.selection_set(i+1); self.refresh_preview()
+        self.swap_items(i, i + 1); self.content_listbox.selection_set(i+1)
     
     def edit_item(self):
         sel = self.content_listbox.curselection()
@@ -508,47 +585,107 @@ class CSVEditorApp:
             messagebox.showinfo("提示", "多行文件内容无法直接编辑。"); return
         d = CustomContentDialog(self.root, item)
         self.root.wait_window(d.top)
-        if d.result: self.content_items[sel[0]] = d.result; self.refresh_listbox(); self.refresh_preview()
+        if d.result: self.replace_item(sel[0], d.result)
     
     def delete_item(self):
         sel = self.content_listbox.curselection()
         if not sel: return
         if messagebox.askyesno("确认", "确定要删除选中的项目吗？"):
-            del self.content_items[sel[0]]; self.refresh_listbox(); self.refresh_preview()
+            for i in reversed(sel): self.remove_items(i, i + 1)
     
     def clear_all(self):
         if messagebox.askyesno("确认", "确定要清空所有内容吗？"):
-            self.content_items.clear(); self.refresh_listbox(); self.refresh_preview()
+            self.content_items.clear(); self.content_listbox.selection_clear(); self.content_changed()
+
+    # ==========================================================
+    # 内容列表修改：列表框与预览均为虚拟化视图，只重新渲染可见窗口
+    # ==========================================================
+    def append_item(self, item):
+        self.insert_items(len(self.content_items), [item])
+
+    def insert_items(self, i, items):
+        if not items: return
+        if self.watcher: self.watcher.track(items)
+        self.content_items[i:i] = items
+        self.patch_preview_starts(starts_insert, i, [item.line_count for item in items])
+        self.content_listbox.see_row(i + len(items) - 1)
+
+    def remove_items(self, i, j):
+        del self.content_items[i:j]
+        self.content_listbox.selection_clear()
+        self.patch_preview_starts(starts_remove, i, j)
+
+    def replace_item(self, i, item):
+        self.content_items[i] = item
+        self.patch_preview_starts(starts_replace, i, item.line_count)
+
+    def swap_items(self, i, j):
+        """交换相邻的 i < j 两项"""
+        self.content_items[i], self.content_items[j] = self.content_items[j], self.content_items[i]
+        self.content_listbox.selection_clear()
+        self.patch_preview_starts(starts_swap, i, j)
+
+    def patch_preview_starts(self, patch, *args):
+        """局部修补预览行号后刷新视图；尚未算出行号时留待首次使用时计算"""
+        if self.preview_starts is not None: patch(self.preview_starts, *args)
+        self.refresh_listbox(); self.refresh_preview()
+
+    def content_changed(self):
+        """整个列表被替换或清空后调用"""
+        self.preview_starts = None
+        self.refresh_listbox(); self.refresh_preview()
+
+    def ensure_preview_starts(self):
+        if self.preview_starts is None:
+            # 二进制工程在文件中存有各项行数，不必为计算行号解码全部内容
+            counts = getattr(self.content_items, 'line_counts', None)
+            counts = counts() if counts else (item.line_count for item in self.content_items)
+            self.preview_starts = [0] + list(itertools.accumulate(counts))
+        return self.preview_starts
+
+    def preview_row_count(self):
+        return self.ensure_preview_starts()[-1]
+
+    def preview_row(self, k):
+        """预览第 k 行：定位到所属内容项后再格式化该行"""
+        starts = self.ensure_preview_starts()
+        i = bisect.bisect_right(starts, k) - 1
+        item = self.content_items[i]
+        r = item.items[k - starts[i]].to_csv_row() if isinstance(item, MultiLineContentItem) else item.to_csv_row()
+        return ",".join(f'"{x}"' for x in r)
 
     def refresh_listbox(self):
-        self.content_listbox.delete(0, tk.END)
-        for item in self.content_items: self.content_listbox.insert(tk.END, item.get_display_text())
+        self.content_listbox.render()
     
     def refresh_preview(self):
-        self.preview_text.delete(1.0, tk.END)
         try:
-            lines = []
-            for item in self.content_items:
-                if isinstance(item, MultiLineContentItem):
-                    for r in item.to_csv_rows(): lines.append(",".join(f'"{x}"' for x in r))
-                else:
-                    lines.append(",".join(f'"{x}"' for x in item.to_csv_row()))
-            self.preview_text.insert(tk.END, "\n".join(lines))
+            self.preview_text.render()
         except Exception as e:
-            self.preview_text.insert(tk.END, f"预览出错: {str(e)}")
+            self.preview_text.fill([f"预览出错: {str(e)}"])
     
+    def open_project(self):
+        fp = filedialog.askopenfilename(title="打开工程文件",
+            filetypes=[("工程文件", f"*.csv *{PROJECT_EXT}"), ("CSV文件", "*.csv"), ("二进制工程", f"*{PROJECT_EXT}")])
+        if not fp: return
+        if self.content_items and not messagebox.askyesno("确认", "打开工程将替换当前内容，是否继续？"): return
+        try:
+            items = load_project(fp)
+        except Exception as e:
+            messagebox.showerror("错误", f"打开失败: {str(e)}"); return
+        # 一次性替换整个列表，视图只重新渲染一次
+        self.content_items = items
+        self.set_project_path(fp)
+        self.content_listbox.selection_clear()
+        self.content_changed()
+
     def export_csv(self):
         if not self.content_items: messagebox.showwarning("提示", "没有内容可导出"); return
-        fp = filedialog.asksaveasfilename(title="保存CSV工程文件", defaultextension=".csv",
-            filetypes=[("CSV文件", "*.csv")], initialfile="psalter_project.csv")
+        fp = filedialog.asksaveasfilename(title="保存工程文件", defaultextension=".csv",
+            filetypes=[("CSV文件", "*.csv"), ("二进制工程", f"*{PROJECT_EXT}")], initialfile="psalter_project.csv")
         if fp:
             try:
-                with open(fp, 'w', encoding='utf-8', newline='') as f:
-                    w = csv.writer(f)
-                    for item in self.content_items:
-                        if isinstance(item, MultiLineContentItem):
-                            for r in item.to_csv_rows(): w.writerow(r)
-                        else: w.writerow(item.to_csv_row())
+                save_project(fp, self.content_items)
+                self.set_project_path(fp)
                 messagebox.showinfo("成功", f"工程文件已保存到:\n{fp}")
             except Exception as e: messagebox.showerror("错误", f"保存失败: {str(e)}")
 
@@ -565,67 +702,7 @@ class CSVEditorApp:
     # 生成 LaTeX 内容 (Paracol管理)
     # ==========================================================
     def get_latex_content(self):
-        latex_lines = [r"\begin{paracol}{2}"]
-        is_single_col = False
-        
-        flat_items = []
-        for item in self.content_items:
-            if isinstance(item, MultiLineContentItem):
-                flat_items.extend(item.get_flat_items())
-            else:
-                flat_items.append(item)
-        
-        for item in flat_items:
-            t, l, c, a = item.item_type, item.latin, item.chinese, item.arg
-            
-            if t == 'tocstart':
-                if not is_single_col:
-                    latex_lines.append(r"\end{paracol}")
-                
-                latex_lines.append(r"\psPrintToc")
-                latex_lines.append(r"\clearpage")
-                latex_lines.append(r"\pagenumbering{arabic}")
-                latex_lines.append(r"\pagestyle{fancy}")
-                latex_lines.append(r"\begin{paracol}{2}")
-                is_single_col = False
-                continue
-            
-            if t == 'singlecol':
-                if is_single_col:
-                    latex_lines.append(r"\psExitSingleCol")
-                    is_single_col = False
-                else:
-                    latex_lines.append(r"\psEnterSingleCol")
-                    is_single_col = True
-                continue
-
-            if t == 'pagebreak':
-                latex_lines.append(r"\psSinglePageBreak" if is_single_col else r"\psPageBreak")
-                continue
-            
-            if t in TEX_MAPPING:
-                double_cmd, single_cmd = TEX_MAPPING[t]
-                cmd = single_cmd.format(l=l, c=c, a=a) if is_single_col else double_cmd.format(l=l, c=c, a=a)
-                latex_lines.append(cmd)
-            
-            elif t == 'antiphonnum':
-                if is_single_col:
-                    latex_lines.append(rf"\psSingleAntiphonNum{{{a}}}{{{c}}}")
-                else:
-                    latex_lines.append(rf"\psAntiphonNum{{{a}}}{{{l}}}{{{c}}}")
-            
-            elif t == 'image':
-                if is_single_col:
-                    latex_lines.append(rf"\psSingleImage{{{l}}}")
-                else:
-                    latex_lines.append(rf"\psImageFullWidth{{{l}}}")
-            
-            else:
-                latex_lines.append(f"% 未知类型: {t} | {l} | {c}")
-        
-        if not is_single_col:
-            latex_lines.append(r"\end{paracol}")
-        return "\n".join(latex_lines)
+        return get_latex_content(self.content_items)
 
     def export_tex(self):
         if not self.content_items: messagebox.showwarning("提示", "没有内容可导出"); return
@@ -633,111 +710,190 @@ class CSVEditorApp:
             filetypes=[("TeX 文件", "*.tex")], initialfile="body.tex")
         if not fp: return
         try:
-            content = self.get_latex_content()
             with open(fp, 'w', encoding='utf-8') as f:
                 f.write("% Generated by Psalter Editor\n")
-                f.write(content)
+                write_latex_content(f, self.content_items)
             messagebox.showinfo("成功", f"文件已生成:\n{fp}")
         except Exception as e:
             messagebox.showerror("错误", f"生成失败: {str(e)}")
 
-    def compile_preview(self):
+    def compile_selection(self):
+        sel = self.content_listbox.curselection()
+        if not sel: messagebox.showwarning("提示", "请先在内容列表中选择要预览的项目"); return
+        # 只编译选中的连续范围，排版时间与所编辑的部分成正比
+        self.compile_preview(min(sel), max(sel) + 1)
+
+    def compile_preview(self, start=0, end=None):
         if not self.content_items:
             messagebox.showwarning("提示", "内容为空，无法编译"); return
-        
-        req_files = ["main.tex", "psalter.sty"]
-        missing = [f for f in req_files if not os.path.exists(os.path.join(self.base_dir, f))]
-        if missing:
-            messagebox.showerror("错误", f"缺失核心文件:\n{', '.join(missing)}")
-            return
-
-        build_dir = os.path.join(self.base_dir, "build")
-        try:
-            if os.path.exists(build_dir):
-                for filename in os.listdir(build_dir):
-                    file_path = os.path.join(build_dir, filename)
-                    try:
-                        if os.path.isfile(file_path) or os.path.islink(file_path): os.unlink(file_path)
-                        elif os.path.isdir(file_path): shutil.rmtree(file_path)
-                    except Exception as e: pass
-            else:
-                os.makedirs(build_dir)
-        except Exception as e:
-            messagebox.showerror("错误", f"无法创建目录: {e}"); return
+        if self.compile_cancel:
+            messagebox.showinfo("提示", "正在编译中，请等待完成或先取消"); return
+
+        # 编译前检查：有错误时先让用户决定，免得白跑一遍 XeLaTeX
+        items, title_data = list(self.content_items), dict(self.title_data)
+        stats = BuildStats()
+        with stats.stage("check"):
+            issues = check_items(items, self.base_dir, title_data, start, end)
+        errors = [i for i in issues if i.level == ERROR]
+        if errors:
+            shown = "\n".join(f"第 {i.line} 项: {i.message}" for i in errors[:10])
+            more = f"\n……共 {len(errors)} 个错误" if len(errors) > 10 else ""
+            if not messagebox.askyesno("编译前检查", f"发现以下问题，编译可能失败或内容缺失：\n\n{shown}{more}\n\n仍要编译吗？"):
+                return
 
+        self.start_compile(items, title_data, stats, start, end)
+
+    def start_compile(self, items, title_data, stats, start=0, end=None, auto=False):
+        # 在后台线程编译，界面保持可用；线程只通过队列回传消息，由主线程轮询处理
+        # 监视模式触发的编译不弹出进度窗口，进度与结果显示在状态栏
+        self.compile_cancel = CancelToken()
+        self.compile_auto = auto
+        self.compile_queue = queue.Queue()
+        self.compile_dialog = None if auto else CompileProgressDialog(self.root, self.compile_cancel.cancel)
+        chunked = self.chunked_var.get()
+        image_dpi = DEFAULT_IMAGE_DPI if HAS_PILLOW and self.image_var.get() else None
+        threading.Thread(target=self.compile_worker, daemon=True,
+                         args=(items, title_data, self.compile_cancel, self.compile_queue, start, end, chunked,
+                               stats, image_dpi)).start()
+        self.root.after(100, self.poll_compile)
+
+    def compile_worker(self, items, title_data, cancel, q, start=0, end=None, chunked=False, stats=None,
+                       image_dpi=None):
         try:
-            shutil.copy2(os.path.join(self.base_dir, "psalter.sty"), build_dir)
-            
-            src_img = os.path.join(self.base_dir, "images")
-            dst_img = os.path.join(build_dir, "images")
-            if os.path.exists(src_img): shutil.copytree(src_img, dst_img, dirs_exist_ok=True)
-            else: os.makedirs(dst_img)
-
-            # 读取 main.tex 并注入标题
-            with open(os.path.join(self.base_dir, "main.tex"), 'r', encoding='utf-8') as f:
-                main_content = f.read()
-            
-            # 替换标题占位符
-            main_content = main_content.replace("%TITLE_ZH%", self.title_data.get("title_zh", ""))
-            main_content = main_content.replace("%TITLE_LAT%", self.title_data.get("title_lat", ""))
-            main_content = main_content.replace("%EDITION_INFO%", self.title_data.get("edition", ""))
-            main_content = main_content.replace("%FOOTER_TEXT%", self.title_data.get("footer", ""))
-
-            with open(os.path.join(build_dir, "main.tex"), 'w', encoding='utf-8') as f:
-                f.write(main_content)
-            
-            with open(os.path.join(build_dir, "body.tex"), 'w', encoding='utf-8') as f:
-                f.write(self.get_latex_content())
-
+            pdf_path = compile_project(self.base_dir, items, title_data, start=start, end=end,
+                                       chunked=chunked, changed_only=chunked, stats=stats, image_dpi=image_dpi,
+                                       progress=lambda p, pg, w=None: q.put(("progress", p, pg, w)), cancel=cancel)
+            q.put(("done", pdf_path, stats))
+        except CompileCancelled:
+            q.put(("cancelled",))
+        except BuildError as e:
+            q.put(("error", e, stats))
         except Exception as e:
-            messagebox.showerror("错误", f"准备文件失败: {e}"); return
+            q.put(("exception", e))
 
-        loading = tk.Toplevel(self.root)
-        loading.title("编译中")
-        loading.geometry("300x100")
-        tk.Label(loading, text="正在调用 XeLaTeX 编译...", font=('Segoe UI', 10)).pack(expand=True)
-        loading.update()
-        
+    def poll_compile(self):
         try:
-            if shutil.which("xelatex") is None:
-                raise Exception("未找到 xelatex 命令。")
-
-            cmd = ['xelatex', '-interaction=nonstopmode', 'main.tex']
-            
-            result = subprocess.run(cmd, cwd=build_dir, capture_output=True, text=True, encoding='utf-8', errors='replace')
-            if result.returncode != 0:
-                loading.destroy()
-                self.show_error_log(result.stdout)
+            while True:
+                msg = self.compile_queue.get_nowait()
+                if msg[0] == "progress":
+                    if self.compile_dialog: self.compile_dialog.set_progress(*msg[1:])
+                    else: self.status_var.set(msg[3] or f"自动编译中... 第 {msg[1]} 遍，已排 {msg[2]} 页")
+                    continue
+                if self.compile_dialog: self.compile_dialog.close()
+                self.compile_cancel = None
+                if msg[0] in ("done", "error") and msg[2]:
+                    self.status_var.set(("上次编译: " if msg[0] == "done" else "上次编译失败: ") + msg[2].summary())
+                if self.compile_auto: self.finish_auto_compile(msg)
+                elif msg[0] == "done": open_file(msg[1])
+                elif msg[0] == "error":
+                    if msg[1].log: self.show_error_log(msg[1].log, msg[1].issues)
+                    else: messagebox.showerror("错误", str(msg[1]))
+                elif msg[0] == "exception": messagebox.showerror("系统错误", str(msg[1]))
+                if self.watch_pending: self.watch_compile()
                 return
-            
-            subprocess.run(cmd, cwd=build_dir, capture_output=True)
-            loading.destroy()
-            
-            pdf_path = os.path.join(build_dir, "main.pdf")
-            if os.path.exists(pdf_path):
-                if platform.system() == 'Windows': os.startfile(pdf_path)
-                elif platform.system() == 'Darwin': subprocess.call(('open', pdf_path))
-                else: subprocess.call(('xdg-open', pdf_path))
-            else:
-                messagebox.showerror("失败", "编译似乎成功但没生成 PDF")
-                
-        except Exception as e:
-            loading.destroy()
-            messagebox.showerror("系统错误", str(e))
+        except queue.Empty:
+            pass
+        self.root.after(100, self.poll_compile)
 
-    def show_error_log(self, log_content):
+    # ==========================================================
+    # 监视模式：轮询文件变化，防抖后只重新读取受影响的内容项并自动编译
+    # ==========================================================
+    def set_project_path(self, fp):
+        self.project_path = fp
+        # 自己保存的工程文件不应触发重新读取
+        if self.watcher: self.watcher.set_project(fp, self.content_items)
+
+    def toggle_watch(self):
+        if not self.watch_var.get():
+            self.watcher, self.watch_pending = None, False; return
+        # 与界面共用 loader，重新读取的文件在文件树与添加时也是最新内容
+        self.watcher = ProjectWatcher(self.base_dir, self.project_path, self.loader)
+        self.watcher.track(self.content_items)
+        self.root.after(int(POLL_INTERVAL * 1000), self.poll_watch, self.watcher)
+
+    def poll_watch(self, watcher):
+        # 关闭后 (或关闭又重新打开后) 旧的轮询链自行结束
+        if watcher is not self.watcher: return
+        batch = watcher.poll()
+        if batch:
+            try:
+                items, rebuild, reloaded = watcher.apply(self.content_items, batch)
+            except BuildError as e:
+                self.status_var.set(f"监视: {e}"); rebuild = False
+            else:
+                if items is not self.content_items:
+                    self.content_items = items
+                    self.content_changed()
+                if rebuild:
+                    self.status_var.set(f"监视: {len(batch)} 个文件变化，重新读取 {reloaded} 项")
+                    self.watch_compile()
+        self.root.after(int(POLL_INTERVAL * 1000), self.poll_watch, watcher)
+
+    def watch_compile(self):
+        """编译当前内容；正在进行的自动编译先取消，手动编译则等它结束后再编译"""
+        self.watch_pending = False
+        if not self.content_items: return
+        if self.compile_cancel:
+            self.watch_pending = True
+            if self.compile_auto: self.compile_cancel.cancel()
+            return
+        self.start_compile(list(self.content_items), dict(self.title_data), BuildStats(), auto=True)
+
+    def finish_auto_compile(self, msg):
+        """自动编译的结果只显示在状态栏；PDF 只在第一次成功时打开，之后由阅读器自行刷新"""
+        if msg[0] == "done":
+            if not self.watch_opened: open_file(msg[1]); self.watch_opened = True
+        elif msg[0] == "error":
+            first = next((i for i in msg[1].issues if i.level == ERROR), None)
+            self.status_var.set(f"自动编译失败: {first or msg[1]}")
+        elif msg[0] == "exception": self.status_var.set(f"自动编译出错: {msg[1]}")
+
+    def show_error_log(self, log_content, issues=()):
+        header = "LaTeX 编译出错。常见原因：\n1. 缺少字体 (Times New Roman, SimSun)\n2. 图片路径错误\n3. main.tex 里有冲突的 paracol\n"
+        header += "双击下方问题可跳转到对应内容项；其后是详细日志:" if issues else "以下是详细日志:"
+        self.show_log_window("编译失败 - 错误日志", header, log_content, issues=issues)
+
+    def show_log_window(self, title, header, log_content, see_end=True, issues=()):
         error_win = tk.Toplevel(self.root)
-        error_win.title("编译失败 - 错误日志")
+        error_win.title(title)
         error_win.geometry("800x600")
         
-        lbl = tk.Label(error_win, text="LaTeX 编译出错。常见原因：\n1. 缺少字体 (Times New Roman, SimSun)\n2. 图片路径错误\n3. main.tex 里有冲突的 paracol\n以下是详细日志:", 
-                       fg=S.DANGER, justify=tk.LEFT, padx=10, pady=10)
+        lbl = tk.Label(error_win, text=header, fg=S.DANGER, justify=tk.LEFT, padx=10, pady=10)
         lbl.pack(fill=tk.X)
+
+        # 解析出的错误/警告列表：双击跳转到内容项
+        if issues:
+            lb = tk.Listbox(error_win, height=min(len(issues), 8), font=('Consolas', 9), activestyle='none')
+            lb.pack(fill=tk.X, padx=10)
+            for issue in issues: lb.insert(tk.END, str(issue))
+            for k, issue in enumerate(issues):
+                if issue.level == ERROR: lb.itemconfig(k, fg=S.DANGER)
+            def jump(e):
+                sel = lb.curselection()
+                if sel and issues[sel[0]].item is not None: self.jump_to_item(issues[sel[0]].item)
+            lb.bind('<Double-Button-1>', jump)
         
         txt = scrolledtext.ScrolledText(error_win, font=('Consolas', 9))
         txt.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         txt.insert(tk.END, log_content)
-        txt.see(tk.END)
+        if see_end: txt.see(tk.END)
+
+    def jump_to_item(self, i):
+        if not 0 <= i < len(self.content_items): return
+        self.content_listbox.selection_clear()
+        self.content_listbox.selection_set(i)
+        self.content_listbox.see_row(i)
+        self.root.lift()
+
+    def check_content(self):
+        """检查整个 content/ 目录与当前工程，结果按 文件:行 列出"""
+        # 界面中串行检查：打包后的程序不便启动工作进程，内容目录也不大
+        issues = check_content_tree(self.content_dir, self.base_dir, jobs=1)
+        issues += check_items(self.content_items, self.base_dir, self.title_data)
+        if not issues: messagebox.showinfo("检查内容", "未发现问题"); return
+        errors = count_errors(issues)
+        self.show_log_window("检查内容", f"发现 {errors} 个错误，{len(issues) - errors} 个警告 (工程中的位置为第几项):",
+                             format_issues(issues), see_end=False)
 
 class CustomContentDialog:
     def __init__(self, parent, item=None):